@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Event, ScheduleItem, Material, Feedback, Profile, ControllerProfile, Registration
+from .models import (
+    Event, ScheduleItem, Material, Feedback, Profile, ControllerProfile, Registration,
+    CheckInEvent, ExportJob, OutboundEmail, Broadcast,
+)
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 
@@ -28,6 +31,8 @@ class MaterialAdmin(admin.ModelAdmin):
 @admin.register(Feedback)
 class FeedbackAdmin(admin.ModelAdmin):
     # list_display = ('id', 'registration_full_name', 'rating')
+    # колонки-методы ниже читают связи — одним JOIN вместо запроса на строку
+    list_select_related = ('registration', 'activity', 'event')
 
     def registration_full_name(self, obj):
         return obj.registration.full_name
@@ -67,4 +72,36 @@ class ControllerProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'event', 'is_active')
     list_filter = ('is_active',)
 
-admin.site.register(ControllerProfile, ControllerProfileAdmin)
\ No newline at end of file
+admin.site.register(ControllerProfile, ControllerProfileAdmin)
+
+
+@admin.register(CheckInEvent)
+class CheckInEventAdmin(admin.ModelAdmin):
+    list_display = ('scanned_at', 'event', 'registration', 'checked_in', 'changed', 'user', 'station')
+    list_filter = ('event', 'station', 'changed')
+    list_select_related = ('event', 'registration', 'user')
+    date_hierarchy = 'scanned_at'
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'event', 'kind', 'status', 'progress', 'created_by', 'finished_at')
+    list_filter = ('kind', 'status')
+    list_select_related = ('event', 'created_by')
+    readonly_fields = ('cache_key', 'params', 'error', 'started_at', 'finished_at')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('registration', 'attempts', 'last_error', 'sent_at')
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('send_at', 'event', 'subject', 'status', 'recipients', 'created_by')
+    list_filter = ('status',)
+    list_select_related = ('event', 'created_by')
+    search_fields = ('subject',)
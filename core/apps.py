@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        if settings.PERF_METRICS:
+            # до первого соединения с БД — иначе оно останется без замера SQL
+            from core import metrics
+            metrics.install()
+        if settings.NPLUSONE_THRESHOLD:
+            from core import queryshapes
+            queryshapes.install()
+        if settings.PROFILE_CAPTURE_LIMIT:
+            from core import profiling
+            profiling.install()
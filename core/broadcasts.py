@@ -0,0 +1,91 @@
+from datetime import timedelta
+from itertools import islice
+
+from babel.dates import format_datetime
+from django.conf import settings
+from django.db.models import Q
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Broadcast, OutboundEmail
+
+
+# участников на один SELECT / bulk_create: память не зависит от размера рассылки
+RECIPIENT_CHUNK = 2000
+# сколько рассылка может висеть в 'enqueueing', прежде чем её подхватит другой воркер
+ENQUEUE_LEASE = timedelta(minutes=10)
+
+
+def schedule_broadcast(event, subject, message, remind_before=None, user=None):
+    """
+    Создаёт рассылку: сразу (remind_before=None) или напоминание
+    за remind_before до начала мероприятия.
+    """
+    send_at = event.date - remind_before if remind_before else timezone.now()
+    return Broadcast.objects.create(
+        event=event, subject=subject, message=message,
+        remind_before=remind_before, send_at=send_at, created_by=user,
+    )
+
+
+def _recipient_emails(broadcast):
+    """Письма по одному на участника; участники читаются порциями."""
+    event = broadcast.event
+    template = get_template('emails/broadcast.txt')
+    base_url = settings.SITE_URL.rstrip('/')
+    event_date = format_datetime(timezone.localtime(event.date), "d MMMM y 'в' HH:mm", locale='ru')
+
+    rows = (event.registrations
+            .values_list('id', 'full_name', 'email', 'access_token')
+            .order_by('id')
+            .iterator(chunk_size=RECIPIENT_CHUNK))
+    for reg_id, full_name, email, access_token in rows:
+        access_link = base_url + reverse('access_event', kwargs={'access_token': access_token})
+        body = template.render({
+            'full_name': full_name,
+            'message': broadcast.message,
+            'event': event,
+            'event_date': event_date,
+            'access_link': access_link,
+        })
+        yield OutboundEmail(broadcast=broadcast, registration_id=reg_id, to_email=email,
+                            subject=broadcast.subject, body=body)
+
+
+def enqueue_broadcast(broadcast):
+    """
+    Раскладывает рассылку в outbox пачками по RECIPIENT_CHUNK.
+    Повторный вызов (после падения воркера) не дублирует письма —
+    их защищает уникальность (broadcast, registration).
+    Возвращает число получателей.
+    """
+    emails = _recipient_emails(broadcast)
+    recipients = 0
+    while chunk := list(islice(emails, RECIPIENT_CHUNK)):
+        OutboundEmail.objects.bulk_create(chunk, ignore_conflicts=True)
+        recipients += len(chunk)
+
+    Broadcast.objects.filter(id=broadcast.id).update(
+        status='queued', recipients=recipients, queued_at=timezone.now(),
+    )
+    return recipients
+
+
+def enqueue_due_broadcasts():
+    """
+    Ставит в outbox рассылки, время которых пришло. Захват — условный UPDATE,
+    как у ExportJob, поэтому несколько send_outbox не разошлют дважды.
+    Возвращает число обработанных рассылок.
+    """
+    now = timezone.now()
+    due = Broadcast.objects.filter(
+        Q(status='scheduled') | Q(status='enqueueing', started_at__lt=now - ENQUEUE_LEASE),
+        send_at__lte=now,
+    )
+    done = 0
+    for broadcast_id in list(due.order_by('send_at', 'id').values_list('id', flat=True)[:10]):
+        if due.filter(id=broadcast_id).update(status='enqueueing', started_at=now):
+            enqueue_broadcast(Broadcast.objects.select_related('event').get(id=broadcast_id))
+            done += 1
+    return done
@@ -0,0 +1,239 @@
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import EventStats, Registration, CheckInEvent
+
+
+# больше за один запрос сканер не шлёт; защищает от гигантских IN (...)
+MAX_BATCH_SIZE = 1000
+
+
+def _set_checked_in(event, to_check, to_uncheck):
+    """
+    Для каждого направления: SELECT ... FOR UPDATE строк, чьё состояние
+    ещё отличается от нужного, и UPDATE ... WHERE id IN (...) по ним,
+    плюс поправка счётчика EventStats (update() не вызывает сигналы).
+    Вызывается в транзакции. Возвращает (отмеченные ID, снятые ID) —
+    только строки, которые действительно изменились.
+    """
+    base = event.registrations.all()
+    changed = []
+    for ids, checked_in in ((to_check, True), (to_uncheck, False)):
+        if ids:
+            # строки, которые другой контролёр успел перевести сам, не трогаем
+            ids = list(base.select_for_update().filter(id__in=ids, checked_in=not checked_in)
+                       .values_list('id', flat=True).order_by())
+        if ids:
+            base.filter(id__in=ids).update(checked_in=checked_in)
+        changed.append(ids)
+
+    checked, unchecked = changed
+    if checked or unchecked:
+        EventStats.bump(event.id, checked_in=len(checked) - len(unchecked))
+    return checked, unchecked
+
+
+def _log_scan(event_id, registration_id, checked_in, changed, user, station):
+    """
+    Строка журнала CheckInEvent через INSERT ... SELECT из core_registration:
+    вставляется, только если участник есть в этом мероприятии. Заодно это
+    проверка существования — без отдельного SELECT. Возвращает True/False.
+    """
+    log, registrations = CheckInEvent._meta, Registration._meta
+    qn = connection.ops.quote_name
+    scanned_at = log.get_field('scanned_at').get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(log.db_table)} "
+            f"(event_id, registration_id, checked_in, changed, user_id, station, scanned_at) "
+            f"SELECT event_id, id, %s, %s, %s, %s, %s FROM {qn(registrations.db_table)} "
+            f"WHERE id = %s AND event_id = %s",
+            [checked_in, changed, user.pk if user else None, station[:64], scanned_at,
+             registration_id, event_id],
+        )
+        return cursor.rowcount == 1
+
+
+@transaction.atomic
+def set_checkin(event_id, registration_id, checked_in, user=None, station=''):
+    """
+    Ставит отметку одним условным UPDATE (семантика «установить»):
+    строка меняется, только если её состояние отличается от нужного,
+    поэтому два одновременных скана одного билета не гасят друг друга.
+    Каждый скан добавляет строку в журнал CheckInEvent.
+
+    Django не умеет UPDATE ... RETURNING, но он и не нужен: «изменилась ли
+    отметка» — число строк UPDATE, «есть ли участник» — число строк
+    INSERT ... SELECT в журнал. Повторный скан — два запроса, новый — ещё
+    поправка счётчика EventStats.
+
+    Возвращает True/False (изменилась ли отметка) или None, если участника
+    в этом мероприятии нет.
+    """
+    changed = bool(Registration.objects.filter(id=registration_id, event_id=event_id, checked_in=not checked_in)
+                   .update(checked_in=checked_in))
+    if not _log_scan(event_id, registration_id, checked_in, changed, user, station):
+        return None
+
+    if changed:
+        EventStats.bump(event_id, checked_in=1 if checked_in else -1)
+    return changed
+
+
+def checkin_throughput(event, since=None):
+    """Сканов в минуту: [{'minute', 'station', 'scans'}, ...] по журналу CheckInEvent."""
+    scans = CheckInEvent.objects.filter(event=event)
+    if since is not None:
+        scans = scans.filter(scanned_at__gte=since)
+    return list(
+        scans.annotate(minute=TruncMinute('scanned_at'))
+        .values('minute', 'station')
+        .annotate(scans=Count('id'))
+        .order_by('minute', 'station')
+    )
+
+
+@transaction.atomic
+def apply_roster(event, shown, checked_ids, user=None, station=''):
+    """
+    Сохраняет форму отметок контролёра.
+
+    shown       – {ID: отметка, какой её видел контролёр} для участников в форме;
+    checked_ids – ID, отмеченные в форме при отправке.
+
+    Меняются только строки, где контролёр сам изменил отметку относительно
+    показанной: отметку, которую другой контролёр поставил после загрузки
+    формы, отправка не затирает. Изменения — двумя UPDATE ... WHERE id IN (...),
+    каждая изменённая строка попадает в журнал CheckInEvent (один INSERT).
+
+    Возвращает число изменённых строк.
+    """
+    checked_ids = set(checked_ids)
+    to_check = [reg_id for reg_id, was in shown.items() if not was and reg_id in checked_ids]
+    to_uncheck = [reg_id for reg_id, was in shown.items() if was and reg_id not in checked_ids]
+
+    checked, unchecked = _set_checked_in(event, to_check, to_uncheck)
+
+    CheckInEvent.objects.bulk_create([
+        CheckInEvent(event=event, registration_id=reg_id, checked_in=checked_in,
+                     changed=True, user=user, station=station[:64])
+        for ids, checked_in in ((checked, True), (unchecked, False))
+        for reg_id in ids
+    ])
+    return len(checked) + len(unchecked)
+
+
+def _parse_batch_item(item):
+    """
+    {access_token | registration_id, checked_in, client_timestamp}
+    -> (registration_id, access_token, checked_in, client_timestamp) или None.
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('checked_in'), bool):
+        return None
+
+    reg_id = item.get('registration_id')
+    token = item.get('access_token')
+    if reg_id is not None:
+        if not isinstance(reg_id, int) or isinstance(reg_id, bool):
+            return None
+    elif token is not None:
+        try:
+            token = uuid.UUID(str(token))
+        except ValueError:
+            return None
+    else:
+        return None
+
+    timestamp = item.get('client_timestamp')
+    if timestamp is not None:
+        timestamp = parse_datetime(str(timestamp))
+        if timestamp is None:
+            return None
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+    return reg_id, token, item['checked_in'], timestamp
+
+
+@transaction.atomic
+def apply_checkin_batch(event, items, user=None, station=''):
+    """
+    Применяет очередь отметок со сканера (в т.ч. накопленную офлайн).
+
+    Семантика — «установить», а не «переключить», поэтому повторная отправка
+    той же очереди ничего не меняет. Если участник встречается в пакете
+    несколько раз, побеждает запись с самым поздним client_timestamp
+    (при равенстве — последняя по порядку).
+
+    Один SELECT для поиска участников, не больше двух UPDATE на пакет
+    (см. _set_checked_in) и один INSERT в журнал CheckInEvent на все сканы.
+    Возвращает (results, changed), где results — по элементу на каждую
+    запись пакета: {'index', 'status', 'registration_id', 'checked_in'};
+    status – updated / unchanged / superseded / not_found / invalid.
+    """
+    results = [{'index': i, 'status': 'invalid'} for i in range(len(items))]
+    parsed = {}
+    for i, item in enumerate(items):
+        entry = _parse_batch_item(item)
+        if entry is not None:
+            parsed[i] = entry
+
+    ids = {reg_id for reg_id, _, _, _ in parsed.values() if reg_id is not None}
+    tokens = {token for reg_id, token, _, _ in parsed.values() if reg_id is None}
+    by_id, by_token = {}, {}
+    if ids or tokens:
+        rows = (event.registrations.filter(Q(id__in=ids) | Q(access_token__in=tokens))
+                .values_list('id', 'access_token', 'checked_in').order_by())
+        for reg_id, token, checked_in in rows:
+            by_id[reg_id] = checked_in
+            by_token[token] = reg_id
+
+    # последняя по времени запись для каждого участника
+    winners = {}
+    for i, (reg_id, token, checked_in, timestamp) in parsed.items():
+        if reg_id is None:
+            reg_id = by_token.get(token)
+        if reg_id not in by_id:
+            results[i]['status'] = 'not_found'
+            continue
+        results[i]['registration_id'] = reg_id
+        results[i]['checked_in'] = checked_in
+        previous = winners.get(reg_id)
+        if previous is not None:
+            prev_ts = parsed[previous][3]
+            if timestamp is not None and prev_ts is not None and timestamp < prev_ts:
+                results[i]['status'] = 'superseded'
+                continue
+            results[previous]['status'] = 'superseded'
+        winners[reg_id] = i
+
+    to_check, to_uncheck = [], []
+    for reg_id, i in winners.items():
+        wanted = parsed[i][2]
+        if wanted != by_id[reg_id]:
+            (to_check if wanted else to_uncheck).append(reg_id)
+
+    checked, unchecked = _set_checked_in(event, to_check, to_uncheck)
+
+    # updated — только строки, которые UPDATE действительно изменил:
+    # отметку, поставленную параллельно после чтения, он пропускает
+    updated = {*checked, *unchecked}
+    for reg_id, i in winners.items():
+        results[i]['status'] = 'updated' if reg_id in updated else 'unchanged'
+
+    # в журнал — каждый скан, в т.ч. перекрытые в пакете (для пропускной способности)
+    now = timezone.now()
+    CheckInEvent.objects.bulk_create([
+        CheckInEvent(
+            event=event, registration_id=result['registration_id'], checked_in=parsed[i][2],
+            changed=result['status'] == 'updated', user=user,
+            station=station[:64], scanned_at=parsed[i][3] or now,
+        )
+        for i, result in enumerate(results)
+        if 'registration_id' in result
+    ])
+    return results, len(updated)
@@ -0,0 +1,88 @@
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
+
+from .models import Event, Registration, Feedback, CheckInEvent
+from .seats import promote_waitlist
+
+
+def _registration_match(event, email, idempotency_key):
+    # Lower(email) совпадает с выражением уникального индекса
+    registrations = Registration.objects.filter(event_id=event.id).alias(email_key=Lower('email'))
+    match = registrations.filter(email_key=email.lower())
+    if idempotency_key:
+        match = match | registrations.filter(idempotency_key=idempotency_key)
+    return match.order_by('id')
+
+
+def find_registration(event, email, idempotency_key=None):
+    """
+    Существующая регистрация на мероприятие с тем же e-mail (без учёта регистра)
+    или с тем же ключом идемпотентности; None, если её нет.
+    """
+    return _registration_match(event, email, idempotency_key).first()
+
+
+async def afind_registration(event, email, idempotency_key=None):
+    return await _registration_match(event, email, idempotency_key).afirst()
+
+
+def duplicate_registrations():
+    """
+    Повторные регистрации одним запросом: только строки, у которых есть
+    «двойник» (то же мероприятие и e-mail), упорядоченные по группам.
+    """
+    twins = (Registration.objects.alias(email_key=Lower('email'))
+             .filter(event_id=OuterRef('event_id'), email_key=OuterRef('email_key'))
+             .exclude(id=OuterRef('id')))
+    return (Registration.objects.alias(email_key=Lower('email'))
+            .filter(Exists(twins))
+            .annotate(group_key=Lower('email'))
+            .order_by('event_id', 'group_key', 'waitlisted', 'created_at', 'id'))
+
+
+def _merge_group(keep, duplicates):
+    """
+    Сливает duplicates в keep: отзывы и журнал отметок переходят к keep,
+    отметка о приходе и примечания объединяются, дубли удаляются
+    (счётчики и места поправят сигналы post_delete).
+    """
+    ids = [reg.id for reg in duplicates]
+    Feedback.objects.filter(registration_id__in=ids).update(registration=keep)
+    CheckInEvent.objects.filter(registration_id__in=ids).update(registration=keep)
+
+    notes = [keep.note] + [reg.note for reg in duplicates if reg.note and reg.note != keep.note]
+    keep.note = '; '.join(filter(None, notes))[:255]
+    keep.checked_in = keep.checked_in or any(reg.checked_in for reg in duplicates)
+    keep.save(update_fields=['note', 'checked_in'])
+
+    for reg in duplicates:
+        reg.delete()
+
+
+def merge_duplicates(dry_run=False):
+    """
+    Находит и сливает повторные регистрации. В группе остаётся
+    подтверждённая (не из листа ожидания) и самая ранняя.
+    Возвращает (групп, удалено регистраций).
+    """
+    groups = removed = 0
+    touched_events = set()
+    # читаются только строки-дубли; список целиком, т.к. ниже в ту же таблицу пишем
+    rows = list(duplicate_registrations())
+    for (event_id, _), group in groupby(rows, key=lambda reg: (reg.event_id, reg.group_key)):
+        keep, *duplicates = group
+        groups += 1
+        removed += len(duplicates)
+        if dry_run:
+            continue
+        with transaction.atomic():
+            _merge_group(keep, duplicates)
+        touched_events.add(event_id)
+
+    # удалённые дубли могли освободить места
+    for event in Event.objects.filter(id__in=touched_events):
+        promote_waitlist(event)
+    return groups, removed
@@ -0,0 +1,143 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# сжатый файл отдаётся как есть, своим типом: с Content-Encoding браузер
+# распаковал бы его при сохранении, а Range не совпадали бы с байтами на диске
+_COMPRESSED_TYPES = {
+    'bzip2': 'application/x-bzip',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+    'br': 'application/x-brotli',
+    'compress': 'application/x-compress',
+}
+
+
+def _content_headers(response, path, filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding:
+        content_type = _COMPRESSED_TYPES.get(encoding, 'application/octet-stream')
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    # ответ зависит от прав доступа — не для общих кэшей
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def _x_accel_redirect(field, filename):
+    # nginx: location PROTECTED_MEDIA_INTERNAL_URL { internal; alias MEDIA_ROOT/; }
+    response = HttpResponse()
+    response['X-Accel-Redirect'] = settings.PROTECTED_MEDIA_INTERNAL_URL + quote(field.name)
+    return _content_headers(response, field.name, filename)
+
+
+def _x_sendfile(field, filename):
+    # Apache mod_xsendfile / lighttpd: абсолютный путь на диске
+    response = HttpResponse()
+    response['X-Sendfile'] = field.path
+    return _content_headers(response, field.name, filename)
+
+
+def _byte_range(request, size, etag):
+    """
+    (start, end) из заголовка Range, None — отдать файл целиком,
+    'unsatisfiable' — диапазон за пределами файла (416).
+    Поддерживается один диапазон: на несколько отвечаем целым файлом, как разрешает RFC 9110.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None  # файл изменился с момента первой части — отдаём заново
+    match = _RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-N — последние N байт
+        if int(last) == 0:
+            return 'unsatisfiable'
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(path, start, length, block_size=FileResponse.block_size):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _django_response(request, field, filename):
+    # для разработки и установок без фронт-сервера
+    try:
+        stat = os.stat(field.path)
+    except FileNotFoundError:
+        raise Http404
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    # целые секунды — как в заголовке; с дробной частью If-Modified-Since не совпал бы никогда
+    mtime = int(stat.st_mtime)
+    last_modified = http_date(mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        byte_range = _byte_range(request, stat.st_size, etag)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+        elif byte_range is None:
+            response = FileResponse(open(field.path, 'rb'))
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(field.path, start, end - start + 1), status=206)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+        _content_headers(response, field.path, filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+BACKENDS = {
+    'x-accel-redirect': _x_accel_redirect,
+    'x-sendfile': _x_sendfile,
+}
+
+
+def serve_protected(request, field, filename=None):
+    """
+    Ответ с файлом FileField после проверки прав в представлении.
+
+    PROTECTED_MEDIA_SERVER = 'x-accel-redirect' / 'x-sendfile' — передачу
+    (с Range, ETag и sendfile) выполняет фронт-сервер, процесс Django
+    свободен сразу; '' — Django отдаёт файл сам, с Range, ETag и If-None-Match.
+    """
+    if not field:
+        raise Http404
+    filename = filename or os.path.basename(field.name)
+    server = settings.PROTECTED_MEDIA_SERVER
+    if not server:
+        return _django_response(request, field, filename)
+    if server not in BACKENDS:
+        raise ImproperlyConfigured(f"PROTECTED_MEDIA_SERVER: неизвестное значение {server!r}")
+    return BACKENDS[server](field, filename)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from core.exports import participants_xlsx_file, stats_pdf_bytes
+from core.models import ExportJob, EventStats
+from core.search import filter_participants
+
+
+logger = logging.getLogger(__name__)
+
+# job в 'running' дольше этого — воркер считается упавшим (см. fail_stale_jobs)
+RUNNING_TIMEOUT = timedelta(minutes=30)
+# сколько хранить готовые и упавшие выгрузки (см. cleanup_exports)
+KEEP_FINISHED = timedelta(days=1)
+
+# параметры, влияющие на содержимое выгрузки (остальные из GET игнорируем)
+EXPORT_PARAMS = {
+    'participants_xlsx': ('search', 'checked_in', 'note_contains'),
+    'stats_pdf': (),
+}
+
+
+def export_cache_key(event, kind, params):
+    """
+    Ключ готового файла: вид выгрузки, фильтры, версия мероприятия
+    (расписание/материалы) и data_version (участники, отметки, отзывы).
+    """
+    data_version = (EventStats.objects.filter(event=event)
+                    .values_list('data_version', flat=True).first()) or 0
+    payload = json.dumps([kind, event.id, event.version, data_version, params], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def request_export(event, kind, query, user=None):
+    """
+    Ставит выгрузку в очередь или возвращает уже существующую:
+    готовую (файл на месте) или ещё строящуюся с тем же ключом.
+    """
+    params = {name: query.get(name, '') for name in EXPORT_PARAMS[kind]}
+    key = export_cache_key(event, kind, params)
+
+    job = ExportJob.objects.exclude(status='failed').filter(cache_key=key).first()
+    if job and job.status == 'done' and not job.file.storage.exists(job.file.name):
+        # файл удалили с диска — собираем заново
+        ExportJob.objects.filter(id=job.id).update(status='failed', error='Файл не найден')
+        job = None
+    if job and job.status == 'running' and job.started_at < timezone.now() - RUNNING_TIMEOUT:
+        fail_stale_jobs()
+        job = None
+    if job:
+        return job
+
+    try:
+        with transaction.atomic():
+            return ExportJob.objects.create(event=event, kind=kind, params=params,
+                                            cache_key=key, created_by=user)
+    except IntegrityError:
+        # параллельный запрос успел создать job с тем же ключом
+        return ExportJob.objects.exclude(status='failed').get(cache_key=key)
+
+
+def claim_next_job():
+    """
+    Забирает самый старый pending-job. Захват — условный UPDATE,
+    поэтому несколько воркеров не возьмут один и тот же job.
+    """
+    candidates = (ExportJob.objects.filter(status='pending')
+                  .order_by('created_at', 'id').values_list('id', flat=True)[:10])
+    for job_id in candidates:
+        claimed = ExportJob.objects.filter(id=job_id, status='pending').update(
+            status='running', started_at=timezone.now(), progress=0,
+        )
+        if claimed:
+            return ExportJob.objects.select_related('event').get(id=job_id)
+    return None
+
+
+def fail_stale_jobs():
+    """
+    Job, который воркер держит в 'running' дольше RUNNING_TIMEOUT, — воркер
+    упал: помечаем failed, и cache_key освобождается для новой выгрузки.
+    Если воркер всё же жив, run_job его результат не сохранит.
+    """
+    return ExportJob.objects.filter(status='running', started_at__lt=timezone.now() - RUNNING_TIMEOUT).update(
+        status='failed', error='Воркер не завершил выгрузку', finished_at=timezone.now(),
+    )
+
+
+def _delete_jobs(jobs):
+    for job in jobs:
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+    return len(jobs)
+
+
+def cleanup_exports(keep=KEEP_FINISHED):
+    """
+    Удаляет файлы и записи выгрузок: завершённых раньше keep и готовых,
+    для которых есть более новый файл с теми же параметрами (данные
+    изменились — старый уже не отдаётся). Возвращает число удалённых.
+    """
+    finished = ExportJob.objects.filter(status__in=('done', 'failed'))
+    removed = _delete_jobs(list(finished.filter(finished_at__lt=timezone.now() - keep)))
+
+    latest, superseded = set(), []
+    for job in finished.filter(status='done').order_by('-finished_at', '-id'):
+        variant = (job.event_id, job.kind, json.dumps(job.params, sort_keys=True))
+        if variant in latest:
+            superseded.append(job)
+        latest.add(variant)
+    return removed + _delete_jobs(superseded)
+
+
+def _set_progress(job, percent):
+    ExportJob.objects.filter(id=job.id).update(progress=min(int(percent), 99))
+
+
+def _file_name(ext):
+    # случайное имя: в файле ПДн участников, а cache_key вычисляется из предсказуемых данных
+    return f"{uuid.uuid4().hex}.{ext}"
+
+
+def _build_participants_xlsx(job):
+    registrations, _, _, _ = filter_participants(job.event.registrations.all(), job.params)
+    total = registrations.count() or 1
+    with participants_xlsx_file(registrations,
+                                on_chunk=lambda n: _set_progress(job, n * 100 / total)) as spool:
+        job.file.save(_file_name('xlsx'), File(spool), save=False)
+
+
+def _build_stats_pdf(job):
+    job.file.save(_file_name('pdf'), ContentFile(stats_pdf_bytes(job.event)), save=False)
+
+
+BUILDERS = {
+    'participants_xlsx': _build_participants_xlsx,
+    'stats_pdf': _build_stats_pdf,
+}
+
+
+def run_job(job):
+    try:
+        BUILDERS[job.kind](job)
+    except Exception as exc:
+        logger.exception("Export job %s failed", job.id)
+        job.status, job.error = 'failed', str(exc)
+    else:
+        job.status, job.progress = 'done', 100
+    job.finished_at = timezone.now()
+    saved = ExportJob.objects.filter(id=job.id, status='running').update(
+        status=job.status, progress=job.progress, error=job.error, file=job.file.name,
+        finished_at=job.finished_at,
+    )
+    if not saved:
+        # пока собирали, job признан зависшим (fail_stale_jobs) — ключ уже у новой выгрузки
+        if job.file:
+            job.file.delete(save=False)
+        job.refresh_from_db()
+    return job
+
+
+def job_status(job):
+    """JSON-ответ для опроса статуса из интерфейса организатора."""
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'status_url': reverse('export_status', args=[job.id]),
+    }
+    if job.status == 'done':
+        data['download_url'] = reverse('export_download', args=[job.id])
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return data
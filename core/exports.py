@@ -0,0 +1,58 @@
+import tempfile
+
+import openpyxl
+from django.template.loader import render_to_string
+
+from core.pdf import render_pdf
+from core.stats import get_event_stats
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+PARTICIPANT_HEADER = ['ФИО', 'Email', 'Телефон', 'Посетил', 'Примечание']
+
+# до этого размера готовый файл держим в памяти, дальше — на диске
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 2000
+
+
+def participant_rows(registrations, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """
+    Строки выгрузки из queryset участников: только нужные колонки, порциями.
+    on_chunk(n) вызывается после каждых chunk_size строк (прогресс фоновой выгрузки).
+    """
+    rows = (registrations
+            .values_list('full_name', 'email', 'phone', 'checked_in', 'note')
+            .order_by('created_at', 'id')
+            .iterator(chunk_size=chunk_size))
+    for n, (full_name, email, phone, checked_in, note) in enumerate(rows, 1):
+        yield [full_name, email, phone, 'Да' if checked_in else 'Нет', note]
+        if on_chunk and n % chunk_size == 0:
+            on_chunk(n)
+
+
+def write_participants_xlsx(rows, target):
+    """
+    Пишет xlsx в режиме write_only: openpyxl сбрасывает строки листа
+    во временный файл, поэтому память не растёт с числом участников.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Участники")
+    ws.append(PARTICIPANT_HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(target)
+
+
+def participants_xlsx_file(registrations, on_chunk=None):
+    """Готовый xlsx во временном файле (перемотан в начало) — для FileResponse."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    write_participants_xlsx(participant_rows(registrations, on_chunk=on_chunk), spool)
+    spool.seek(0)
+    return spool
+
+
+def stats_pdf_bytes(event):
+    """PDF статистики мероприятия (шаблон event_stats_pdf.html)."""
+    html_string = render_to_string('event_stats_pdf.html', get_event_stats(event))
+    return render_pdf(html_string, 'css/event_stats_pdf.css')
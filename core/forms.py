@@ -4,6 +4,7 @@ from django.contrib.auth.models import User
 from .models import Event, ScheduleItem, Material, Feedback, Registration, Profile
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.utils import timezone
+from datetime import timedelta
 
 
 # форматы, которые понимают <input type="datetime-local"> и <input type="time">
@@ -40,11 +41,13 @@ class EventForm(forms.ModelForm):
     class Meta:
         model  = Event
         fields = ['title', 'description', 'date', 'end_date',
-                  'location', 'registration_deadline']
+                  'location', 'registration_deadline', 'capacity']
         widgets = {
             'title'      : forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'location'   : forms.TextInput(attrs={'class': 'form-control'}),
+            'capacity'   : forms.NumberInput(attrs={'class': 'form-control', 'min': 1,
+                                                    'placeholder': 'без ограничения'}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -124,6 +127,56 @@ class PublicRegistrationForm(forms.ModelForm):
         }
 
 
+class BroadcastForm(forms.Form):
+    # когда отправить: сразу или за N до начала мероприятия
+    WHEN_CHOICES = (
+        ('now', 'Сейчас'),
+        ('1h', 'За 1 час до начала'),
+        ('1d', 'За 1 день до начала'),
+        ('7d', 'За неделю до начала'),
+    )
+    REMIND_BEFORE = {
+        'now': None,
+        '1h': timedelta(hours=1),
+        '1d': timedelta(days=1),
+        '7d': timedelta(days=7),
+    }
+
+    subject = forms.CharField(label='Тема', max_length=255,
+                              widget=forms.TextInput(attrs={'class': 'form-control'}))
+    message = forms.CharField(label='Текст письма',
+                              widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 6}))
+    when = forms.ChoiceField(label='Когда отправить', choices=WHEN_CHOICES, initial='now',
+                             widget=forms.Select(attrs={'class': 'form-select'}))
+
+    def __init__(self, *args, event=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.event = event
+
+    def clean_when(self):
+        when = self.cleaned_data['when']
+        if when != 'now' and self.event.date <= timezone.now():
+            raise forms.ValidationError("Мероприятие уже началось — напоминание не нужно.")
+        return when
+
+    @property
+    def remind_before(self):
+        return self.REMIND_BEFORE[self.cleaned_data['when']]
+
+
+class ImportRegistrationsForm(forms.Form):
+    file = forms.FileField(
+        label='Файл CSV или XLSX',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Поддерживаются только файлы .csv и .xlsx.")
+        return file
+
+
 class StyledLoginForm(AuthenticationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
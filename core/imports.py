@@ -0,0 +1,178 @@
+import csv
+import io
+from itertools import islice
+
+import openpyxl
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+from .forms import PublicRegistrationForm
+from .models import Event, EventStats, Registration
+from .search import phone_digits
+
+
+BATCH_SIZE = 1000
+# в отчёте храним не больше стольких ошибок (считаем — все)
+MAX_REPORTED_ERRORS = 1000
+# попыток вставить пачку, если параллельные регистрации занимают её e-mail
+BATCH_ATTEMPTS = 5
+
+# заголовок файла -> поле регистрации; подходит и наша выгрузка участников
+COLUMN_ALIASES = {
+    'фио': 'full_name', 'имя': 'full_name', 'full_name': 'full_name', 'name': 'full_name',
+    'email': 'email', 'e-mail': 'email', 'почта': 'email',
+    'телефон': 'phone', 'phone': 'phone',
+    'примечание': 'note', 'note': 'note',
+}
+
+# правила полей — те же, что у публичной формы регистрации
+FIELDS = {
+    **{name: PublicRegistrationForm.base_fields[name] for name in ('full_name', 'email', 'phone')},
+    'note': forms.CharField(max_length=255, required=False),
+}
+
+
+def _csv_rows(file):
+    # UploadedFile -> сырой бинарный файл; текст декодируется потоково
+    text = io.TextIOWrapper(getattr(file, 'file', file), encoding='utf-8-sig', newline='')
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(text, dialect)
+    finally:
+        text.detach()  # файл закрывает владелец
+
+
+def _xlsx_rows(file):
+    # read_only: строки листа читаются из zip по мере обхода, а не целиком
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_rows(file, filename):
+    """
+    Строки файла (CSV или XLSX) как dict поле -> значение, по одной.
+    Первая строка — заголовок; неизвестные колонки пропускаются.
+    Возвращает итератор пар (номер строки в файле, dict).
+    """
+    rows = _xlsx_rows(file) if filename.lower().endswith('.xlsx') else _csv_rows(file)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [COLUMN_ALIASES.get(str(h or '').strip().lower()) for h in header]
+    if 'email' not in columns:
+        raise ValidationError("В файле нет колонки e-mail (Email, E-mail или Почта).")
+
+    for line, values in enumerate(rows, 2):
+        if not any(v not in (None, '') for v in values):
+            continue  # пустая строка
+        yield line, {field: value for field, value in zip(columns, values) if field}
+
+
+def clean_row(values):
+    """dict из файла -> (cleaned, None) или (None, {поле: [ошибки]})."""
+    cleaned, errors = {}, {}
+    for name, field in FIELDS.items():
+        value = values.get(name)
+        value = '' if value is None else str(value).strip()
+        try:
+            cleaned[name] = field.clean(value)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    return (None, errors) if errors else (cleaned, None)
+
+
+def _existing_emails(event, emails):
+    return set(
+        event.registrations.annotate(email_key=Lower('email'))
+        .filter(email_key__in=emails).values_list('email_key', flat=True)
+    )
+
+
+def _insert_batch(event, batch):
+    """
+    Вставляет пачку [(line, cleaned)] одним bulk_create. Уже
+    зарегистрированные e-mail пропускаются (один SELECT на пачку).
+    bulk_create мимо save() и сигналов, поэтому phone_digits, места
+    и счётчики EventStats заполняются здесь. Возвращает (создано, в листе ожидания, дублей).
+    """
+    existing = _existing_emails(event, {cleaned['email'].lower() for _, cleaned in batch})
+    fresh, seen = [], set()
+    for _, cleaned in batch:
+        key = cleaned['email'].lower()
+        if key in existing or key in seen:
+            continue
+        seen.add(key)
+        fresh.append(cleaned)
+
+    if not fresh:
+        return 0, 0, len(batch)
+
+    with transaction.atomic():
+        seats = Event.reserve_seats(event.id, len(fresh))
+        Registration.objects.bulk_create([
+            Registration(event=event, phone_digits=phone_digits(cleaned['phone']),
+                         waitlisted=i >= seats, **cleaned)
+            for i, cleaned in enumerate(fresh)
+        ])
+        EventStats.bump(event.id, registrations=len(fresh))
+    return len(fresh), len(fresh) - seats, len(batch) - len(fresh)
+
+
+def import_registrations(event, file, filename, batch_size=BATCH_SIZE):
+    """
+    Потоковый импорт участников из CSV/XLSX: строки проверяются правилами
+    PublicRegistrationForm и вставляются пачками по batch_size, e-mail,
+    уже зарегистрированные на мероприятие (или повторённые в файле),
+    пропускаются. В памяти — только текущая пачка.
+
+    Если пачку раз за разом перебивают параллельные регистрации, после
+    BATCH_ATTEMPTS попыток её строки попадают в ошибки, импорт идёт дальше.
+
+    Возвращает отчёт: total, created, waitlisted, duplicates, invalid
+    и errors — [{'line', 'errors': {поле: [сообщения]}}, ...]
+    (не больше MAX_REPORTED_ERRORS).
+    """
+    report = {'total': 0, 'created': 0, 'waitlisted': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+
+    def add_error(line, errors):
+        report['invalid'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'errors': errors})
+
+    def valid_rows():
+        for line, values in read_rows(file, filename):
+            report['total'] += 1
+            cleaned, errors = clean_row(values)
+            if errors:
+                add_error(line, errors)
+                continue
+            yield line, cleaned
+
+    rows = valid_rows()
+    while batch := list(islice(rows, batch_size)):
+        for _ in range(BATCH_ATTEMPTS):
+            try:
+                created, waitlisted, duplicates = _insert_batch(event, batch)
+                break
+            except IntegrityError:
+                # параллельная регистрация успела занять e-mail — пересчитываем дубли
+                continue
+        else:
+            for line, _ in batch:
+                add_error(line, {'email': ["Не сохранено: e-mail одновременно регистрировали ещё раз, "
+                                           "повторите импорт."]})
+            continue
+        report['created'] += created
+        report['waitlisted'] += waitlisted
+        report['duplicates'] += duplicates
+    return report
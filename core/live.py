@@ -0,0 +1,194 @@
+import asyncio
+import contextvars
+import json
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, connection
+from django.utils.timezone import localtime
+
+from .models import CheckInEvent, EventStats
+
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0    # сек между опросами EventStats (один продюсер на мероприятие)
+HEARTBEAT = 15         # сек без событий -> комментарий в поток, чтобы прокси не закрыл соединение
+RECENT_ARRIVALS = 10   # сколько последних пришедших показывать на экране
+QUEUE_SIZE = 32        # очередь подписчика; медленный клиент теряет старые сообщения
+
+
+def _read_counters(event_id):
+    return EventStats.objects.filter(event_id=event_id).values(
+        'registrations', 'checked_in', 'data_version'
+    ).first() or {'registrations': 0, 'checked_in': 0, 'data_version': 0}
+
+
+def _read_arrivals(event_id, after_id):
+    """Новые входы из журнала CheckInEvent (свежие первыми, не больше RECENT_ARRIVALS)."""
+    scans = CheckInEvent.objects.filter(event_id=event_id, checked_in=True, changed=True)
+    if after_id:
+        scans = scans.filter(id__gt=after_id)
+    rows = scans.order_by('-id').values(
+        'id', 'registration_id', 'registration__full_name', 'station', 'scanned_at'
+    )[:RECENT_ARRIVALS]
+    return [{
+        'id': row['id'],
+        'registration_id': row['registration_id'],
+        'name': row['registration__full_name'],
+        'station': row['station'],
+        'at': localtime(row['scanned_at']).strftime('%H:%M:%S'),
+    } for row in rows]
+
+
+def _poll(event_id, data_version, after_id):
+    """
+    Один тик продюсера: счётчики — всегда (один SELECT по первичному ключу),
+    журнал — только если data_version сдвинулась (EventStats.bump).
+    """
+    try:
+        counters = _read_counters(event_id)
+        arrivals = []
+        if counters['data_version'] != data_version:
+            arrivals = _read_arrivals(event_id, after_id)
+        return counters, arrivals
+    except DatabaseError:
+        # продюсер живёт дольше запроса: не держим сломанное соединение
+        connection.close()
+        raise
+
+
+class _Channel:
+    """Подписчики одного мероприятия и последнее известное состояние."""
+
+    def __init__(self):
+        self.queues = set()
+        self.task = None
+        self.counters = None
+        self.recent = deque(maxlen=RECENT_ARRIVALS)
+        self.last_id = 0
+
+    def snapshot(self):
+        return {
+            'type': 'snapshot',
+            'registrations': self.counters['registrations'],
+            'checked_in': self.counters['checked_in'],
+            'delta': 0,
+            'arrivals': list(self.recent),
+        }
+
+
+class CheckinHub:
+    """
+    Рассылка отметок входа в открытые дашборды (организатор, контролёры).
+
+    На каждое мероприятие в процессе — один продюсер (asyncio-задача),
+    который раз в interval читает EventStats и при изменениях — свежие
+    входы из журнала, и раскладывает сообщение по очередям подписчиков.
+    50 открытых экранов — один опрос БД в секунду, а не 50. Продюсер
+    запускается с первым подписчиком и останавливается с последним.
+
+    Сообщения: {'type': 'snapshot' | 'update', 'registrations', 'checked_in',
+    'delta', 'arrivals': [{'id', 'registration_id', 'name', 'station', 'at'}]}.
+    Счётчики абсолютные, поэтому потерянное сообщение исправит следующее.
+    """
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self._channels = {}  # event_id -> _Channel
+
+    def subscribe(self, event_id):
+        channel = self._channels.setdefault(event_id, _Channel())
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        channel.queues.add(queue)
+        if channel.counters is not None:
+            queue.put_nowait(channel.snapshot())
+
+        loop = asyncio.get_running_loop()
+        if channel.task is None or channel.task.done() or channel.task.get_loop() is not loop:
+            # пустой контекст: задача переживает запрос, открывший её,
+            # и не должна ходить в БД через его поток (см. sync_to_async)
+            channel.task = loop.create_task(self._produce(event_id, channel),
+                                            context=contextvars.Context())
+        return queue
+
+    def unsubscribe(self, event_id, queue):
+        channel = self._channels.get(event_id)
+        if channel is None:
+            return
+        channel.queues.discard(queue)
+        if not channel.queues:
+            del self._channels[event_id]
+            if channel.task is not None:
+                channel.task.cancel()
+
+    def producers(self):
+        """Число работающих продюсеров (для тестов и отладки)."""
+        return sum(1 for channel in self._channels.values()
+                   if channel.task is not None and not channel.task.done())
+
+    def _publish(self, channel, message):
+        for queue in channel.queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def _apply(self, channel, counters, arrivals):
+        previous, channel.counters = channel.counters, counters
+        if arrivals:
+            channel.last_id = arrivals[0]['id']
+            channel.recent.extendleft(reversed(arrivals))
+
+        if previous is None:
+            self._publish(channel, channel.snapshot())
+            return
+        delta = counters['checked_in'] - previous['checked_in']
+        if delta or arrivals or counters['registrations'] != previous['registrations']:
+            self._publish(channel, {
+                'type': 'update',
+                'registrations': counters['registrations'],
+                'checked_in': counters['checked_in'],
+                'delta': delta,
+                'arrivals': arrivals,
+            })
+
+    async def _produce(self, event_id, channel):
+        poll = sync_to_async(_poll)
+        while True:
+            version = channel.counters['data_version'] if channel.counters else None
+            try:
+                counters, arrivals = await poll(event_id, version, channel.last_id)
+            except Exception:
+                logger.exception("Live check-in poll failed for event %s", event_id)
+            else:
+                self._apply(channel, counters, arrivals)
+            await asyncio.sleep(self.interval)
+
+
+hub = CheckinHub()
+
+
+def format_sse(message, event='checkin'):
+    data = json.dumps(message, ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def event_stream(event_id, hub=hub, heartbeat=HEARTBEAT):
+    """
+    Поток text/event-stream для одного экрана: снимок, затем изменения.
+    При закрытии вкладки ASGI-обработчик отменяет генератор —
+    подписка снимается в finally.
+    """
+    queue = hub.subscribe(event_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield format_sse(message)
+    finally:
+        hub.unsubscribe(event_id, queue)
@@ -0,0 +1,61 @@
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand
+
+
+def _synthetic_rows(count):
+    for i in range(count):
+        yield [f"Участник {i}", f"user{i}@example.com", f"+7 999 {i:07d}",
+               'Да' if i % 3 else 'Нет', 'VIP' if i % 10 == 0 else '']
+
+
+def _measure(count, queue):
+    # отдельный процесс на замер: ru_maxrss — пик за всю жизнь процесса
+    django.setup()
+    from core.exports import write_participants_xlsx
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as target:
+        write_participants_xlsx(_synthetic_rows(count), target)
+        size = target.tell()
+    queue.put({
+        'rows': count,
+        'seconds': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'rss_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024, 1),
+        'file_mb': round(size / 1024 / 1024, 2),
+    })
+
+
+class Command(BaseCommand):
+    help = "Замер выгрузки участников в xlsx: пиковая память (RSS) и время"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--json', dest='json_path', help="сохранить результаты в JSON-файл")
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+        results = []
+        for count in options['rows']:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(count, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            results.append(result)
+            self.stdout.write(
+                f"{result['rows']:>8} строк: {result['seconds']:>7} с, "
+                f"пик RSS {result['peak_rss_mb']} МБ (+{result['rss_growth_mb']}), "
+                f"файл {result['file_mb']} МБ"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
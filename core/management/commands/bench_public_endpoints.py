@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+import uuid
+from itertools import count
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Event, ScheduleItem
+
+
+SCENARIOS = ('access', 'register', 'feedback')
+
+
+class _Client:
+    """Keep-alive HTTP/1.1 соединение одного виртуального клиента (только stdlib)."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+        self.cookies = {}
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, form=None, headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = urlencode(form).encode() if form else b''
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive",
+                 f"Content-Length: {len(body)}"]
+        if form:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length, chunked, close = 0, False, False
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding':
+                chunked = 'chunked' in value.lower()
+            elif name == 'connection':
+                close = value.lower() == 'close'
+            elif name == 'set-cookie':
+                key, _, rest = value.partition('=')
+                self.cookies[key] = rest.split(';', 1)[0]
+
+        if chunked:
+            while size := int((await self.reader.readline()).strip(), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        elif length:
+            await self.reader.readexactly(length)
+        if close:
+            await self.close()
+        return status
+
+
+def _percentile(values, share):
+    return values[min(len(values) - 1, int(share * len(values)))] if values else 0.0
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный замер публичных страниц (регистрация, доступ по токену, отзыв об активности) "
+            "на запущенном сервере: запросов в секунду и p50/p99 задержки при N одновременных клиентах")
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int, help="мероприятие с участниками (и завершённой активностью для feedback)")
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="адрес сервера")
+        parser.add_argument('--clients', type=int, default=500, help="одновременных клиентов")
+        parser.add_argument('--requests', type=int, default=5000, help="запросов на сценарий")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--label', default='', help="подпись прогона (например, sync / async)")
+        parser.add_argument('--json', dest='json_path', help="сохранить результаты в JSON-файл")
+        parser.add_argument('--compare', help="JSON предыдущего прогона: вывести изменение")
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(id=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Мероприятие {options['event_id']} не найдено")
+        tokens = [str(t) for t in event.registrations.values_list('access_token', flat=True)[:1000]]
+        if not tokens:
+            raise CommandError("У мероприятия нет участников")
+        activity = (ScheduleItem.objects.filter(event=event, end_time__lt=timezone.now())
+                    .values_list('id', flat=True).first())
+
+        scenarios = options['scenarios']
+        if 'feedback' in scenarios and activity is None:
+            self.stderr.write("Нет завершённой активности — сценарий feedback пропущен")
+            scenarios = [name for name in scenarios if name != 'feedback']
+
+        url = urlsplit(options['url'])
+        targets = {'event': event.id, 'tokens': tokens, 'activity': activity,
+                   'host': url.hostname, 'port': url.port or 80}
+        results = [
+            asyncio.run(self._run(name, targets, options['clients'], options['requests']))
+            for name in scenarios
+        ]
+        for result in results:
+            result['label'] = options['label']
+            self.stdout.write(
+                f"{result['scenario']:>9}: {result['rps']:>8} запр/с, p50 {result['p50_ms']} мс, "
+                f"p99 {result['p99_ms']} мс, ошибок {result['errors']} из {result['requests']}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                previous = {r['scenario']: r for r in json.load(fh)}
+            for result in results:
+                before = previous.get(result['scenario'])
+                if before:
+                    self.stdout.write(
+                        f"{result['scenario']:>9}: запр/с ×{result['rps'] / max(before['rps'], 0.001):.2f}, "
+                        f"p99 {before['p99_ms']} -> {result['p99_ms']} мс"
+                        f" ({before.get('label') or 'до'} -> {result['label'] or 'после'})"
+                    )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+    async def _run(self, scenario, targets, clients, total):
+        register_path = reverse('public_register', args=[targets['event']])
+        numbers = count()
+        latencies, errors = [], 0
+
+        def next_request(n):
+            token = targets['tokens'][n % len(targets['tokens'])]
+            if scenario == 'access':
+                return 'GET', reverse('access_event', args=[token]), None, 200
+            if scenario == 'register':
+                return 'POST', register_path, {
+                    'full_name': f"Нагрузка {n}", 'email': f"bench-{uuid.uuid4().hex}@example.com",
+                    'phone': f"+7 900 {n:07d}", 'idempotency_key': uuid.uuid4().hex,
+                }, 302
+            return 'POST', reverse('leave_activity_feedback_api', args=[token, targets['activity']]), {
+                'rating': str(n % 5 + 1), 'text': 'Нагрузочный отзыв',
+            }, 200
+
+        async def worker():
+            nonlocal errors
+            client = _Client(targets['host'], targets['port'])
+            try:
+                # csrftoken для POST: кука со страницы регистрации
+                await client.request('GET', register_path)
+                while (n := next(numbers)) < total:
+                    method, path, form, expected = next_request(n)
+                    headers = {'X-CSRFToken': client.cookies.get('csrftoken', '')} if form else None
+                    started = time.perf_counter()
+                    try:
+                        status = await client.request(method, path, form, headers)
+                    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                        await client.close()
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    if status != expected:
+                        errors += 1
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                errors += 1
+            finally:
+                await client.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'scenario': scenario,
+            'clients': clients,
+            'requests': total,
+            'errors': errors,
+            'seconds': round(elapsed, 2),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(_percentile(latencies, 0.50) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        }
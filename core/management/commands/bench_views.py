@@ -0,0 +1,138 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import ControllerProfile, Event
+from core.queryshapes import QueryShapes
+
+
+# имя -> (кто открывает страницу, адрес)
+VIEWS = {
+    'event_detail': ('organizer', lambda event, reg: reverse('event_detail', args=[event.id])),
+    'view_participants': ('organizer', lambda event, reg: reverse('view_participants', args=[event.id])),
+    'access_via_token': (None, lambda event, reg: reverse('access_event', args=[reg.access_token])),
+    'event_stats': ('organizer', lambda event, reg: reverse('event_stats', args=[event.id])),
+    'export_participants_xlsx': ('organizer', lambda event, reg: reverse('export_participants_xlsx', args=[event.id])),
+    'controller_panel': ('controller', lambda event, reg: reverse('controller_panel')),
+}
+
+
+def _fetch(client, url):
+    response = client.get(url)
+    if response.streaming:
+        body = b''.join(response.streaming_content)
+    else:
+        body = response.content
+    response.close()
+    if response.status_code != 200:
+        raise CommandError(f"{url}: HTTP {response.status_code}")
+    return len(body)
+
+
+class Command(BaseCommand):
+    help = ("Замер основных страниц через тестовый клиент на текущей БД (см. seed_load_data): "
+            "задержка, число SQL-запросов и пик памяти; сравнение с JSON-базой и ошибка при регрессии")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help="мероприятие (по умолчанию — идущее, с наибольшим числом участников)")
+        parser.add_argument('--views', nargs='+', choices=list(VIEWS), default=list(VIEWS))
+        parser.add_argument('--repeat', type=int, default=5, help="замеров задержки на страницу (медиана)")
+        parser.add_argument('--baseline', default='bench_views.json', help="JSON с базовыми значениями")
+        parser.add_argument('--update-baseline', action='store_true', help="записать результаты как новую базу")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="допустимый рост задержки и памяти (доля); SQL-запросов — ни одного лишнего")
+
+    def _event(self, event_id):
+        events = Event.objects.annotate(n=Count('registrations')).filter(n__gt=0)
+        if event_id:
+            event = events.filter(id=event_id).first()
+        else:
+            # у controller_panel мероприятие не должно закончиться
+            event = (events.filter(end_date__gt=timezone.now(), controllerprofile__isnull=False)
+                     .order_by('-n', 'id').first() or events.order_by('-n', 'id').first())
+        if event is None:
+            raise CommandError("Нет мероприятия с участниками — запустите manage.py seed_load_data")
+        return event
+
+    def _measure(self, client, url, repeat):
+        _fetch(client, url)  # прогрев: кэши, соединение, импорт шаблонов
+        latencies = []
+        # счётчик на execute_wrapper: переживает закрытие соединения по request_finished
+        with QueryShapes(threshold=float('inf')) as shapes:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                size = _fetch(client, url)
+                latencies.append(time.perf_counter() - started)
+
+        # память — отдельным прогоном: tracemalloc заметно замедляет код
+        tracemalloc.start()
+        try:
+            _fetch(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'latency_ms': round(statistics.median(latencies) * 1000, 1),
+            'queries': sum(shapes.counts.values()) // repeat,
+            'peak_kb': round(peak / 1024),
+            'bytes': size,
+        }
+
+    def handle(self, *args, **options):
+        event = self._event(options['event'])
+        registration = event.registrations.order_by('id').first()
+        controller = (ControllerProfile.objects.filter(event=event, is_active=True)
+                      .select_related('user').first())
+        users = {'organizer': event.created_by, 'controller': controller and controller.user}
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name in options['views']:
+                role, url = VIEWS[name]
+                client = Client()
+                if role:
+                    if users[role] is None:
+                        self.stderr.write(f"{name}: нет пользователя «{role}» — пропуск")
+                        continue
+                    client.force_login(users[role])
+                results[name] = self._measure(client, url(event, registration), options['repeat'])
+                self.stdout.write(
+                    f"{name:>25}: {results[name]['latency_ms']:>8} мс, SQL {results[name]['queries']:>3}, "
+                    f"пик {results[name]['peak_kb']:>6} КБ"
+                )
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as fh:
+                json.dump({'event': event.id, 'registrations': event.n, 'views': results}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"База записана: {options['baseline']}"))
+            return
+
+        try:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)['views']
+        except FileNotFoundError:
+            self.stdout.write(f"Нет базы {options['baseline']} — запустите с --update-baseline")
+            return
+
+        tolerance = 1 + options['tolerance']
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['latency_ms'] > base['latency_ms'] * tolerance:
+                regressions.append(f"{name}: задержка {base['latency_ms']} -> {result['latency_ms']} мс")
+            if result['queries'] > base['queries']:
+                regressions.append(f"{name}: SQL-запросов {base['queries']} -> {result['queries']}")
+            if result['peak_kb'] > base['peak_kb'] * tolerance:
+                regressions.append(f"{name}: пик памяти {base['peak_kb']} -> {result['peak_kb']} КБ")
+        if regressions:
+            raise CommandError("Регрессия относительно базы:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,36 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import BATCH_SIZE, import_registrations
+from core.models import Event
+
+
+class Command(BaseCommand):
+    help = "Импорт участников мероприятия из CSV или XLSX (колонки ФИО, Email, Телефон, Примечание)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('path', help="файл .csv или .xlsx")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="строк на один bulk_create")
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(id=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Мероприятие {options['event_id']} не найдено")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                report = import_registrations(event, f, options['path'], batch_size=options['batch_size'])
+        except (OSError, ValidationError) as exc:
+            raise CommandError(exc)
+
+        for error in report['errors']:
+            details = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in error['errors'].items())
+            self.stderr.write(f"Строка {error['line']}: {details}")
+        self.stdout.write(
+            f"Строк: {report['total']}, добавлено: {report['created']} "
+            f"(в листе ожидания: {report['waitlisted']}), дублей: {report['duplicates']}, "
+            f"с ошибками: {report['invalid']}"
+        )
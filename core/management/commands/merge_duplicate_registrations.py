@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.dedupe import duplicate_registrations, merge_duplicates
+
+
+class Command(BaseCommand):
+    help = ("Сливает повторные регистрации (одно мероприятие, один e-mail без учёта регистра). "
+            "Нужно выполнить один раз перед миграцией 0022_registration_email_unique")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="только показать, что будет слито")
+
+    def handle(self, *args, **options):
+        if options['dry_run'] and options['verbosity'] > 1:
+            for reg in duplicate_registrations().iterator():
+                self.stdout.write(f"#{reg.id} {reg.event_id} {reg.email} {reg.created_at:%Y-%m-%d %H:%M}")
+
+        groups, removed = merge_duplicates(dry_run=options['dry_run'])
+        verb = "Будет удалено" if options['dry_run'] else "Удалено"
+        self.stdout.write(f"Групп дублей: {groups}. {verb} регистраций: {removed}")
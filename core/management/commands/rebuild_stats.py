@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Event
+from core.stats import rebuild_event_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает EventStats / ActivityStats с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int,
+                            help="ID мероприятий (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        events = Event.objects.order_by('id')
+        if options['event_ids']:
+            events = events.filter(id__in=options['event_ids'])
+
+        count = 0
+        for event in events.iterator():
+            rebuild_event_stats(event)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересчитана: {count} мероприятий"))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.export_jobs import cleanup_exports, claim_next_job, fail_stale_jobs, run_job
+
+# как часто (с) при пустой очереди искать зависшие job и чистить старые файлы
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Фоновый воркер выгрузок (ExportJob): xlsx участников и pdf статистики"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="обработать очередь и выйти")
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help="пауза между опросами пустой очереди, с")
+
+    def maintain(self):
+        stale, removed = fail_stale_jobs(), cleanup_exports()
+        if stale or removed:
+            self.stdout.write(f"Зависших выгрузок: {stale}, удалено старых: {removed}")
+
+    def handle(self, *args, **options):
+        maintained_at = float('-inf')
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if time.monotonic() - maintained_at >= MAINTENANCE_INTERVAL or options['once']:
+                    self.maintain()
+                    maintained_at = time.monotonic()
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            run_job(job)
+            self.stdout.write(f"Выгрузка #{job.id} ({job.kind}): {job.status}")
@@ -0,0 +1,140 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import ControllerProfile, Event, Feedback, Material, Profile, Registration, ScheduleItem
+from core.search import phone_digits
+from core.stats import rebuild_event_stats
+
+
+FIRST_NAMES = ('Александр', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга',
+               'Андрей', 'Наталья', 'Михаил', 'Татьяна', 'Алексей', 'Ирина', 'Павел', 'Светлана')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+              'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров')
+TOPICS = ('Python', 'Базы данных', 'DevOps', 'Дизайн', 'Маркетинг', 'Аналитика', 'Безопасность',
+          'Мобильная разработка', 'Машинное обучение', 'Управление продуктом')
+CITIES = ('Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Онлайн')
+FEEDBACK_TEXTS = ('Отлично!', 'Полезно, спасибо', 'Хотелось бы больше практики', 'Слишком быстро',
+                  'Лучший доклад дня', 'Нормально', 'Скучновато')
+NOTES = ('VIP', 'Спикер', 'Пресса', 'Нужна парковка', 'Вегетарианское меню')
+
+
+class Command(BaseCommand):
+    help = ("Синтетические данные для нагрузочных замеров: N мероприятий, у каждого M активностей, "
+            "K участников, отзывы и материалы. bulk_create, воспроизводимо по --seed "
+            "на той же базе; повторный запуск добавляет новые данные")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5)
+        parser.add_argument('--sessions', type=int, default=10, help="активностей на мероприятие")
+        parser.add_argument('--registrations', type=int, default=2000, help="участников на мероприятие")
+        parser.add_argument('--materials', type=int, default=5, help="материалов на мероприятие")
+        parser.add_argument('--feedback', type=float, default=0.3,
+                            help="доля пришедших, оставивших отзывы (только прошедшие мероприятия)")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--organizer', default='loadtest', help="логин организатора (пароль тот же)")
+
+    def handle(self, *args, **options):
+        # в зерно входит последний id мероприятия: повторный запуск на той же базе
+        # даёт новые токены, а не падает на их уникальности
+        last_event = Event.objects.aggregate(Max('id'))['id__max'] or 0
+        rng = random.Random(f"{options['seed']}:{last_event}")
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        organizer, created = User.objects.get_or_create(
+            username=options['organizer'], defaults={'email': f"{options['organizer']}@example.com"})
+        if created:
+            organizer.set_password(options['organizer'])
+            organizer.save()
+        Profile.objects.get_or_create(user=organizer, defaults={'role': 'organizer'})
+        self.password = make_password(options['organizer'])  # хэш один на всех контролёров
+
+        # дни относительно сегодняшнего утра: половина мероприятий уже прошла
+        base = timezone.localtime().replace(hour=10, minute=0, second=0, microsecond=0)
+        totals = {'events': 0, 'sessions': 0, 'registrations': 0, 'feedback': 0, 'materials': 0}
+        for _ in range(options['events']):
+            with transaction.atomic():
+                event = self._seed_event(rng, organizer, base, options, totals, batch_size)
+                rebuild_event_stats(event)  # bulk_create не вызывает сигналы счётчиков
+            totals['events'] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано за {time.perf_counter() - started:.1f} с: мероприятий {totals['events']}, "
+            f"активностей {totals['sessions']}, участников {totals['registrations']}, "
+            f"отзывов {totals['feedback']}, материалов {totals['materials']}"
+        ))
+
+    def _uuid(self, rng):
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    def _seed_event(self, rng, organizer, base, options, totals, batch_size):
+        start = base + timedelta(days=rng.randint(-60, 60))
+        topic = rng.choice(TOPICS)
+        event = Event.objects.create(
+            title=f"{topic}: конференция {rng.randint(2024, 2026)}",
+            description=f"Доклады и воркшопы по теме «{topic}».",
+            date=start, end_date=start + timedelta(hours=8),
+            location=rng.choice(CITIES), created_by=organizer,
+            controller_token=self._uuid(rng),
+        )
+
+        sessions = ScheduleItem.objects.bulk_create([
+            ScheduleItem(event=event, title=f"{rng.choice(TOPICS)}: доклад {i + 1}",
+                         start_time=start + timedelta(minutes=45 * i),
+                         end_time=start + timedelta(minutes=45 * i + 40))
+            for i in range(options['sessions'])
+        ])
+        Material.objects.bulk_create([
+            Material(event=event, schedule_item=rng.choice(sessions) if sessions and i % 2 else None,
+                     file=f"materials/seed/{event.id}-{i}.pdf", description=f"Слайды {i + 1}")
+            for i in range(options['materials'])
+        ])
+
+        past = event.end_date < timezone.now()
+        registrations = []
+        for i in range(options['registrations']):
+            phone = f"+7 9{rng.randint(10, 99)} {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+            registrations.append(Registration(
+                event=event,
+                full_name=f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+                email=f"user{i}@load.example.com", phone=phone, phone_digits=phone_digits(phone),
+                checked_in=past and rng.random() < 0.7,
+                note=rng.choice(NOTES) if rng.random() < 0.05 else '',
+                access_token=self._uuid(rng),
+            ))
+        registrations = Registration.objects.bulk_create(registrations, batch_size=batch_size)
+        # bulk_create мимо Registration.save(): места занимаем здесь (все участники подтверждены)
+        Event.objects.filter(pk=event.pk).update(seats_taken=len(registrations))
+
+        feedbacks = []
+        for reg in registrations:
+            if not reg.checked_in or rng.random() >= options['feedback']:
+                continue
+            feedbacks.append(Feedback(registration=reg, event=event, rating=rng.randint(1, 5),
+                                      text=rng.choice(FEEDBACK_TEXTS)))
+            for session in rng.sample(sessions, min(len(sessions), 2)):
+                feedbacks.append(Feedback(registration=reg, activity=session, rating=rng.randint(1, 5),
+                                          text=rng.choice(FEEDBACK_TEXTS)))
+        Feedback.objects.bulk_create(feedbacks, batch_size=batch_size)
+
+        # контролёр мероприятия (для controller_panel): логин <организатор>-ctrl-<id>
+        controller = User.objects.create(username=f"{organizer.username}-ctrl-{event.id}",
+                                         password=self.password)
+        Profile.objects.create(user=controller, role='controller')
+        ControllerProfile.objects.create(user=controller, event=event)
+
+        totals['sessions'] += len(sessions)
+        totals['registrations'] += len(registrations)
+        totals['feedback'] += len(feedbacks)
+        totals['materials'] += options['materials']
+        return event
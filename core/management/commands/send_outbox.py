@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.broadcasts import enqueue_due_broadcasts
+from core.outbox import BATCH_SIZE, RateLimiter, claim_batch, deliver
+
+
+class Command(BaseCommand):
+    help = ("Отправляет письма из outbox (OutboundEmail) пачками через SMTP-соединения "
+            "и ставит в очередь рассылки, время которых пришло")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="разобрать готовые к отправке письма и выйти")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="писем на одно SMTP-соединение")
+        parser.add_argument('--connections', type=int, default=settings.EMAIL_CONNECTIONS,
+                            help="параллельных SMTP-соединений")
+        parser.add_argument('--rate', type=float, default=settings.EMAIL_RATE_LIMIT,
+                            help="не больше писем в секунду (0 — без ограничения)")
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help="пауза между опросами пустой очереди, с")
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options['rate'])
+        while True:
+            close_old_connections()
+            enqueue_due_broadcasts()
+
+            workers = max(options['connections'], 1)
+            if workers == 1:
+                results = [self.drain(options['batch_size'], limiter)]
+            else:
+                with ThreadPoolExecutor(workers) as pool:
+                    results = list(pool.map(self.drain_in_thread,
+                                            [options['batch_size']] * workers, [limiter] * workers))
+            sent = sum(r[0] for r in results)
+            failed = sum(r[1] for r in results)
+
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
+
+    def drain(self, batch_size, limiter):
+        """Пачка за пачкой, пока есть готовые письма; на пачку — одно SMTP-соединение."""
+        sent = failed = 0
+        while batch := claim_batch(batch_size):
+            s, f = deliver(batch, get_connection(), limiter)
+            sent, failed = sent + s, failed + f
+        return sent, failed
+
+    def drain_in_thread(self, batch_size, limiter):
+        try:
+            return self.drain(batch_size, limiter)
+        finally:
+            connection.close()  # у каждого потока своё соединение с БД
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import sweep_uploads
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные загрузки материалов по частям (MaterialUpload) вместе с недописанными файлами"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help="загрузка считается брошенной, если частей не было дольше (ч)")
+
+    def handle(self, *args, **options):
+        swept = sweep_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"Удалено брошенных загрузок: {swept}"))
@@ -0,0 +1,177 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+# границы корзин гистограмм (секунды / число запросов)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# маршрут без имени (404, static) — одна метка, чтобы не раздувать число серий
+UNRESOLVED = '<unresolved>'
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+HISTOGRAMS = {
+    # имя: (описание, корзины, поле RequestTimings)
+    'request_duration_seconds': ("Время обработки запроса", DURATION_BUCKETS, 'total'),
+    'db_queries': ("SQL-запросов на HTTP-запрос", QUERY_BUCKETS, 'db_count'),
+    'db_duration_seconds': ("Время в БД на HTTP-запрос", DURATION_BUCKETS, 'db_time'),
+    'template_duration_seconds': ("Время рендеринга шаблонов на HTTP-запрос", DURATION_BUCKETS, 'template_time'),
+}
+PREFIX = 'event_manager_'
+
+
+class RequestTimings:
+    """Замеры одного HTTP-запроса; живёт в contextvar на время запроса."""
+    __slots__ = ('started', 'total', 'db_count', 'db_time', 'template_time', 'template_depth')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.db_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing (длительности в миллисекундах)."""
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f}, '
+            f'total;dur={self.total * 1000:.1f}'
+        )
+
+
+current = contextvars.ContextVar('request_timings', default=None)
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Гистограммы по маршрутам (имя URL) в памяти процесса.
+    У каждого воркера свои — Prometheus собирает их с каждого процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._histograms = {}  # (metric, route) -> _Histogram
+            self._responses = {}   # (route, method, status) -> число
+
+    def observe(self, route, method, status, timings):
+        with self._lock:
+            for name, (_, buckets, field) in HISTOGRAMS.items():
+                key = (name, route)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram(buckets)
+                histogram.observe(getattr(timings, field))
+            key = (route, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def exposition(self):
+        """Текстовый формат Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            responses = sorted(self._responses.items())
+
+        lines = [
+            f"# HELP {PREFIX}responses_total Ответов по маршруту, методу и коду",
+            f"# TYPE {PREFIX}responses_total counter",
+        ]
+        for (route, method, status), value in responses:
+            lines.append(f'{PREFIX}responses_total{{route="{route}",method="{method}",status="{status}"}} {value}')
+
+        for name, (description, buckets, _) in HISTOGRAMS.items():
+            lines += [f"# HELP {PREFIX}{name} {description}", f"# TYPE {PREFIX}{name} histogram"]
+            for (metric, route), histogram in histograms:
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, value in zip((*buckets, '+Inf'), histogram.counts):
+                    cumulative += value
+                    lines.append(f'{PREFIX}{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}{name}_sum{{route="{route}"}} {histogram.sum:.6f}')
+                lines.append(f'{PREFIX}{name}_count{{route="{route}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - started
+        timings.db_count += 1
+
+
+def _add_query_wrapper(connection, **kwargs):
+    # вместо with connection.execute_wrapper(...) на каждый запрос: async-вью
+    # ходят в БД из потоков sync_to_async, у каждого своё соединение
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context=None, request=None):
+        timings = current.get()
+        if timings is None or timings.template_depth:
+            return render(self, context, request)  # вложенный render_to_string уже в замере
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+            timings.template_depth -= 1
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install():
+    """
+    Подключает замеры SQL (execute_wrapper на каждом соединении) и шаблонов
+    (обёртка Template.render шаблонного бэкенда Django). Вызывается из
+    CoreConfig.ready и PerformanceMiddleware, только когда PERF_METRICS
+    включён; повторный вызов ничего не меняет.
+    """
+    from django.template.backends.django import Template
+
+    connection_created.connect(_add_query_wrapper, dispatch_uid='core.metrics')
+    for connection in connections.all(initialized_only=True):
+        _add_query_wrapper(connection)
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed_render(Template.render)
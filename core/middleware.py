@@ -0,0 +1,147 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core import metrics, profiling
+from core.queryshapes import QueryShapes
+
+
+class PerformanceMiddleware:
+    """
+    Замеры каждого запроса: общее время, число и время SQL-запросов,
+    время рендеринга шаблонов. Отдаются заголовком Server-Timing и
+    копятся гистограммами по имени маршрута (см. core.metrics,
+    страница metrics/ в формате Prometheus).
+
+    При PERF_METRICS = False middleware не подключается вовсе
+    (MiddlewareNotUsed), обёртки SQL и шаблонов не ставятся.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, timings)
+
+    def _finish(self, request, response, timings):
+        timings.finish()
+        match = request.resolver_match
+        route = (match.url_name if match else None) or metrics.UNRESOLVED
+        method = request.method if request.method in metrics.KNOWN_METHODS else 'OTHER'
+        metrics.registry.observe(route, method, response.status_code, timings)
+        response['Server-Timing'] = timings.server_timing()
+        return response
+
+
+class QueryShapeMiddleware:
+    """
+    Поиск N+1: считает формы SQL-запросов (core.queryshapes.fingerprint)
+    за запрос и пишет в лог — или, при NPLUSONE_RAISE, падает —
+    если одна форма выполнена больше NPLUSONE_THRESHOLD раз.
+    NPLUSONE_THRESHOLD = 0 отключает middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_THRESHOLD:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _shapes(self, request):
+        return QueryShapes(settings.NPLUSONE_THRESHOLD, raise_errors=settings.NPLUSONE_RAISE,
+                           label=f"{request.method} {request.path}")
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with self._shapes(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self._shapes(request):
+            return await self.get_response(request)
+
+
+class ProfilerMiddleware:
+    """
+    Профиль запроса по требованию: staff-пользователь добавляет к адресу
+    ?_profile=1 (или заголовок X-Profile) — представление выполняется под
+    cProfile, трейс SQL пишется рядом, результат сохраняется в кольцевой
+    буфер PROFILE_CAPTURE_DIR (core.profiling, страница profiles/),
+    id профиля — в заголовке X-Profile-Id.
+
+    Работает в process_view, поэтому ставится последним: профилируется
+    поток, в котором выполняется само представление (для sync-view под
+    ASGI это поток sync_to_async, а не event loop). Без триггера — одна
+    проверка строки запроса. PROFILE_CAPTURE_LIMIT = 0 отключает middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_CAPTURE_LIMIT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Django адаптирует process_view к режиму по iscoroutinefunction:
+        # sync-вариант в async-цепочке стоил бы переключения потока на каждый запрос
+        self.process_view = self._aprocess_view if self.async_mode else self._process_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def _finish(self, request, capture, response):
+        capture.save(request, response)
+        response['X-Profile-Id'] = capture.id
+        return response
+
+    def _process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiling.requested(request) or not request.user.is_staff:
+            return None
+        if iscoroutinefunction(view_func):
+            view_func = async_to_sync(view_func)
+        capture = profiling.Capture()
+        response = capture.run(view_func, request, *view_args, **view_kwargs)
+        return self._finish(request, capture, response)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if not profiling.requested(request) or not (await request.auser()).is_staff:
+            return None
+        capture = profiling.Capture()
+        if iscoroutinefunction(view_func):
+            response = await capture.arun(view_func, request, *view_args, **view_kwargs)
+        else:
+            response = await sync_to_async(capture.run, thread_sensitive=True)(
+                view_func, request, *view_args, **view_kwargs)
+        return await sync_to_async(self._finish)(request, capture, response)
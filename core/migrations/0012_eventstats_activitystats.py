@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_stats(apps, schema_editor):
+    # та же сборка, что core.stats.rebuild_event_stats, но сразу для всех
+    # мероприятий: фиксированное число запросов, иначе статистика старых
+    # мероприятий пересчитывалась бы при первом просмотре
+    Event = apps.get_model('core', 'Event')
+    ScheduleItem = apps.get_model('core', 'ScheduleItem')
+    Registration = apps.get_model('core', 'Registration')
+    Feedback = apps.get_model('core', 'Feedback')
+    EventStats = apps.get_model('core', 'EventStats')
+    ActivityStats = apps.get_model('core', 'ActivityStats')
+
+    def histograms(rows):
+        result = {}
+        for key, rating, n in rows:
+            if 1 <= rating <= 5:
+                fields = result.setdefault(key, {f'rating_{i}': 0 for i in range(1, 6)})
+                fields[f'rating_{rating}'] += n
+        return result
+
+    counters = {
+        event_id: (total, checked)
+        for event_id, total, checked in Registration.objects.values_list('event_id').annotate(
+            total=Count('id'), checked=Count('id', filter=Q(checked_in=True))).order_by()
+    }
+    by_event = histograms(Feedback.objects.filter(event__isnull=False)
+                          .values_list('event_id', 'rating').annotate(n=Count('id')).order_by())
+    by_activity = histograms(Feedback.objects.filter(activity__isnull=False)
+                             .values_list('activity_id', 'rating').annotate(n=Count('id')).order_by())
+
+    EventStats.objects.bulk_create([
+        EventStats(event_id=event_id, registrations=counters.get(event_id, (0, 0))[0],
+                   checked_in=counters.get(event_id, (0, 0))[1], **by_event.get(event_id, {}))
+        for event_id in Event.objects.values_list('id', flat=True).iterator()
+    ], batch_size=500)
+    ActivityStats.objects.bulk_create([
+        ActivityStats(activity_id=activity_id, event_id=event_id, **by_activity.get(activity_id, {}))
+        for activity_id, event_id in ScheduleItem.objects.values_list('id', 'event_id').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_alter_event_controller_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('rating_1', models.IntegerField(default=0)),
+                ('rating_2', models.IntegerField(default=0)),
+                ('rating_3', models.IntegerField(default=0)),
+                ('rating_4', models.IntegerField(default=0)),
+                ('rating_5', models.IntegerField(default=0)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.event')),
+                ('registrations', models.IntegerField(default=0)),
+                ('checked_in', models.IntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityStats',
+            fields=[
+                ('rating_1', models.IntegerField(default=0)),
+                ('rating_2', models.IntegerField(default=0)),
+                ('rating_3', models.IntegerField(default=0)),
+                ('rating_4', models.IntegerField(default=0)),
+                ('rating_5', models.IntegerField(default=0)),
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='core.scheduleitem')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_stats', to='core.event')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_eventstats_activitystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_event_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckInEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_in', models.BooleanField()),
+                ('changed', models.BooleanField()),
+                ('station', models.CharField(blank=True, max_length=64)),
+                ('scanned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkin_events', to='core.event')),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkin_events', to='core.registration')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'scanned_at'], name='core_checki_event_i_6a424a_idx')],
+            },
+        ),
+    ]
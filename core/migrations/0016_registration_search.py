@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import re
+
+from django.db import migrations, models
+
+
+# icontains на Postgres — UPPER(col) LIKE UPPER('%q%'), поэтому индекс по UPPER(col)
+TRIGRAM_INDEXES = {
+    'registration_full_name_trgm': 'UPPER("full_name"::text)',
+    'registration_email_trgm': 'UPPER("email"::text)',
+    'registration_note_trgm': 'UPPER("note"::text)',
+    'registration_phone_digits_trgm': '"phone_digits"',
+}
+
+
+def fill_phone_digits(apps, schema_editor):
+    Registration = apps.get_model('core', 'Registration')
+    batch = []
+    for reg in Registration.objects.only('id', 'phone').iterator(chunk_size=2000):
+        reg.phone_digits = re.sub(r'\D+', '', reg.phone or '')
+        batch.append(reg)
+        if len(batch) >= 2000:
+            Registration.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    if batch:
+        Registration.objects.bulk_update(batch, ['phone_digits'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "core_registration" '
+            f'USING gin ({expression} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_registration_seek_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
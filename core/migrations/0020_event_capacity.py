@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_seats_taken(apps, schema_editor):
+    # до лимитов все регистрации были подтверждёнными
+    Event = apps.get_model('core', 'Event')
+    Registration = apps.get_model('core', 'Registration')
+    taken = (Registration.objects.filter(event=OuterRef('pk')).order_by()
+             .values('event').annotate(n=Count('id')).values('n'))
+    Event.objects.update(seats_taken=Coalesce(Subquery(taken), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='waitlisted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(fill_seats_taken, migrations.RunPython.noop),
+    ]
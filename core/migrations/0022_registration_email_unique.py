@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_no_duplicates(apps, schema_editor):
+    # уникальность не создать, пока в базе есть дубли — их сливает отдельная команда
+    Registration = apps.get_model('core', 'Registration')
+    duplicates = (Registration.objects.annotate(email_key=Lower('email'))
+                  .values('event_id', 'email_key').annotate(n=Count('id')).filter(n__gt=1).order_by())
+    if duplicates.exists():
+        raise RuntimeError(
+            "В базе есть повторные регистрации (одно мероприятие, один e-mail). "
+            "Выполните manage.py merge_duplicate_registrations и повторите migrate."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_registration_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(models.F('event'), django.db.models.functions.text.Lower('email'), name='registration_event_email_uniq'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_material_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registration',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(fields=('event', 'idempotency_key'), name='registration_event_idempotency_uniq'),
+        ),
+    ]
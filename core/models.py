@@ -1,10 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_init
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
 import uuid
 
+from .search import RegistrationQuerySet, phone_digits
+
 
 
 class Event(models.Model):
@@ -17,10 +22,69 @@ class Event(models.Model):
     registration_deadline = models.DateTimeField(null=True, blank=True)  # крайний срок
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='events')
     controller_token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # растёт при любом изменении мероприятия, расписания или материалов;
+    # входит в ключ кэша страницы участника (core.page_cache)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    capacity = models.PositiveIntegerField(null=True, blank=True)  # лимит мест, пусто — без лимита
+    # занятые места (без листа ожидания); меняется только reserve_seat/release_seat
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)
+
+    # счётчики, которые меняются атомарными UPDATE, а не через save()
+    COUNTER_FIELDS = ('version', 'seats_taken')
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # счётчики меняются только через F(): полное сохранение
+        # формы не должно откатить их к устаревшему значению
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bump_version(cls, event_id):
+        cls.objects.filter(id=event_id).update(version=F('version') + 1)
+
+    @classmethod
+    def reserve_seat(cls, event_id):
+        """
+        Занимает место одним условным UPDATE ... SET seats_taken = seats_taken + 1
+        WHERE seats_taken < capacity — без SELECT ... FOR UPDATE и без гонки
+        «проверили count(), потом вставили». False — мест нет.
+        """
+        has_seat = models.Q(capacity__isnull=True) | models.Q(seats_taken__lt=F('capacity'))
+        return bool(cls.objects.filter(has_seat, id=event_id).update(seats_taken=F('seats_taken') + 1))
+
+    @classmethod
+    def reserve_seats(cls, event_id, count):
+        """
+        Пакетный вариант reserve_seat (импорт): занимает до count мест
+        и возвращает, сколько удалось. Условие на прежнее значение счётчика
+        вместо блокировки строки; при гонке — повтор.
+        """
+        while True:
+            taken, capacity = cls.objects.filter(id=event_id).values_list('seats_taken', 'capacity').get()
+            granted = count if capacity is None else max(min(count, capacity - taken), 0)
+            if not granted:
+                return 0
+            if cls.objects.filter(id=event_id, seats_taken=taken).update(seats_taken=taken + granted):
+                return granted
+
+    @classmethod
+    def release_seat(cls, event_id):
+        cls.objects.filter(id=event_id, seats_taken__gt=0).update(seats_taken=F('seats_taken') - 1)
+
+    @property
+    def seats_left(self):
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.seats_taken, 0)
+
 
 class ScheduleItem(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='schedule_items')
@@ -38,24 +102,92 @@ class Material(models.Model):
     schedule_item = models.ForeignKey('ScheduleItem', on_delete=models.CASCADE, null=True, blank=True, related_name='materials')
     file = models.FileField(upload_to='materials/')
     description = models.CharField(max_length=255, blank=True)
+    # считается при загрузке по частям (core.uploads); у старых и обычных загрузок — пусто
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
         return self.description or f"Материал для {self.event.title}"
 
 
+class MaterialUpload(models.Model):
+    """
+    Незавершённая загрузка материала по частям (core.uploads): части
+    дописываются прямо в файл по итоговому пути в хранилище, received —
+    сколько байт уже принято. После finish остаётся Material, а эта
+    запись удаляется; брошенные — manage.py sweep_material_uploads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='material_uploads')
+    schedule_item = models.ForeignKey('ScheduleItem', on_delete=models.CASCADE, null=True, blank=True,
+                                      related_name='material_uploads')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    description = models.CharField(max_length=255, blank=True)
+    file = models.FileField(upload_to='materials/')
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)  # ожидаемый хэш от клиента, необязателен
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'])]
+
+    def __str__(self):
+        return f"{self.file.name} — {self.received}/{self.size}"
+
+
 class Registration(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='registrations')
     full_name = models.CharField(max_length=255)
     email = models.EmailField()
     phone = models.CharField(max_length=20)
+    # только цифры телефона — для поиска (core.search)
+    phone_digits = models.CharField(max_length=20, blank=True, editable=False)
     checked_in = models.BooleanField(default=False)
+    # мест не хватило: ждёт освобождения (core.seats.promote_waitlist)
+    waitlisted = models.BooleanField(default=False, editable=False)
     note = models.CharField(max_length=255, blank=True)
     access_token = models.UUIDField(default=uuid.uuid4, unique=True)
+    # ключ из скрытого поля формы: повтор того же POST не создаёт вторую регистрацию
+    # (уникален в пределах мероприятия — см. Meta.constraints)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RegistrationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # один e-mail — одна регистрация на мероприятие (без учёта регистра)
+            models.UniqueConstraint('event', Lower('email'), name='registration_event_email_uniq'),
+            # тот же ключ формы с другого мероприятия — не повтор
+            models.UniqueConstraint(fields=['event', 'idempotency_key'], name='registration_event_idempotency_uniq'),
+        ]
+        indexes = [
+            # keyset-пагинация списка участников (core.pagination)
+            models.Index(fields=['event', 'created_at', 'id'], name='registration_event_seek'),
+        ]
+
     def __str__(self):
         return f"{self.full_name} — {self.event.title}"
 
+    def save(self, *args, **kwargs):
+        # bulk_create мимо save(): там phone_digits и места заполняются явно
+        self.phone_digits = phone_digits(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        # новая регистрация занимает место или встаёт в лист ожидания;
+        # место возвращается, если INSERT не прошёл
+        with transaction.atomic():
+            if not self.waitlisted:
+                self.waitlisted = not Event.reserve_seat(self.event_id)
+            super().save(*args, **kwargs)
+
 
 class Feedback(models.Model):
     RATING_CHOICES = [(i, str(i)) for i in range(1, 6)]
@@ -97,6 +229,334 @@ class ControllerProfile(models.Model):
         return f"Контролёр {self.user.username} на {self.event.title}"
 
 
+class CheckInEvent(models.Model):
+    """
+    Журнал сканирований на входе (только добавление).
+    Из него считается пропускная способность: сканов в минуту по станциям.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='checkin_events')
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='checkin_events')
+    checked_in = models.BooleanField()
+    changed = models.BooleanField()  # False — повторный скан без изменения
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    station = models.CharField(max_length=64, blank=True)
+    scanned_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['event', 'scanned_at'])]
+
+    def __str__(self):
+        return f"{self.registration_id}: {'вход' if self.checked_in else 'отмена'} ({self.scanned_at})"
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка (xlsx участников / pdf статистики).
+    Строит manage.py run_export_worker; готовый файл переиспользуется
+    для одинаковых запросов по cache_key (см. core.export_jobs).
+    """
+    KIND_CHOICES = (
+        ('participants_xlsx', 'Участники (xlsx)'),
+        ('stats_pdf', 'Статистика (pdf)'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('running', 'Формируется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='export_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    cache_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveSmallIntegerField(default=0)  # 0..100
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # один живой (не упавший) job на ключ — двойной клик не плодит выгрузки
+            models.UniqueConstraint(fields=['cache_key'], condition=~models.Q(status='failed'),
+                                    name='exportjob_live_cache_key'),
+        ]
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} — {self.event_id} ({self.status})"
+
+
+class Broadcast(models.Model):
+    """
+    Рассылка всем участникам мероприятия: сразу или напоминание
+    за remind_before до начала (send_at пересчитывается при смене даты).
+    Письма ставит в outbox manage.py send_outbox (см. core.broadcasts).
+    """
+    STATUS_CHOICES = (
+        ('scheduled', 'Запланирована'),
+        ('enqueueing', 'Ставится в очередь'),
+        ('queued', 'В очереди на отправку'),
+        ('cancelled', 'Отменена'),
+    )
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='broadcasts')
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    remind_before = models.DurationField(null=True, blank=True)
+    send_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
+    recipients = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'send_at'])]
+
+    def __str__(self):
+        return f"{self.subject} — {self.event_id} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Исходящее письмо (outbox). Пишется в той же транзакции, что и данные,
+    к которым относится; отправляет manage.py send_outbox (см. core.outbox).
+    """
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    registration = models.ForeignKey(Registration, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='emails')
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='emails')
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # когда письмо можно брать в работу: время следующей попытки или конец аренды воркера
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.UUIDField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # повторная постановка рассылки в очередь не дублирует письма
+            models.UniqueConstraint(fields=['broadcast', 'registration'], name='outboundemail_broadcast_once'),
+        ]
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.to_email}: {self.subject} ({self.status})"
+
+
+class RatingHistogram(models.Model):
+    """
+    Счётчики оценок 1..5. Обновляются атомарно через F(),
+    средняя оценка считается из гистограммы без обращения к Feedback.
+    """
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+
+    RATING_FIELDS = {i: f'rating_{i}' for i in range(1, 6)}
+
+    class Meta:
+        abstract = True
+
+    @property
+    def histogram(self):
+        return {i: getattr(self, fld) for i, fld in self.RATING_FIELDS.items()}
+
+    @property
+    def feedback_count(self):
+        return sum(self.histogram.values())
+
+    @property
+    def avg_rating(self):
+        count = self.feedback_count
+        if not count:
+            return None
+        return sum(i * n for i, n in self.histogram.items()) / count
+
+
+class EventStats(RatingHistogram):
+    """
+    Денормализованная статистика мероприятия (для event_stats / event_stats_pdf).
+    Гистограмма — только отзывы о мероприятии в целом.
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    registrations = models.IntegerField(default=0)
+    checked_in = models.IntegerField(default=0)
+    # растёт при любом изменении участников или отзывов;
+    # входит в ключ готовых выгрузок (core.export_jobs)
+    data_version = models.IntegerField(default=0)
+
+    @classmethod
+    def bump(cls, event_id, **deltas):
+        # строки нет (удалена вручную / удаление каскадом) — её восстановит
+        # core.stats.get_event_stats или manage.py rebuild_stats
+        return cls.objects.filter(event_id=event_id).update(
+            data_version=F('data_version') + 1,
+            **{fld: F(fld) + delta for fld, delta in deltas.items()}
+        )
+
+    def __str__(self):
+        return f"Статистика: {self.event_id}"
+
+
+class ActivityStats(RatingHistogram):
+    activity = models.OneToOneField(ScheduleItem, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='activity_stats')
+
+    @classmethod
+    def bump(cls, activity_id, **deltas):
+        EventStats.objects.filter(event__schedule_items__id=activity_id).update(
+            data_version=F('data_version') + 1
+        )
+        return cls.objects.filter(activity_id=activity_id).update(
+            **{fld: F(fld) + delta for fld, delta in deltas.items()}
+        )
+
+    def __str__(self):
+        return f"Статистика активности: {self.activity_id}"
+
+
+@receiver(post_save, sender=Event)
+def create_event_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        EventStats.objects.get_or_create(event=instance)
+
+
+@receiver(post_save, sender=ScheduleItem)
+def create_activity_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ActivityStats.objects.get_or_create(activity=instance, defaults={'event_id': instance.event_id})
+
+
+@receiver(post_save, sender=Event)
+def reschedule_reminders(sender, instance, created, raw=False, **kwargs):
+    # напоминания «за N до начала» сдвигаются вместе с датой мероприятия
+    if created or raw:
+        return
+    for broadcast in instance.broadcasts.filter(status='scheduled', remind_before__isnull=False):
+        send_at = instance.date - broadcast.remind_before
+        if broadcast.send_at != send_at:
+            broadcast.send_at = send_at
+            broadcast.save(update_fields=['send_at'])
+
+
+# --- версия мероприятия для кэша страницы участника ---
+
+@receiver(post_save, sender=Event)
+def bump_event_version(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Event.bump_version(instance.id)
+
+
+@receiver(post_save, sender=ScheduleItem)
+@receiver(post_delete, sender=ScheduleItem)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+def bump_event_version_for_child(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Event.bump_version(instance.event_id)
+
+
+# --- Registration: регистрации и отметки о приходе ---
+
+@receiver(post_init, sender=Registration)
+def remember_checked_in(sender, instance, **kwargs):
+    # __dict__, чтобы не подгружать отложенное поле (.only())
+    instance._stats_checked_in = instance.__dict__.get('checked_in')
+
+
+@receiver(post_save, sender=Registration)
+def count_registration(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        EventStats.bump(instance.event_id, registrations=1, checked_in=int(instance.checked_in))
+    elif (instance._stats_checked_in is not None
+          and 'checked_in' in instance.__dict__
+          and instance._stats_checked_in != instance.checked_in):
+        EventStats.bump(instance.event_id, checked_in=1 if instance.checked_in else -1)
+    else:
+        EventStats.bump(instance.event_id)  # прочие поля: только data_version
+    instance._stats_checked_in = instance.__dict__.get('checked_in')
+
+
+@receiver(post_delete, sender=Registration)
+def uncount_registration(sender, instance, **kwargs):
+    EventStats.bump(instance.event_id, registrations=-1, checked_in=-int(instance.checked_in))
+
+
+@receiver(post_delete, sender=Registration)
+def release_registration_seat(sender, instance, **kwargs):
+    # лист ожидания продвигает core.seats.cancel_registration
+    if not instance.waitlisted:
+        Event.release_seat(instance.event_id)
+
+
+# --- Feedback: гистограммы оценок ---
+
+def _feedback_key(feedback):
+    values = feedback.__dict__
+    if not {'event_id', 'activity_id', 'rating'} <= values.keys():
+        return None  # часть полей отложена — изменение не отследить
+    return values['event_id'], values['activity_id'], values['rating']
+
+
+def _count_feedback(key, sign):
+    if key is None:
+        return
+    event_id, activity_id, rating = key
+    fld = RatingHistogram.RATING_FIELDS.get(rating)
+    if fld is None:
+        return
+    if event_id:
+        EventStats.bump(event_id, **{fld: sign})
+    if activity_id:
+        ActivityStats.bump(activity_id, **{fld: sign})
+
+
+@receiver(post_init, sender=Feedback)
+def remember_feedback(sender, instance, **kwargs):
+    instance._stats_key = _feedback_key(instance)
+
+
+@receiver(post_save, sender=Feedback)
+def count_feedback(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    key = _feedback_key(instance)
+    if created:
+        _count_feedback(key, 1)
+    elif instance._stats_key and key and instance._stats_key != key:
+        _count_feedback(instance._stats_key, -1)
+        _count_feedback(key, 1)
+    instance._stats_key = key
+
+
+@receiver(post_delete, sender=Feedback)
+def uncount_feedback(sender, instance, **kwargs):
+    _count_feedback(_feedback_key(instance), -1)
+
+
 @receiver(post_delete, sender=User)
 def delete_profile_with_user(sender, instance, **kwargs):
     try:
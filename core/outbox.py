@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=6)
+# сколько воркер «держит» взятые письма; упавший воркер — письма вернутся в очередь.
+# Живой воркер продлевает аренду по ходу пачки (deliver), поэтому медленный
+# темп (RateLimiter) или SMTP не приводят к повторной отправке другим воркером.
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def enqueue_email(to_email, subject, body, registration=None):
+    """
+    Ставит письмо в outbox. Вызывать внутри той же транзакции,
+    что и сохранение данных: письмо уйдёт, только если они записались.
+    """
+    return OutboundEmail.objects.create(
+        to_email=to_email, subject=subject[:255], body=body, registration=registration,
+    )
+
+
+def retry_delay(attempts):
+    """Экспоненциальная пауза: 1, 2, 4 ... минут, не больше RETRY_MAX."""
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+class RateLimiter:
+    """Не больше rate писем в секунду на все потоки воркера (0 — без ограничения)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        time.sleep(slot - now)
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """
+    Забирает до limit писем, готовых к отправке. Захват — условный UPDATE
+    с меткой claim, поэтому параллельные воркеры не возьмут одно письмо.
+    Письма, зависшие в 'sending' дольше CLAIM_LEASE, забираются повторно.
+    """
+    now = timezone.now()
+    ready = OutboundEmail.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+    ids = list(ready.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+
+    token = uuid.uuid4()
+    ready.filter(id__in=ids).update(status='sending', claim=token, next_attempt_at=now + CLAIM_LEASE)
+    return list(OutboundEmail.objects.filter(claim=token).order_by('id'))
+
+
+class _Lease:
+    """Аренда пачки писем, взятой claim_batch: продлевается по ходу отправки."""
+
+    def __init__(self, emails):
+        self.claim = emails[0].claim
+        self.until = min(email.next_attempt_at for email in emails)
+        self.lost = set()
+
+    def holds(self, email, remaining):
+        if email.id in self.lost:
+            return False
+        now = timezone.now()
+        if now < self.until - CLAIM_LEASE / 2:
+            return True
+        ids = [e.id for e in remaining if e.id not in self.lost]
+        ours = set(OutboundEmail.objects.filter(id__in=ids, claim=self.claim).values_list('id', flat=True))
+        self.lost.update(set(ids) - ours)
+        self.until = now + CLAIM_LEASE
+        OutboundEmail.objects.filter(id__in=ours, claim=self.claim).update(next_attempt_at=self.until)
+        return email.id in ours
+
+
+def deliver(emails, connection=None, limiter=None):
+    """
+    Отправляет письма через одно SMTP-соединение (get_connection + send_messages),
+    limiter (RateLimiter) выдерживает темп отправки. Ошибка одного письма
+    не мешает остальным: оно получает повторную попытку с экспоненциальной
+    паузой, после MAX_ATTEMPTS — статус failed.
+
+    Когда до конца аренды остаётся меньше половины CLAIM_LEASE, она
+    продлевается для ещё не отправленных писем пачки; письма, которые
+    за это время забрал другой воркер, пропускаются.
+
+    Возвращает (отправлено, ошибок).
+    """
+    if not emails:
+        return 0, 0
+    lease = _Lease(emails)
+
+    connection = connection or get_connection()
+    sent_ids, errors = [], {}
+    try:
+        connection.open()
+    except Exception as exc:
+        # сервер недоступен — вся пачка уходит на повтор
+        logger.warning("SMTP connection failed: %s", exc)
+        errors = {email.id: exc for email in emails}
+    else:
+        try:
+            for position, email in enumerate(emails):
+                if limiter:
+                    limiter.wait()
+                if not lease.holds(email, emails[position:]):
+                    continue
+                message = EmailMessage(email.subject, email.body, settings.DEFAULT_FROM_EMAIL,
+                                       [email.to_email], connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as exc:
+                    logger.warning("Email %s to %s failed: %s", email.id, email.to_email, exc)
+                    errors[email.id] = exc
+                else:
+                    sent_ids.append(email.id)
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent_ids:
+        OutboundEmail.objects.filter(id__in=sent_ids).update(
+            status='sent', sent_at=now, claim=None, last_error='',
+        )
+    for email in emails:
+        if email.id not in errors:
+            continue
+        attempts = email.attempts + 1
+        OutboundEmail.objects.filter(id=email.id).update(
+            status='failed' if attempts >= MAX_ATTEMPTS else 'pending',
+            attempts=attempts,
+            next_attempt_at=now + retry_delay(attempts),
+            claim=None,
+            last_error=str(errors[email.id])[:1000],
+        )
+    return len(sent_ids), len(errors)
@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from core.dates import ru_dt
+
+
+ACCESS_PAGE_TIMEOUT = 60 * 60
+
+
+def _access_page_key(event):
+    # старые версии не удаляем — они просто истекают по таймауту
+    return f"access_event:{event.id}:v{event.version}"
+
+
+def _render_access_page(event):
+    schedule = event.schedule_items.prefetch_related('materials').order_by('start_time', 'id')
+    return {
+        'facts': [
+            ("Дата проведения:", ru_dt(event.date)),
+            ("Окончание:", ru_dt(event.end_date)),
+            ("Место:", event.location or "(не указано)"),
+        ],
+        'schedule': [
+            {
+                'id': item.id,
+                'end_time': item.end_time,
+                'html': render_to_string('access_event_schedule_item.html', {'item': item}),
+            }
+            for item in schedule
+        ],
+        'materials_html': render_to_string('access_event_materials.html', {
+            'materials': event.materials.all(),
+        }),
+    }
+
+
+def access_page_fragments(event):
+    """
+    Общая для всех участников часть страницы access_via_token:
+    факты о мероприятии, карточки расписания с материалами и блок
+    общих материалов (уже отрендеренные). Кэшируется по event.version,
+    который увеличивают сигналы Event / ScheduleItem / Material.
+
+    Возвращает dict с ключами facts, schedule ([{'id', 'end_time', 'html'}]),
+    materials_html.
+    """
+    key = _access_page_key(event)
+    fragments = cache.get(key)
+    if fragments is None:
+        fragments = _render_access_page(event)
+        cache.set(key, fragments, ACCESS_PAGE_TIMEOUT)
+    return fragments
+
+
+async def aaccess_page_fragments(event):
+    """Async-версия access_page_fragments: кэш — напрямую, сборка при промахе — в потоке."""
+    key = _access_page_key(event)
+    fragments = await cache.aget(key)
+    if fragments is None:
+        fragments = await sync_to_async(_render_access_page)(event)
+        await cache.aset(key, fragments, ACCESS_PAGE_TIMEOUT)
+    return fragments
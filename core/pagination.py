@@ -0,0 +1,70 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Курсор из URL -> (created_at, id) или None, если он битый."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+def keyset_page(queryset, after=None, before=None, size=PAGE_SIZE):
+    """
+    Keyset (seek) пагинация по (created_at, id): страница читается
+    через WHERE (created_at, id) > курсор ... LIMIT, без OFFSET и COUNT,
+    поэтому стоимость не зависит от номера страницы.
+
+    queryset должен отдавать created_at и id (модели или .values()).
+    after / before – декодированные курсоры (см. decode_cursor).
+
+    Возвращает dict: rows, next_cursor, prev_cursor (None, если страницы нет).
+    """
+    if before is not None:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            .order_by('-created_at', '-id')[:size + 1]
+        )
+        has_prev = len(rows) > size
+        rows = rows[:size][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            created_at, pk = after
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        rows = list(queryset.order_by('created_at', 'id')[:size + 1])
+        has_next = len(rows) > size
+        rows = rows[:size]
+        has_prev = after is not None
+
+    def cursor(row):
+        if isinstance(row, dict):
+            return encode_cursor(row['created_at'], row['id'])
+        return encode_cursor(row.created_at, row.id)
+
+    return {
+        'rows': rows,
+        'next_cursor': cursor(rows[-1]) if rows and has_next else None,
+        'prev_cursor': cursor(rows[0]) if rows and has_prev else None,
+    }
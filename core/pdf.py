@@ -0,0 +1,158 @@
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+
+PDF_CACHE_TIMEOUT = 24 * 3600
+
+
+class PdfRenderTimeout(Exception):
+    """Рендеринг не уложился в PDF_RENDER_TIMEOUT; зависший воркер пула остановлен."""
+
+
+def _static_url_fetcher(url, *args, **kwargs):
+    # /static/... читаем с диска, а не HTTP-запросом к самому себе
+    path = urlparse(url).path
+    if path.startswith(settings.STATIC_URL):
+        found = finders.find(path[len(settings.STATIC_URL):])
+        if found:
+            return {'file_obj': open(found, 'rb'), 'filename': found}
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+# --- состояние рендеринга: шрифты и разобранные стили живут между вызовами ---
+
+# FontConfiguration WeasyPrint не потокобезопасна: при рендеринге в процессе
+# запросов (PDF_RENDER_WORKERS = 0) у каждого потока свои шрифты и стили,
+# рендеры идут параллельно без блокировки. Воркер пула однопоточный — один набор.
+_local = threading.local()
+_stylesheet_digests = {}
+
+
+def _worker_init():
+    # spawn: дочерний процесс стартует с чистого интерпретатора
+    import django
+    django.setup()
+
+
+def _get_font_config():
+    font_config = getattr(_local, 'font_config', None)
+    if font_config is None:
+        font_config = _local.font_config = FontConfiguration()
+        _local.stylesheets = {}
+    return font_config
+
+
+def _get_stylesheet(name):
+    font_config = _get_font_config()
+    css = _local.stylesheets.get(name)
+    if css is None:
+        css = _local.stylesheets[name] = CSS(filename=finders.find(name), font_config=font_config,
+                                             url_fetcher=_static_url_fetcher)
+    return css
+
+
+def _stylesheet_digest(name):
+    # файл стилей не меняется без перезапуска — хэшируем один раз на процесс
+    digest = _stylesheet_digests.get(name)
+    if digest is None:
+        with open(finders.find(name), 'rb') as f:
+            digest = hashlib.sha256(f.read()).digest()
+        _stylesheet_digests[name] = digest
+    return digest
+
+
+def _render(html_string, stylesheet):
+    css = _get_stylesheet(stylesheet)
+    html = HTML(string=html_string, base_url=f"file://{settings.BASE_DIR}/",
+                url_fetcher=_static_url_fetcher)
+    return html.write_pdf(stylesheets=[css], font_config=_get_font_config())
+
+
+# --- пул процессов ---
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_worker_init,
+            max_tasks_per_child=settings.PDF_RENDER_MAX_TASKS,
+        )
+    return _pool
+
+
+def _render_in_pool(html_string, stylesheet):
+    with _lock:
+        pool = _get_pool()
+    try:
+        return pool.submit(_render, html_string, stylesheet).result(timeout=settings.PDF_RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        # воркер упал (OOM и т.п.) — следующий вызов поднимет новый пул
+        _discard_pool(pool)
+        raise
+    except FutureTimeoutError:
+        # зависший воркер так и занимал бы слот пула: останавливаем пул целиком
+        _discard_pool(pool, terminate=True)
+        raise PdfRenderTimeout(f"PDF не сформирован за {settings.PDF_RENDER_TIMEOUT} с")
+
+
+def _discard_pool(pool, terminate=False):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    if terminate:
+        # у ProcessPoolExecutor нет публичного способа прервать выполняющуюся задачу
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cache_key(html_string, stylesheet):
+    digest = hashlib.sha256()
+    digest.update(stylesheet.encode())
+    digest.update(_stylesheet_digest(stylesheet))
+    digest.update(html_string.encode())
+    return f"pdf:{digest.hexdigest()}"
+
+
+def render_pdf(html_string, stylesheet):
+    """
+    HTML -> PDF через WeasyPrint.
+
+    stylesheet – путь CSS в static (например, 'css/event_stats_pdf.css');
+    он разбирается один раз на поток вместе с FontConfiguration,
+    поэтому шрифты не загружаются заново на каждый запрос.
+
+    Вёрстка идёт в пуле из PDF_RENDER_WORKERS процессов (0 — в текущем
+    процессе), чтобы тяжёлый layout не занимал потоки запросов. Не уложились
+    в PDF_RENDER_TIMEOUT — PdfRenderTimeout, пул пересоздаётся.
+    Готовый PDF кешируется по хешу HTML и стилей: неизменившаяся страница
+    отдаётся без рендеринга.
+    """
+    key = _cache_key(html_string, stylesheet)
+    pdf = cache.get(key)
+    if pdf is not None:
+        return pdf
+
+    if settings.PDF_RENDER_WORKERS:
+        pdf = _render_in_pool(html_string, stylesheet)
+    else:
+        pdf = _render(html_string, stylesheet)
+    cache.set(key, pdf, PDF_CACHE_TIMEOUT)
+    return pdf
@@ -0,0 +1,182 @@
+import cProfile
+import contextvars
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from core.queryshapes import fingerprint
+
+
+TOP_FUNCTIONS = 25
+TOP_QUERIES = 15
+MAX_TRACED_QUERIES = 5000  # длинный трейс обрезаем
+_CAPTURE_ID = re.compile(r'^[\w-]+$')
+
+current = contextvars.ContextVar('profile_capture', default=None)
+
+
+def requested(request):
+    """Дёшевая проверка триггера (?_profile=1 или X-Profile), без обращения к пользователю."""
+    return '_profile=' in request.META.get('QUERY_STRING', '') or 'HTTP_X_PROFILE' in request.META
+
+
+class Capture:
+    """
+    Профиль одного запроса: cProfile потока, в котором выполняется
+    представление, и трейс SQL (из любых потоков — через contextvar).
+    """
+
+    def __init__(self):
+        # по id сортируется кольцевой буфер — время с микросекундами
+        self.id = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+        self.profiler = cProfile.Profile()
+        self.queries = []  # [(sql, секунды)]
+        self.seconds = 0.0
+
+    def run(self, func, *args, **kwargs):
+        token = current.set(self)
+        started = time.perf_counter()
+        self.profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+            self.seconds = time.perf_counter() - started
+            current.reset(token)
+
+    async def arun(self, func, *args, **kwargs):
+        # async-представление: профилируется поток event loop; работа ORM
+        # в потоках sync_to_async видна в трейсе SQL
+        token = current.set(self)
+        started = time.perf_counter()
+        self.profiler.enable()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+            self.seconds = time.perf_counter() - started
+            current.reset(token)
+
+    def _top_functions(self, sort):
+        stats = pstats.Stats(self.profiler).stats
+        rows = [
+            {
+                'function': f"{_short_path(filename)}:{line}({name})",
+                'calls': calls,
+                'own_ms': round(own * 1000, 2),
+                'cumulative_ms': round(cumulative * 1000, 2),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in stats.items()
+        ]
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+    def _top_queries(self):
+        shapes = {}
+        for sql, seconds in self.queries:
+            shape = shapes.setdefault(fingerprint(sql), {'sql': fingerprint(sql), 'count': 0, 'ms': 0.0})
+            shape['count'] += 1
+            shape['ms'] += seconds * 1000
+        rows = sorted(shapes.values(), key=lambda row: row['ms'], reverse=True)[:TOP_QUERIES]
+        for row in rows:
+            row['ms'] = round(row['ms'], 2)
+        return rows
+
+    def save(self, request, response):
+        """Пишет <id>.prof (pstats) и <id>.json (сводка) и обрезает буфер до PROFILE_CAPTURE_LIMIT."""
+        directory = settings.PROFILE_CAPTURE_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(directory, f"{self.id}.prof"))
+        match = request.resolver_match
+        summary = {
+            'id': self.id,
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'route': match.url_name if match else '',
+            'user': request.user.get_username(),
+            'status': response.status_code,
+            'ms': round(self.seconds * 1000, 1),
+            'query_count': len(self.queries),
+            'query_ms': round(sum(seconds for _, seconds in self.queries) * 1000, 1),
+            'top_cumulative': self._top_functions('cumulative_ms'),
+            'top_own': self._top_functions('own_ms'),
+            'top_queries': self._top_queries(),
+        }
+        with open(os.path.join(directory, f"{self.id}.json"), 'w') as fh:
+            json.dump(summary, fh, ensure_ascii=False)
+        _prune(directory, settings.PROFILE_CAPTURE_LIMIT)
+        return summary
+
+
+def _short_path(filename):
+    for prefix in (str(settings.BASE_DIR) + os.sep, 'site-packages' + os.sep):
+        if prefix in filename:
+            return filename.split(prefix, 1)[1]
+    return filename
+
+
+def _prune(directory, limit):
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for capture_id in ids[:-limit] if limit else ids:
+        for ext in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, capture_id + ext))
+            except FileNotFoundError:
+                pass  # параллельный запрос уже удалил
+
+
+def recent_captures():
+    """Сводки сохранённых профилей, новые первыми."""
+    directory = settings.PROFILE_CAPTURE_DIR
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as fh:
+                    captures.append(json.load(fh))
+            except (OSError, ValueError):
+                continue  # файл удалён или ещё пишется
+    return captures
+
+
+def capture_path(capture_id):
+    """Путь к <id>.prof или None (в т.ч. для некорректного id)."""
+    if not _CAPTURE_ID.match(capture_id):
+        return None
+    path = os.path.join(settings.PROFILE_CAPTURE_DIR, f"{capture_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def _trace_query(execute, sql, params, many, context):
+    capture = current.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if len(capture.queries) < MAX_TRACED_QUERIES:
+            capture.queries.append((sql, time.perf_counter() - started))
+
+
+def _add_trace_wrapper(connection, **kwargs):
+    if _trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_trace_query)
+
+
+def install():
+    """execute_wrapper трейса SQL на всех соединениях; без активного профиля — сразу execute."""
+    connection_created.connect(_add_trace_wrapper, dispatch_uid='core.profiling')
+    for connection in connections.all(initialized_only=True):
+        _add_trace_wrapper(connection)
@@ -0,0 +1,139 @@
+import contextvars
+import logging
+import os
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+from core import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+_SPACES = re.compile(r"\s+")
+
+_PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+# свои обёртки execute — не место вызова
+_WRAPPER_FILES = {__file__, metrics.__file__, os.path.join(os.path.dirname(__file__), 'profiling.py')}
+
+
+def fingerprint(sql):
+    """
+    Форма запроса: литералы -> ?, списки IN (%s, %s, ...) -> (...),
+    пробелы схлопнуты. Запросы, отличающиеся только параметрами,
+    получают одну форму.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class RepeatedQueryError(AssertionError):
+    """Одна форма запроса выполнена больше порога (N+1)."""
+
+
+def _is_project_file(filename):
+    return (filename.startswith(_PROJECT_DIR) and filename not in _WRAPPER_FILES
+            and 'site-packages' not in filename)
+
+
+def _call_site():
+    """
+    Где в нашем коде возник запрос: ближайший кадр проекта (не Django,
+    не stdlib, не этот модуль), плюс строка шаблона, если запрос из шаблона.
+    """
+    python_site = template_site = None
+    frame = sys._getframe(1)
+    while frame is not None and python_site is None:
+        filename = frame.f_code.co_filename
+        node = frame.f_locals.get('self')
+        if template_site is None and isinstance(node, Node) and getattr(node, 'origin', None) and node.token:
+            template_site = f"{node.origin.template_name}:{node.token.lineno}"
+        if _is_project_file(filename):
+            python_site = f"{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return " <- ".join(site for site in (template_site, python_site) if site) or "?"
+
+
+class QueryShapes:
+    """
+    Счётчик форм SQL-запросов в пределах блока (обычно — одного HTTP-запроса).
+
+    Форма, выполненная больше threshold раз, попадает в violations вместе
+    с местом первого превышения (строка шаблона и/или нашего кода).
+    На выходе из блока нарушения пишутся в лог (warning) или, при
+    raise_errors=True, поднимают RepeatedQueryError — для тестов.
+    """
+
+    def __init__(self, threshold, raise_errors=False, label=''):
+        self.threshold = threshold
+        self.raise_errors = raise_errors
+        self.label = label
+        self.counts = Counter()
+        self.violations = {}  # форма -> место вызова
+
+    def record(self, sql):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+        if self.counts[shape] == self.threshold + 1:
+            self.violations[shape] = _call_site()
+
+    def report(self):
+        return [
+            f"{self.counts[shape]}× {shape[:200]}\n    at {site}"
+            for shape, site in self.violations.items()
+        ]
+
+    def __enter__(self):
+        install()
+        # вложенные блоки (тест вокруг запроса с middleware) видят все запросы
+        self._token = current.set(current.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current.reset(self._token)
+        if exc_type is not None or not self.violations:
+            return
+        message = f"Повторяющиеся запросы{' в ' + self.label if self.label else ''}:\n" + "\n".join(self.report())
+        if self.raise_errors:
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+
+
+current = contextvars.ContextVar('query_shapes', default=())
+
+
+def _record_shape(execute, sql, params, many, context):
+    for shapes in current.get():
+        shapes.record(sql)
+    return execute(sql, params, many, context)
+
+
+def _add_shape_wrapper(connection, **kwargs):
+    if _record_shape not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_shape)
+
+
+def install():
+    """execute_wrapper на всех соединениях (и новых — через connection_created)."""
+    connection_created.connect(_add_shape_wrapper, dispatch_uid='core.queryshapes')
+    for connection in connections.all(initialized_only=True):
+        _add_shape_wrapper(connection)
+
+
+def forbid_repeated_queries(threshold=None):
+    """
+    Для тестов: with forbid_repeated_queries(): self.client.get(...)
+    падает с RepeatedQueryError, если какая-то форма запроса
+    повторилась больше threshold (по умолчанию NPLUSONE_THRESHOLD) раз.
+    """
+    return QueryShapes(threshold or settings.NPLUSONE_THRESHOLD, raise_errors=True)
@@ -0,0 +1,85 @@
+import re
+
+from django.db import connection, models
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+
+# поля поиска по умолчанию (строка поиска в списке участников и у контролёра)
+SEARCH_FIELDS = ('full_name', 'email', 'phone')
+
+# поля с GIN-индексом gin_trgm_ops, см. миграцию 0016
+TRIGRAM_FIELDS = ('full_name', 'email', 'phone_digits', 'note')
+
+_NON_DIGITS = re.compile(r'\D+')
+_PHONE_LIKE = re.compile(r'^[\d\s()+\-.]+$')
+
+
+def phone_digits(value):
+    """«+7 (999) 123-45-67» -> «79991234567»."""
+    return _NON_DIGITS.sub('', value or '')
+
+
+class RegistrationQuerySet(models.QuerySet):
+
+    def search(self, query, fields=SEARCH_FIELDS, ranked=True):
+        """
+        Поиск участников по подстроке в fields (full_name, email, phone, note).
+
+        phone ищется по нормализованной колонке phone_digits, поэтому
+        «999 123» находит «+7 (999) 123-45-67». На Postgres подстрочный
+        icontains обслуживается trigram GIN-индексами по UPPER(поле),
+        а при ranked=True результаты сортируются по триграммной похожести
+        (аннотация search_rank). На остальных бэкендах — обычный icontains
+        без ранжирования.
+        """
+        query = (query or '').strip()
+        if not query:
+            return self
+
+        condition = Q()
+        columns = []
+        for field in fields:
+            if field == 'phone':
+                # телефон ищем, только если запрос похож на номер
+                digits = phone_digits(query)
+                if digits and _PHONE_LIKE.match(query):
+                    condition |= Q(phone_digits__contains=digits)
+                    columns.append('phone_digits')
+            else:
+                condition |= Q(**{f'{field}__icontains': query})
+                columns.append(field)
+
+        queryset = self.filter(condition)
+        if ranked and columns and connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramWordSimilarity
+
+            scores = [TrigramWordSimilarity(query, column) for column in columns]
+            rank = Greatest(*scores) if len(scores) > 1 else scores[0]
+            queryset = queryset.annotate(search_rank=rank).order_by('-search_rank', 'id')
+        return queryset
+
+
+def filter_participants(registrations, params):
+    """
+    Фильтры списка участников (view_participants / export_participants_xlsx).
+    Возвращает (queryset, search, checkin_filter, note_query).
+    """
+    # Поиск по имени, e-mail и телефону (порядок задаёт вызывающий)
+    search = params.get('search', '')
+    if search:
+        registrations = registrations.search(search, ranked=False)
+
+    # Фильтр по статусу
+    checkin_filter = params.get('checked_in')
+    if checkin_filter == 'yes':
+        registrations = registrations.filter(checked_in=True)
+    elif checkin_filter == 'no':
+        registrations = registrations.filter(checked_in=False)
+
+    # Поиск по примечанию
+    note_query = params.get('note_contains', '')
+    if note_query:
+        registrations = registrations.search(note_query, fields=('note',), ranked=False)
+
+    return registrations, search, checkin_filter, note_query
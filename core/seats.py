@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .models import Event, Registration
+from .outbox import enqueue_email
+
+
+def promote_waitlist(event):
+    """
+    Переводит участников из листа ожидания на освободившиеся места
+    (в порядке регистрации). Каждое место занимается тем же условным
+    UPDATE, что и при регистрации (Event.reserve_seat), поэтому
+    параллельные отмены и регистрации не дают перебора.
+    Повышенным участникам уходит письмо. Возвращает их id.
+    """
+    promoted = []
+    waiting = Registration.objects.filter(event_id=event.id, waitlisted=True)
+    while True:
+        candidate = waiting.order_by('created_at', 'id').first()
+        if candidate is None or not Event.reserve_seat(event.id):
+            break
+        if waiting.filter(id=candidate.id).update(waitlisted=False):
+            promoted.append(candidate.id)
+            _notify_promoted(event, candidate)
+        else:
+            Event.release_seat(event.id)  # участника уже повысил параллельный вызов
+    return promoted
+
+
+def _notify_promoted(event, registration):
+    access_link = settings.SITE_URL.rstrip('/') + reverse(
+        'access_event', kwargs={'access_token': registration.access_token}
+    )
+    body = render_to_string('emails/waitlist_promoted.txt', {
+        'full_name': registration.full_name,
+        'event': event,
+        'access_link': access_link,
+    })
+    enqueue_email(registration.email, f"Освободилось место: {event.title}", body,
+                  registration=registration)
+
+
+@transaction.atomic
+def cancel_registration(registration):
+    """Отмена регистрации: место освобождается и достаётся первому из листа ожидания."""
+    event = registration.event
+    registration.delete()  # место возвращает post_delete (release_registration_seat)
+    return promote_waitlist(event)
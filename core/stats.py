@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import EventStats, ActivityStats, Feedback, RatingHistogram
+
+
+def _histogram_fields(rows):
+    """[(rating, n), ...] -> {'rating_1': n, ...} (неизвестные оценки отбрасываются)."""
+    fields = {fld: 0 for fld in RatingHistogram.RATING_FIELDS.values()}
+    for rating, n in rows:
+        fld = RatingHistogram.RATING_FIELDS.get(rating)
+        if fld:
+            fields[fld] += n
+    return fields
+
+
+@transaction.atomic
+def rebuild_event_stats(event):
+    """
+    Пересчитывает EventStats и ActivityStats мероприятия с нуля.
+    Запросов — фиксированное число, независимо от числа активностей.
+    """
+    counters = event.registrations.aggregate(
+        registrations=Count('id'),
+        checked_in=Count('id', filter=Q(checked_in=True)),
+    )
+    event_rows = (Feedback.objects.filter(event=event)
+                  .values_list('rating').annotate(n=Count('id')).order_by())
+    stats, _ = EventStats.objects.update_or_create(
+        event=event,
+        defaults={**counters, **_histogram_fields(event_rows)},
+    )
+
+    by_activity = {}
+    activity_rows = (Feedback.objects.filter(activity__event=event)
+                     .values_list('activity_id', 'rating').annotate(n=Count('id')).order_by())
+    for activity_id, rating, n in activity_rows:
+        by_activity.setdefault(activity_id, []).append((rating, n))
+
+    ActivityStats.objects.filter(event=event).delete()
+    ActivityStats.objects.bulk_create([
+        ActivityStats(activity_id=activity_id, event=event,
+                      **_histogram_fields(by_activity.get(activity_id, ())))
+        for activity_id in event.schedule_items.values_list('id', flat=True)
+    ])
+    EventStats.bump(event.id)  # пересчёт — тоже новая версия данных
+    stats.refresh_from_db()
+    return stats
+
+
+def get_event_stats(event):
+    """
+    Контекст для event_stats / event_stats_pdf из rollup-таблиц:
+    одна строка EventStats + строки ActivityStats мероприятия.
+    """
+    stats = EventStats.objects.filter(event=event).first()
+    if stats is None:
+        # строки нет (удалена вручную): пересобирает первый запрос,
+        # параллельные ждут на блокировке строки и читают готовую статистику
+        with transaction.atomic():
+            stats, created = EventStats.objects.get_or_create(event=event)
+            stats = EventStats.objects.select_for_update().get(pk=stats.pk)
+            if created:
+                stats = rebuild_event_stats(event)
+
+    activity_stats = (
+        ActivityStats.objects.filter(event=event)
+        .select_related('activity')
+        .order_by('activity__start_time', 'activity_id')
+    )
+
+    return {
+        'event': event,
+        'total': stats.registrations,
+        'attended': stats.checked_in,
+        'missed': stats.registrations - stats.checked_in,
+        'avg_rating': stats.avg_rating,
+        'activity_data': [
+            {
+                'title': a.activity.title,
+                'avg_rating': a.avg_rating or 0,
+                'feedback_count': a.feedback_count,
+            }
+            for a in activity_stats
+        ],
+    }
@@ -0,0 +1,84 @@
+from django.db import connection
+from django.db.models import Avg, Count, F, Prefetch, Window
+from django.db.models.functions import RowNumber
+
+from .models import Feedback, Material
+
+
+def _feedback_rows():
+    # отзывы всегда показываются с именем участника
+    return Feedback.objects.select_related('registration').order_by('created_at', 'id')
+
+
+def event_feedback_summary(event):
+    """
+    Отзывы и рейтинги мероприятия и всех его активностей
+    за фиксированное число запросов (не зависит от числа активностей).
+
+    Возвращает dict:
+        schedule              – активности с предзагруженными materials
+        feedback_event        – отзывы о мероприятии в целом
+        avg_event_rating      – средняя оценка мероприятия (или None)
+        feedback_by_activity  – {activity.id: {'activity', 'feedbacks',
+                                 'avg_rating', 'feedback_count'}}
+    """
+    schedule = list(
+        event.schedule_items
+        .annotate(avg_rating=Avg('feedback__rating'),
+                  feedback_count=Count('feedback'))
+        .prefetch_related(
+            Prefetch('feedback_set', queryset=_feedback_rows(), to_attr='feedbacks'),
+            Prefetch('materials', queryset=Material.objects.order_by('id')),
+        )
+        .order_by('start_time', 'id')
+    )
+
+    feedback_event = list(_feedback_rows().filter(event=event))
+    ratings = [fb.rating for fb in feedback_event]
+    avg_event_rating = sum(ratings) / len(ratings) if ratings else None
+
+    feedback_by_activity = {
+        activity.id: {
+            'activity': activity,
+            'feedbacks': activity.feedbacks,
+            'avg_rating': activity.avg_rating,
+            'feedback_count': activity.feedback_count,
+        }
+        for activity in schedule
+    }
+
+    return {
+        'schedule': schedule,
+        'feedback_event': feedback_event,
+        'avg_event_rating': avg_event_rating,
+        'feedback_by_activity': feedback_by_activity,
+    }
+
+
+def _latest_activity_feedbacks(registration):
+    """
+    Последний отзыв участника по каждой активности — queryset для одного запроса.
+
+    На Postgres — DISTINCT ON (activity_id), на остальных бэкендах —
+    ROW_NUMBER() OVER (PARTITION BY activity_id).
+    """
+    feedbacks = Feedback.objects.filter(registration=registration, activity__isnull=False)
+    newest_first = (F('created_at').desc(nulls_last=True), F('id').desc())
+
+    if connection.features.can_distinct_on_fields:
+        feedbacks = feedbacks.order_by('activity_id', *newest_first).distinct('activity_id')
+    else:
+        feedbacks = feedbacks.annotate(
+            row_number=Window(RowNumber(), partition_by='activity_id', order_by=newest_first)
+        ).filter(row_number=1)
+
+    return feedbacks
+
+
+def latest_activity_feedbacks(registration):
+    """{activity_id: последний Feedback участника}."""
+    return {fb.activity_id: fb for fb in _latest_activity_feedbacks(registration)}
+
+
+async def alatest_activity_feedbacks(registration):
+    return {fb.activity_id: fb async for fb in _latest_activity_feedbacks(registration)}
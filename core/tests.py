@@ -1,3 +1,1421 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Event, ScheduleItem, Material, Registration, Feedback, Profile, ControllerProfile,
+    EventStats, ActivityStats, CheckInEvent, ExportJob, OutboundEmail, Broadcast, MaterialUpload,
+)
+from .stats import rebuild_event_stats
+from .checkin import apply_checkin_batch, apply_roster, checkin_throughput, set_checkin
+from .export_jobs import request_export, claim_next_job, cleanup_exports, run_job
+from .exports import stats_pdf_bytes, write_participants_xlsx
+from .imports import import_registrations
+from .live import CheckinHub
+from .metrics import registry as metrics_registry
+from .profiling import recent_captures
+from .queryshapes import RepeatedQueryError, fingerprint, forbid_repeated_queries
+from .outbox import MAX_ATTEMPTS, claim_batch, deliver
+from .broadcasts import schedule_broadcast, enqueue_broadcast, enqueue_due_broadcasts
+from .seats import cancel_registration, promote_waitlist
+from .dedupe import duplicate_registrations, merge_duplicates, _merge_group
+from . import broadcasts, checkin, imports, pdf, uploads
+
+
+def make_organizer(username='org'):
+    user = User.objects.create_user(username=username, password='pass', email=f'{username}@example.com')
+    Profile.objects.create(user=user, role='organizer')
+    return user
+
+
+def make_event(user, sessions=0, **kwargs):
+    start = timezone.now() - timedelta(days=1)
+    event = Event.objects.create(
+        title='Конференция', date=start, end_date=start + timedelta(hours=8),
+        created_by=user, **kwargs
+    )
+    for i in range(sessions):
+        ScheduleItem.objects.create(
+            event=event, title=f'Доклад {i}',
+            start_time=start + timedelta(minutes=30 * i),
+            end_time=start + timedelta(minutes=30 * i + 25),
+        )
+    return event
+
+
+class EventDetailQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = make_organizer()
+        self.client.force_login(self.user)
+
+    def _fill(self, event):
+        reg = Registration.objects.create(event=event, full_name='Иван', email='ivan@example.com', phone='1')
+        Feedback.objects.create(registration=reg, event=event, text='ok', rating=5)
+        for item in event.schedule_items.all():
+            Feedback.objects.create(registration=reg, activity=item, text='ok', rating=4)
+
+    def _count_queries(self, event):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('event_detail', args=[event.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        small = make_event(self.user, sessions=2)
+        large = make_event(self.user, sessions=20)
+        self._fill(small)
+        self._fill(large)
+
+        self.assertEqual(self._count_queries(small), self._count_queries(large))
+
+    def test_ratings(self):
+        event = make_event(self.user, sessions=2)
+        self._fill(event)
+        response = self.client.get(reverse('event_detail', args=[event.id]))
+
+        self.assertEqual(response.context['avg_event_rating'], 5)
+        for data in response.context['feedback_by_activity'].values():
+            self.assertEqual(data['avg_rating'], 4)
+            self.assertEqual(data['feedback_count'], 1)
+
+
+class EventStatsRollupTests(TestCase):
+    def setUp(self):
+        self.user = make_organizer()
+        self.client.force_login(self.user)
+        self.event = make_event(self.user, sessions=3)
+
+    def _snapshot(self):
+        response = self.client.get(reverse('event_stats', args=[self.event.id]))
+        self.assertEqual(response.status_code, 200)
+        ctx = response.context
+        return ctx['total'], ctx['attended'], ctx['avg_rating'], ctx['activity_data']
+
+    def test_counters_follow_changes_and_match_rebuild(self):
+        regs = [
+            Registration.objects.create(event=self.event, full_name=f'P{i}', email=f'p{i}@example.com', phone='1')
+            for i in range(4)
+        ]
+        regs[0].checked_in = True
+        regs[0].save(update_fields=['checked_in'])
+        regs[1].checked_in = True
+        regs[1].save()
+        regs[3].delete()
+
+        item = self.event.schedule_items.first()
+        Feedback.objects.create(registration=regs[0], event=self.event, text='a', rating=5)
+        Feedback.objects.create(registration=regs[1], event=self.event, text='b', rating=3)
+        fb = Feedback.objects.create(registration=regs[0], activity=item, text='c', rating=2)
+        fb.rating = 4
+        fb.save()
+
+        live = self._snapshot()
+        self.assertEqual(live[:3], (3, 2, 4))
+        self.assertEqual(live[3][0], {'title': item.title, 'avg_rating': 4, 'feedback_count': 1})
+
+        rebuild_event_stats(self.event)
+        self.assertEqual(self._snapshot(), live)
+
+    def test_missing_rollup_is_rebuilt_on_read(self):
+        Registration.objects.create(event=self.event, full_name='P', email='p@example.com', phone='1')
+        EventStats.objects.filter(event=self.event).delete()
+
+        self.assertEqual(self._snapshot()[0], 1)
+
+    def test_migration_backfills_existing_events(self):
+        reg = Registration.objects.create(event=self.event, full_name='P', email='p@example.com',
+                                          phone='1', checked_in=True)
+        item = self.event.schedule_items.first()
+        Feedback.objects.create(registration=reg, event=self.event, text='a', rating=5)
+        Feedback.objects.create(registration=reg, activity=item, text='b', rating=2)
+        expected = self._snapshot()
+        EventStats.objects.all().delete()
+        ActivityStats.objects.all().delete()
+
+        migration = importlib.import_module('core.migrations.0012_eventstats_activitystats')
+        migration.backfill_stats(django_apps, None)
+
+        self.assertEqual(ActivityStats.objects.filter(event=self.event).count(), 3)
+        self.assertEqual(self._snapshot(), expected)
+
+
+class AccessViaTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_organizer()
+
+    def _page(self, sessions):
+        event = make_event(self.user, sessions=sessions)
+        reg = Registration.objects.create(event=event, full_name='Иван', email='ivan@example.com', phone='1')
+        for item in event.schedule_items.all():
+            Material.objects.create(event=event, schedule_item=item, file='materials/slides.pdf', description='Слайды')
+            Feedback.objects.create(registration=reg, activity=item, text='старый', rating=2)
+            Feedback.objects.create(registration=reg, activity=item, text='новый', rating=5)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('access_event', args=[reg.access_token]))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        _, small = self._page(sessions=2)
+        _, large = self._page(sessions=20)
+        self.assertEqual(small, large)
+
+    def test_latest_feedback_per_activity(self):
+        response, _ = self._page(sessions=3)
+        feedbacks = response.context['activity_feedbacks']
+        self.assertEqual(len(feedbacks), 3)
+        self.assertEqual({fb.text for fb in feedbacks.values()}, {'новый'})
+
+    def test_shared_fragments_are_cached_per_event_version(self):
+        event = make_event(self.user, sessions=2)
+        reg = Registration.objects.create(event=event, full_name='Иван', email='ivan@example.com', phone='1')
+        url = reverse('access_event', args=[reg.access_token])
+
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url)
+        self.assertLess(len(warm.captured_queries), len(cold.captured_queries))
+
+        Material.objects.create(event=event, file='materials/new.pdf', description='Новая программа')
+        self.assertContains(self.client.get(url), 'Новая программа')
+
+        item = event.schedule_items.first()
+        item.title = 'Переименованный доклад'
+        item.save()
+        self.assertContains(self.client.get(url), 'Переименованный доклад')
+
+
+class AsyncPublicViewsTests(TestCase):
+    """Публичные async-представления через ASGI-клиент."""
+
+    def setUp(self):
+        cache.clear()
+        self.event = make_event(make_organizer(), sessions=1)
+        self.activity = self.event.schedule_items.get()
+        self.reg = Registration.objects.create(event=self.event, full_name='Иван',
+                                               email='ivan@example.com', phone='1')
+
+    async def test_register_queues_email_once(self):
+        url = reverse('public_register', args=[self.event.id])
+        data = {'full_name': 'Пётр', 'email': 'petr@example.com', 'phone': '2', 'idempotency_key': 'k1'}
+        for _ in range(2):
+            response = await self.async_client.post(url, data)
+            self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(await Registration.objects.filter(email='petr@example.com').acount(), 1)
+        self.assertEqual(await OutboundEmail.objects.filter(to_email='petr@example.com').acount(), 1)
+
+    async def test_access_page_and_feedback(self):
+        response = await self.async_client.get(reverse('access_event', args=[self.reg.access_token]))
+        self.assertContains(response, 'Доклад 0')
+
+        response = await self.async_client.post(
+            reverse('leave_feedback_token', args=[self.reg.access_token]), {'rating': 5, 'text': 'Отлично'})
+        self.assertEqual(response.json()['feedback']['rating'], 5)
+
+        response = await self.async_client.post(
+            reverse('leave_activity_feedback_api', args=[self.reg.access_token, self.activity.id]),
+            {'rating': '4', 'text': 'Полезно'})
+        self.assertEqual(response.json()['activity_id'], self.activity.id)
+        self.assertEqual(await Feedback.objects.filter(registration=self.reg).acount(), 2)
+
+        missing = await self.async_client.get(reverse('access_event', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(missing.status_code, 404)
+
+
+class ControllerTestCase(TestCase):
+    def setUp(self):
+        self.organizer = make_organizer()
+        self.event = make_event(self.organizer)
+        self.event.end_date = timezone.now() + timedelta(days=1)
+        self.event.save()
+        self.regs = [
+            Registration.objects.create(event=self.event, full_name=f'P{i}', email=f'p{i}@example.com',
+                                        phone='1', checked_in=i < 2)
+            for i in range(5)
+        ]
+        controller = User.objects.create_user(username='ctrl', password='pass')
+        Profile.objects.create(user=controller, role='controller')
+        ControllerProfile.objects.create(user=controller, event=self.event)
+        self.controller = controller
+        self.client.force_login(controller)
+
+
+class ControllerRosterTests(ControllerTestCase):
+    def shown(self):
+        return {reg.id: reg.checked_in for reg in self.regs}
+
+    def test_apply_roster_updates_only_changed_rows(self):
+        # было: 0, 1 пришли; отмечаем 1, 2, 3
+        checked_ids = [self.regs[1].id, self.regs[2].id, self.regs[3].id]
+        with CaptureQueriesContext(connection) as ctx:
+            changed = apply_roster(self.event, self.shown(), checked_ids)
+
+        self.assertEqual(changed, 3)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_registration"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            set(self.event.registrations.filter(checked_in=True).values_list('id', flat=True)),
+            set(checked_ids),
+        )
+        self.assertEqual(EventStats.objects.get(event=self.event).checked_in, 3)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_checkinevent"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(CheckInEvent.objects.values_list('registration_id', 'checked_in', 'changed')),
+            {(self.regs[0].id, False, True), (self.regs[2].id, True, True), (self.regs[3].id, True, True)},
+        )
+
+    def test_concurrent_marks_are_not_overwritten(self):
+        shown = self.shown()  # форма загружена
+        set_checkin(self.event.id, self.regs[4].id, True, station='door-2')
+        set_checkin(self.event.id, self.regs[2].id, True, station='door-2')
+
+        # в форме 4 не отмечен (не трогали), 2 — отмечен тем же контролёром
+        changed = apply_roster(self.event, shown, [self.regs[0].id, self.regs[1].id, self.regs[2].id])
+
+        self.assertEqual(changed, 0)
+        self.assertTrue(Registration.objects.get(id=self.regs[4].id).checked_in)
+        self.assertEqual(EventStats.objects.get(event=self.event).checked_in, 4)
+        self.assertEqual(CheckInEvent.objects.filter(station='').count(), 0)
+
+    def test_controller_panel_post(self):
+        data = {f'shown_{reg.id}': '1' if reg.checked_in else '0' for reg in self.regs}
+        data[str(self.regs[4].id)] = 'on'
+        response = self.client.post(reverse('controller_panel'), data)
+        self.assertRedirects(response, reverse('controller_panel'), fetch_redirect_response=False)
+        self.assertEqual(
+            list(self.event.registrations.filter(checked_in=True).values_list('id', flat=True)),
+            [self.regs[4].id],
+        )
+        scan = CheckInEvent.objects.get(registration=self.regs[4])
+        self.assertEqual(scan.user, self.controller)
+
+    def test_controller_panel_renders_roster_form(self):
+        response = self.client.get(reverse('controller_panel'))
+        self.assertEqual(len(response.context['registrations']), 5)
+        self.assertContains(response, f'name="shown_{self.regs[0].id}" value="1"')
+        self.assertContains(response, f'name="{self.regs[2].id}"')
+
+
+class BatchCheckinTests(ControllerTestCase):
+    def _post(self, items):
+        return self.client.post(reverse('batch_checkin', args=[self.event.id]),
+                                data=json.dumps({'items': items}), content_type='application/json')
+
+    def test_batch_is_idempotent_and_reports_per_item(self):
+        items = [
+            {'registration_id': self.regs[2].id, 'checked_in': True, 'client_timestamp': '2025-05-01T10:00:00Z'},
+            {'access_token': str(self.regs[0].access_token), 'checked_in': True},
+            {'registration_id': self.regs[3].id, 'checked_in': True, 'client_timestamp': '2025-05-01T10:05:00Z'},
+            {'registration_id': self.regs[3].id, 'checked_in': False, 'client_timestamp': '2025-05-01T10:01:00Z'},
+            {'registration_id': 999999, 'checked_in': True},
+            {'checked_in': 'yes'},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._post(items).json()
+        statuses = [r['status'] for r in data['results']]
+        self.assertEqual(statuses, ['updated', 'unchanged', 'updated', 'superseded', 'not_found', 'invalid'])
+        self.assertEqual(data['changed'], 2)
+        permission_checks = [q for q in ctx.captured_queries if 'core_controllerprofile' in q['sql']]
+        self.assertEqual(len(permission_checks), 1)
+
+        replay = self._post(items).json()
+        self.assertEqual(replay['changed'], 0)
+        self.assertEqual(EventStats.objects.get(event=self.event).checked_in, 4)
+
+    def test_results_follow_actual_updates_and_every_scan_is_logged(self):
+        items = [
+            {'registration_id': self.regs[2].id, 'checked_in': False, 'client_timestamp': '2025-05-01T10:00:00Z'},
+            {'registration_id': self.regs[2].id, 'checked_in': True, 'client_timestamp': '2025-05-01T10:01:00Z'},
+            {'registration_id': self.regs[3].id, 'checked_in': True},
+        ]
+        set_checked_in = checkin._set_checked_in
+
+        def racing(*args):
+            # другой контролёр отметил 3 после чтения пакета, до UPDATE
+            set_checkin(self.event.id, self.regs[3].id, True, station='door-2')
+            return set_checked_in(*args)
+
+        with mock.patch.object(checkin, '_set_checked_in', racing):
+            results, changed = apply_checkin_batch(self.event, items)
+
+        self.assertEqual([r['status'] for r in results], ['superseded', 'updated', 'unchanged'])
+        self.assertEqual(changed, 1)
+        self.assertEqual(
+            list(CheckInEvent.objects.filter(station='').order_by('id').values_list('registration_id', 'checked_in', 'changed')),
+            [(self.regs[2].id, False, False), (self.regs[2].id, True, True), (self.regs[3].id, True, False)],
+        )
+
+    def test_batch_forbidden_for_strangers(self):
+        self.client.force_login(make_organizer('other'))
+        self.assertEqual(self._post([]).status_code, 403)
+
+
+class ToggleCheckinTests(ControllerTestCase):
+    def _post(self, reg, **data):
+        return self.client.post(reverse('toggle_checkin', args=[self.event.id, reg.id]), data)
+
+    def test_set_semantics_and_log(self):
+        reg = self.regs[2]
+        first = self._post(reg, checked_in='1', station='door-1').json()
+        second = self._post(reg, checked_in='1', station='door-2').json()
+
+        self.assertEqual(first, {'checked': True, 'changed': True})
+        self.assertEqual(second, {'checked': True, 'changed': False})
+        reg.refresh_from_db()
+        self.assertTrue(reg.checked_in)
+        self.assertEqual(EventStats.objects.get(event=self.event).checked_in, 3)
+        self.assertEqual(
+            list(CheckInEvent.objects.order_by('id').values_list('station', 'changed')),
+            [('door-1', True), ('door-2', False)],
+        )
+        self.assertEqual(sum(row['scans'] for row in checkin_throughput(self.event)), 2)
+
+    def test_repeat_scan_is_two_statements(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(set_checkin(self.event.id, self.regs[0].id, True))
+        statements = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual([sql.split()[0] for sql in statements], ['UPDATE', 'INSERT'])
+        self.assertFalse(CheckInEvent.objects.get().changed)
+
+    def test_toggle_without_value_and_missing_registration(self):
+        self.assertEqual(self._post(self.regs[0]).status_code, 400)
+        self.assertTrue(Registration.objects.get(id=self.regs[0].id).checked_in)
+        other = make_event(self.organizer)
+        stranger = Registration.objects.create(event=other, full_name='X', email='x@example.com', phone='1')
+        self.assertEqual(self._post(stranger, checked_in='1').status_code, 404)
+        self.assertFalse(CheckInEvent.objects.exists())
+
+
+class CheckinLiveTests(ControllerTestCase):
+    async def test_hub_shares_one_producer_and_pushes_arrivals(self):
+        hub = CheckinHub(interval=0.01)
+        first, second = hub.subscribe(self.event.id), hub.subscribe(self.event.id)
+        self.assertEqual(hub.producers(), 1)
+
+        snapshot = await asyncio.wait_for(first.get(), 2)
+        self.assertEqual((snapshot['type'], snapshot['checked_in'], snapshot['registrations']),
+                         ('snapshot', 2, 5))
+
+        await sync_to_async(set_checkin)(self.event.id, self.regs[3].id, True, station='door-1')
+        for queue in (first, second):
+            message = await asyncio.wait_for(queue.get(), 2)
+            while message['type'] == 'snapshot':
+                message = await asyncio.wait_for(queue.get(), 2)
+            self.assertEqual((message['checked_in'], message['delta']), (3, 1))
+            self.assertEqual([(a['name'], a['station']) for a in message['arrivals']], [('P3', 'door-1')])
+
+        # новый экран сразу получает снимок с последними пришедшими
+        late = hub.subscribe(self.event.id)
+        self.assertEqual(late.get_nowait()['arrivals'][0]['name'], 'P3')
+
+        for queue in (first, second, late):
+            hub.unsubscribe(self.event.id, queue)
+        await asyncio.sleep(0)
+        self.assertEqual(hub.producers(), 0)
+
+    async def test_stream_sends_snapshot(self):
+        await self.async_client.aforce_login(self.controller)
+        response = await self.async_client.get(reverse('checkin_live', args=[self.event.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        chunk = (await asyncio.wait_for(anext(stream), 2)).decode()
+        await stream.aclose()
+        self.assertTrue(chunk.startswith('event: checkin\n'))
+        self.assertEqual(json.loads(chunk.split('data: ', 1)[1])['checked_in'], 2)
+
+    def test_stream_forbidden_for_strangers(self):
+        self.client.force_login(make_organizer('other'))
+        response = self.client.get(reverse('checkin_live', args=[self.event.id]))
+        self.assertEqual(response.status_code, 403)
+
+
+class ViewParticipantsPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_organizer()
+        self.client.force_login(self.user)
+        self.event = make_event(self.user)
+        Registration.objects.bulk_create([
+            Registration(event=self.event, full_name=f'Участник {i}', email=f'p{i}@example.com',
+                         phone='1', checked_in=i % 3 == 0, note='vip' if i % 2 else '')
+            for i in range(250)
+        ])
+
+    def _walk(self, **params):
+        base = reverse('view_participants', args=[self.event.id])
+        response = self.client.get(base, params)
+        pages = [response]
+        while response.context['next_url']:
+            response = self.client.get(base + response.context['next_url'])
+            pages.append(response)
+        return pages
+
+    def test_pages_cover_filtered_rows_in_order(self):
+        pages = self._walk(checked_in='no', note_contains='vip')
+        seen = [row['id'] for page in pages for row in page.context['registrations']]
+        expected = list(
+            self.event.registrations.filter(checked_in=False, note__icontains='vip')
+            .order_by('created_at', 'id').values_list('id', flat=True)
+        )
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(pages[0].context['counts'], {'total': len(expected), 'checked_in': 0, 'waitlisted': 0})
+
+    def test_next_and_prev(self):
+        pages = self._walk()
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[0].context['counts'], {'total': 250, 'checked_in': 84, 'waitlisted': 0})
+
+        base = reverse('view_participants', args=[self.event.id])
+        back = self.client.get(base + pages[1].context['prev_url'])
+        self.assertEqual(
+            [row['id'] for row in back.context['registrations']],
+            [row['id'] for row in pages[0].context['registrations']],
+        )
+        self.assertIsNone(back.context['prev_url'])
+
+
+class RegistrationSearchTests(TestCase):
+    def setUp(self):
+        self.event = make_event(make_organizer())
+        self.ivan = Registration.objects.create(event=self.event, full_name='Иван Петров', email='ivan@example.com',
+                                                phone='+7 (999) 123-45-67', note='VIP гость')
+        self.anna = Registration.objects.create(event=self.event, full_name='Анна Смирнова', email='anna@corp.ru',
+                                                phone='8 912 000 11 22')
+
+    def _ids(self, *args, **kwargs):
+        return set(self.event.registrations.search(*args, **kwargs).values_list('id', flat=True))
+
+    def test_search_fields(self):
+        self.assertEqual(self._ids('Петров'), {self.ivan.id})
+        self.assertEqual(self._ids('corp.ru'), {self.anna.id})
+        self.assertEqual(self._ids('999 123'), {self.ivan.id})
+        self.assertEqual(self._ids('vip', fields=('note',)), {self.ivan.id})
+        self.assertEqual(self._ids(''), {self.ivan.id, self.anna.id})
+
+    def test_phone_digits_follow_updates(self):
+        self.anna.phone = '+7-000-555'
+        self.anna.save(update_fields=['phone'])
+        self.anna.refresh_from_db()
+        self.assertEqual(self.anna.phone_digits, '7000555')
+
+
+class ExportParticipantsTests(TestCase):
+    def test_export_streams_filtered_rows(self):
+        user = make_organizer()
+        self.client.force_login(user)
+        event = make_event(user)
+        Registration.objects.create(event=event, full_name='Иван', email='ivan@example.com', phone='1', checked_in=True)
+        Registration.objects.create(event=event, full_name='Анна', email='anna@example.com', phone='2')
+
+        response = self.client.get(reverse('export_participants_xlsx', args=[event.id]), {'checked_in': 'yes'})
+
+        self.assertTrue(response.streaming)
+        wb = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        rows = list(wb['Участники'].values)
+        self.assertEqual(rows, [
+            ('ФИО', 'Email', 'Телефон', 'Посетил', 'Примечание'),
+            ('Иван', 'ivan@example.com', '1', 'Да', None),
+        ])
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = make_organizer()
+        self.client.force_login(self.user)
+        self.event = make_event(self.user)
+        self.reg = Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+
+    def test_same_request_reuses_job_until_data_changes(self):
+        first = request_export(self.event, 'participants_xlsx', {'search': 'Иван'})
+        self.assertEqual(request_export(self.event, 'participants_xlsx', {'search': 'Иван'}).id, first.id)
+        self.assertNotEqual(request_export(self.event, 'participants_xlsx', {}).id, first.id)
+
+        self.reg.note = 'VIP'
+        self.reg.save()
+        self.assertNotEqual(request_export(self.event, 'participants_xlsx', {'search': 'Иван'}).id, first.id)
+
+    def test_worker_builds_file_and_download_serves_it(self):
+        response = self.client.post(reverse('start_export', args=[self.event.id, 'participants_xlsx']))
+        self.assertEqual(response.json()['status'], 'pending')
+
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'done')
+        self.assertIsNone(claim_next_job())
+        # имя не выводится из cache_key / id мероприятия
+        self.assertRegex(job.file.name, r'^exports/[0-9a-f]{32}\.xlsx$')
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['progress'], 100)
+        download = self.client.get(status['download_url'])
+        wb = openpyxl.load_workbook(io.BytesIO(b''.join(download.streaming_content)))
+        self.assertEqual(list(wb['Участники'].values)[1][0], 'Иван')
+
+        # готовый файл отдаётся повторно без новой сборки
+        again = self.client.post(reverse('start_export', args=[self.event.id, 'participants_xlsx']))
+        self.assertEqual(again.json()['id'], job.id)
+        self.assertEqual(again.json()['status'], 'done')
+
+    def test_dead_worker_job_is_replaced(self):
+        job = request_export(self.event, 'stats_pdf', {})
+        claimed = claim_next_job()
+        ExportJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+
+        fresh = request_export(self.event, 'stats_pdf', {})
+        self.assertNotEqual(fresh.id, job.id)
+        self.assertEqual(ExportJob.objects.get(id=job.id).status, 'failed')
+        # «мёртвый» воркер всё же дошёл до конца — результат не сохраняется
+        self.assertEqual(run_job(claimed).status, 'failed')
+        self.assertFalse(ExportJob.objects.get(id=job.id).file)
+
+    def test_cleanup_removes_superseded_and_old_files(self):
+        request_export(self.event, 'stats_pdf', {})
+        old = run_job(claim_next_job())
+        self.reg.note = 'VIP'
+        self.reg.save()
+        request_export(self.event, 'stats_pdf', {})
+        new = run_job(claim_next_job())
+        old_path = old.file.path
+
+        self.assertEqual(cleanup_exports(), 1)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(list(ExportJob.objects.values_list('id', flat=True)), [new.id])
+
+        ExportJob.objects.update(finished_at=timezone.now() - timedelta(days=2))
+        call_command('run_export_worker', once=True, stdout=io.StringIO())
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_other_users_cannot_see_job(self):
+        job = request_export(self.event, 'stats_pdf', {})
+        self.client.force_login(make_organizer('other'))
+        self.assertEqual(self.client.get(reverse('export_status', args=[job.id])).status_code, 404)
+
+
+class PdfRenderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = make_event(make_organizer())
+
+    @override_settings(PDF_RENDER_WORKERS=0)
+    def test_unchanged_stats_page_is_served_from_cache(self):
+        with mock.patch.object(pdf, '_render', wraps=pdf._render) as render:
+            first = stats_pdf_bytes(self.event)
+            self.assertEqual(stats_pdf_bytes(self.event), first)
+            self.assertEqual(render.call_count, 1)
+
+            Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+            stats_pdf_bytes(self.event)
+            self.assertEqual(render.call_count, 2)
+
+    def test_font_config_is_per_thread(self):
+        main = pdf._get_font_config()
+        other = []
+        thread = threading.Thread(target=lambda: other.append(pdf._get_font_config()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(pdf._get_font_config(), main)
+        self.assertIsNot(other[0], main)
+
+    @override_settings(PDF_RENDER_WORKERS=1)
+    def test_renders_in_process_pool(self):
+        self.addCleanup(setattr, pdf, '_pool', None)
+        self.addCleanup(lambda: pdf._pool and pdf._pool.shutdown())
+
+        self.assertTrue(stats_pdf_bytes(self.event).startswith(b'%PDF'))
+        self.assertIsNotNone(pdf._pool)
+
+
+class PdfRenderTimeoutTests(TestCase):
+    @override_settings(PDF_RENDER_WORKERS=1, PDF_RENDER_TIMEOUT=0.01)
+    def test_timeout_discards_pool_and_returns_503(self):
+        from concurrent.futures import Future
+        hung = mock.Mock(_processes={1: mock.Mock()})
+        hung.submit.return_value = Future()  # не завершится никогда
+        self.addCleanup(setattr, pdf, '_pool', None)
+        pdf._pool = hung
+
+        cache.clear()
+        user = make_organizer()
+        event = make_event(user)
+        self.client.force_login(user)
+        response = self.client.get(reverse('event_stats_pdf', args=[event.id]))
+        self.assertEqual(response.status_code, 503)
+        hung._processes[1].terminate.assert_called_once()
+        hung.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertIsNone(pdf._pool)
+
+    def test_stylesheet_hashed_once_per_process(self):
+        self.addCleanup(pdf._stylesheet_digests.clear)
+        pdf._stylesheet_digests.clear()
+        with mock.patch('builtins.open', wraps=open) as opened:
+            first = pdf._cache_key('<p>1</p>', 'css/event_stats_pdf.css')
+            pdf._cache_key('<p>2</p>', 'css/event_stats_pdf.css')
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(pdf._cache_key('<p>1</p>', 'css/event_stats_pdf.css'), first)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.event = make_event(make_organizer(), registration_deadline=None)
+
+    def register(self, email='ivan@example.com'):
+        return self.client.post(reverse('public_register', args=[self.event.id]),
+                                {'full_name': 'Иван', 'email': email, 'phone': '+7 999 123-45-67'})
+
+    def test_registration_queues_email_instead_of_sending(self):
+        self.assertEqual(self.register().status_code, 302)
+
+        registration = Registration.objects.get()
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.registration, registration)
+        self.assertIn(str(registration.access_token), email.body)
+        self.assertEqual(mail.outbox, [])
+
+        call_command('send_outbox', '--once', stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ivan@example.com'])
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'sent')
+        self.assertIsNone(email.claim)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        self.register()
+        self.register('anna@example.com')
+
+        connection = mail.get_connection()
+        real_send = connection.send_messages
+
+        def flaky_send(messages):
+            if messages[0].to == ['anna@example.com']:
+                raise OSError('mailbox unavailable')
+            return real_send(messages)
+
+        with mock.patch.object(connection, 'send_messages', side_effect=flaky_send), \
+                self.assertLogs('core.outbox', 'WARNING'):
+            self.assertEqual(deliver(claim_batch(), connection), (1, 1))
+
+        failed = OutboundEmail.objects.get(to_email='anna@example.com')
+        self.assertEqual((failed.status, failed.attempts), ('pending', 1))
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        self.assertEqual(claim_batch(), [])  # до конца паузы письмо не берём
+
+        OutboundEmail.objects.filter(id=failed.id).update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        with mock.patch.object(connection, 'send_messages', side_effect=OSError('down')), \
+                self.assertLogs('core.outbox', 'WARNING'):
+            deliver(claim_batch(), connection)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'failed')
+
+
+    def test_slow_batch_renews_lease_and_skips_reclaimed(self):
+        self.register()
+        self.register('anna@example.com')
+        first, second = batch = claim_batch()
+        for email in batch:  # аренда почти истекла: медленный темп отправки
+            email.next_attempt_at = timezone.now() + timedelta(seconds=5)
+        # второе письмо уже забрал другой воркер
+        OutboundEmail.objects.filter(id=second.id).update(claim=uuid.uuid4())
+
+        self.assertEqual(deliver(batch, mail.get_connection()), (1, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['ivan@example.com']])
+        self.assertEqual(OutboundEmail.objects.get(id=first.id).status, 'sent')
+        other = OutboundEmail.objects.get(id=second.id)
+        self.assertEqual((other.status, other.attempts), ('sending', 0))
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        self.user = make_organizer()
+        self.client.force_login(self.user)
+        self.event = make_event(self.user)
+        self.event.date = timezone.now() + timedelta(days=3)
+        self.event.save()
+        self.regs = [
+            Registration.objects.create(event=self.event, full_name=f'Участник {i}',
+                                        email=f'user{i}@example.com', phone=str(i))
+            for i in range(3)
+        ]
+
+    def test_broadcast_reaches_every_registrant_with_own_link(self):
+        response = self.client.post(reverse('event_broadcasts', args=[self.event.id]),
+                                    {'subject': 'Смена аудитории', 'message': 'Встречаемся в зале B', 'when': 'now'})
+        self.assertEqual(response.status_code, 302)
+
+        call_command('send_outbox', '--once', stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        by_recipient = {m.to[0]: m.body for m in mail.outbox}
+        for reg in self.regs:
+            body = by_recipient[reg.email]
+            self.assertIn(reg.full_name, body)
+            self.assertIn(str(reg.access_token), body)
+            self.assertIn('Встречаемся в зале B', body)
+        self.assertEqual(Broadcast.objects.get().recipients, 3)
+
+        page = self.client.get(reverse('event_broadcasts', args=[self.event.id]))
+        self.assertContains(page, '3 / 3')
+
+    def test_enqueue_is_chunked_and_idempotent(self):
+        broadcast = schedule_broadcast(self.event, 'Тема', 'Текст')
+        with mock.patch.object(broadcasts, 'RECIPIENT_CHUNK', 2):
+            self.assertEqual(enqueue_broadcast(broadcast), 3)
+            enqueue_broadcast(broadcast)  # повтор после падения воркера
+        self.assertEqual(OutboundEmail.objects.filter(broadcast=broadcast).count(), 3)
+
+    def test_reminder_follows_event_date(self):
+        broadcast = schedule_broadcast(self.event, 'Уже завтра', 'Ждём вас', remind_before=timedelta(days=1))
+        self.assertEqual(enqueue_due_broadcasts(), 0)
+
+        self.event.date = timezone.now() + timedelta(hours=12)
+        self.event.save()
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.send_at, self.event.date - timedelta(days=1))
+
+        self.assertEqual(enqueue_due_broadcasts(), 1)
+        self.assertEqual(OutboundEmail.objects.filter(broadcast=broadcast).count(), 3)
+
+
+class CapacityTests(TestCase):
+    def setUp(self):
+        self.event = make_event(make_organizer(), capacity=2)
+
+    def register(self, i):
+        return Registration.objects.create(event=self.event, full_name=f'Участник {i}',
+                                           email=f'user{i}@example.com', phone=str(i))
+
+    def test_over_capacity_goes_to_waitlist(self):
+        regs = [self.register(i) for i in range(4)]
+
+        self.assertEqual([r.waitlisted for r in regs], [False, False, True, True])
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.seats_taken, self.event.seats_left), (2, 0))
+
+    def test_cancel_promotes_first_in_waitlist(self):
+        first, _, third, fourth = [self.register(i) for i in range(4)]
+
+        self.assertEqual(cancel_registration(first), [third.id])
+
+        third.refresh_from_db()
+        fourth.refresh_from_db()
+        self.assertFalse(third.waitlisted)
+        self.assertTrue(fourth.waitlisted)
+        self.assertTrue(OutboundEmail.objects.filter(registration=third).exists())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.seats_taken, 2)
+
+    def test_raising_capacity_promotes_waitlist(self):
+        [self.register(i) for i in range(4)]
+        self.event.capacity = 10
+        self.event.save()
+
+        self.assertEqual(len(promote_waitlist(self.event)), 2)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.seats_taken, 4)  # полное сохранение формы не затирает счётчик
+
+    def test_public_register_reports_waitlist(self):
+        self.register(0)
+        self.register(1)
+        response = self.client.post(reverse('public_register', args=[self.event.id]),
+                                    {'full_name': 'Иван', 'email': 'ivan@example.com', 'phone': '1'})
+
+        self.assertIn('waitlisted=1', response['Location'])
+        self.assertTrue(Registration.objects.get(email='ivan@example.com').waitlisted)
+        self.assertIn('Лист ожидания', OutboundEmail.objects.get(to_email='ivan@example.com').subject)
+
+
+class CapacityConcurrencyTests(TransactionTestCase):
+    def test_flash_crowd_never_oversells(self):
+        capacity, threads = 5, 20
+        event = make_event(make_organizer(), capacity=capacity)
+        barrier = threading.Barrier(threads)
+
+        def register(i):
+            try:
+                barrier.wait()
+                for _ in range(200):
+                    try:
+                        Registration.objects.create(event_id=event.id, full_name=f'Участник {i}',
+                                                    email=f'user{i}@example.com', phone=str(i))
+                        return
+                    except OperationalError:
+                        # SQLite: таблица занята другим потоком; попытка откатилась целиком
+                        time.sleep(0.005)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=register, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        event.refresh_from_db()
+        confirmed = event.registrations.filter(waitlisted=False).count()
+        self.assertEqual(event.registrations.count(), threads)
+        self.assertEqual(confirmed, capacity)
+        self.assertEqual(event.seats_taken, capacity)
+
+
+class RegistrationDedupeTests(TestCase):
+    def setUp(self):
+        self.event = make_event(make_organizer())
+        self.url = reverse('public_register', args=[self.event.id])
+
+    def post(self, email='ivan@example.com', key='key-1'):
+        return self.client.post(self.url, {'full_name': 'Иван', 'email': email, 'phone': '1',
+                                           'idempotency_key': key})
+
+    def test_retried_post_returns_original_result(self):
+        first = self.post()
+        second = self.post()
+
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual(Registration.objects.count(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertEqual(Registration.objects.get().idempotency_key, 'key-1')
+
+    def test_same_email_in_other_case_is_not_registered_twice(self):
+        self.post('ivan@example.com', key='key-1')
+        self.post('Ivan@Example.COM', key='key-2')
+
+        self.assertEqual(Registration.objects.count(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_form_carries_idempotency_key(self):
+        self.assertContains(self.client.get(self.url), 'name="idempotency_key"')
+
+    def test_same_key_on_other_event_registers(self):
+        other = make_event(self.event.created_by)
+        self.post(key='key-1')
+        response = self.client.post(reverse('public_register', args=[other.id]),
+                                    {'full_name': 'Иван', 'email': 'ivan@example.com', 'phone': '1',
+                                     'idempotency_key': 'key-1'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Registration.objects.filter(idempotency_key='key-1').count(), 2)
+        self.assertEqual(other.registrations.count(), 1)
+
+    def test_database_rejects_duplicate_email(self):
+        Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Registration.objects.create(event=self.event, full_name='Иван', email='IVAN@example.com', phone='1')
+
+    def test_merge_moves_history_to_kept_registration(self):
+        keep = Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+        dup = Registration.objects.create(event=self.event, full_name='Иван', email='ivan2@example.com',
+                                          phone='1', checked_in=True, note='VIP')
+        CheckInEvent.objects.create(event=self.event, registration=dup, checked_in=True, changed=True)
+
+        _merge_group(keep, [dup])
+
+        keep.refresh_from_db()
+        self.assertEqual((keep.checked_in, keep.note), (True, 'VIP'))
+        self.assertEqual(CheckInEvent.objects.get().registration, keep)
+        self.assertEqual(Registration.objects.count(), 1)
+        stats = EventStats.objects.get(event=self.event)
+        self.assertEqual((stats.registrations, stats.checked_in), (1, 1))
+        self.assertEqual(merge_duplicates(), (0, 0))
+
+
+class MergeDuplicatesMigrationTests(TransactionTestCase):
+    """Дубли, накопленные до 0022: слияние, затем уникальный индекс создаётся."""
+
+    before, latest = ('core', '0021_registration_idempotency_key'), ('core', '0024_registration_idempotency_per_event')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+
+    def test_case_variant_duplicates_are_merged(self):
+        event = make_event(make_organizer(), capacity=2)
+        self.migrate(self.before)
+        try:
+            keep = Registration.objects.create(event=event, full_name='Иван', email='ivan@example.com', phone='1')
+            dup = Registration.objects.create(event=event, full_name='Иван', email='IVAN@Example.com', phone='1',
+                                              checked_in=True, note='VIP')
+            waiting = Registration.objects.create(event=event, full_name='Анна', email='anna@example.com', phone='2')
+            CheckInEvent.objects.create(event=event, registration=dup, checked_in=True, changed=True)
+            self.assertTrue(waiting.waitlisted)
+            self.assertEqual([r.id for r in duplicate_registrations()], [keep.id, dup.id])
+
+            self.assertEqual(merge_duplicates(), (1, 1))
+        finally:
+            self.migrate(self.latest)
+
+        keep.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual((keep.checked_in, keep.note), (True, 'VIP'))
+        self.assertEqual(CheckInEvent.objects.get().registration, keep)
+        self.assertFalse(waiting.waitlisted)  # место дубля досталось листу ожидания
+        self.assertEqual(Registration.objects.count(), 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Registration.objects.create(event=event, full_name='Иван', email='Ivan@example.com', phone='1')
+
+
+class ImportRegistrationsTests(TestCase):
+    CSV = (
+        "\ufeffФИО;Email;Телефон;Примечание\n"
+        "Иван;ivan@example.com;+7 (999) 111-22-33;VIP\n"
+        "Без почты;not-an-email;1;\n"
+        "Анна;ANNA@example.com;2;\n"
+        "Анна снова;anna@example.com;3;\n"
+        "\n"
+        "Пётр;petr@example.com;4;\n"
+        "Олег;oleg@example.com;5;\n"
+    )
+
+    def setUp(self):
+        self.user = make_organizer()
+        self.event = make_event(self.user, capacity=3)
+        Registration.objects.create(event=self.event, full_name='Олег', email='Oleg@example.com', phone='5')
+
+    def test_csv_import_validates_skips_duplicates_and_fills_counters(self):
+        report = import_registrations(self.event, io.BytesIO(self.CSV.encode()), 'list.csv', batch_size=2)
+
+        self.assertEqual(
+            {k: v for k, v in report.items() if k != 'errors'},
+            {'total': 6, 'created': 3, 'waitlisted': 1, 'duplicates': 2, 'invalid': 1},
+        )
+        self.assertEqual(report['errors'][0]['line'], 3)
+        self.assertIn('email', report['errors'][0]['errors'])
+
+        ivan = Registration.objects.get(email='ivan@example.com')
+        self.assertEqual((ivan.phone_digits, ivan.note, ivan.waitlisted), ('79991112233', 'VIP', False))
+        self.assertTrue(Registration.objects.get(email='petr@example.com').waitlisted)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.seats_taken, 3)
+        self.assertEqual(EventStats.objects.get(event=self.event).registrations, 4)
+
+    def test_batch_is_retried_while_concurrent_registrations_win(self):
+        existing_emails = imports._existing_emails
+        calls = []
+
+        def stale(event, emails):
+            # первые два SELECT «не видят» Олега — как если бы он зарегистрировался сразу после них
+            calls.append(emails)
+            return set() if len(calls) <= 2 else existing_emails(event, emails)
+
+        csv_file = io.BytesIO("email;full_name;phone\noleg@example.com;Олег;5\nnew@example.com;Новый;1\n".encode())
+        with mock.patch.object(imports, '_existing_emails', stale):
+            report = import_registrations(self.event, csv_file, 'list.csv')
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((report['created'], report['duplicates'], report['invalid']), (1, 1, 0))
+
+    def test_batch_reported_as_errors_when_retries_run_out(self):
+        csv_file = io.BytesIO("email;full_name;phone\noleg@example.com;Олег;5\n".encode())
+        with mock.patch.object(imports, '_existing_emails', return_value=set()):
+            report = import_registrations(self.event, csv_file, 'list.csv')
+
+        self.assertEqual((report['created'], report['invalid']), (0, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertEqual(EventStats.objects.get(event=self.event).registrations, 1)
+
+    def test_xlsx_export_can_be_imported(self):
+        target = io.BytesIO()
+        write_participants_xlsx([['Иван', 'ivan@example.com', '1', 'Да', None]], target)
+        target.seek(0)
+
+        report = import_registrations(self.event, target, 'участники.xlsx')
+
+        self.assertEqual((report['created'], report['invalid']), (1, 0))
+
+    def test_upload_view_shows_report(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('list.csv', self.CSV.encode(), content_type='text/csv')
+
+        response = self.client.post(reverse('import_participants', args=[self.event.id]), {'file': upload})
+
+        self.assertEqual(response.context['report']['created'], 3)
+        self.assertContains(response, 'С ошибками')
+
+    def test_command_imports_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            f.write("email,full_name,phone\nnew@example.com,Новый,1\n".encode())
+            f.flush()
+            out = io.StringIO()
+            call_command('import_registrations', self.event.id, f.name, stdout=out)
+
+        self.assertIn('добавлено: 1', out.getvalue())
+        self.assertTrue(Registration.objects.filter(email='new@example.com').exists())
+
+
+@override_settings(PERF_METRICS=True)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        metrics_registry.clear()
+        self.user = make_organizer()
+        self.event = make_event(self.user, sessions=2)
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_prometheus_histograms(self):
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries", tpl;dur=[\d.]+, total;dur=[\d.]+')
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)  # не staff
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('event_manager_responses_total{route="event_detail",method="GET",status="200"} 1', text)
+        self.assertIn('event_manager_db_queries_bucket{route="event_detail",le="+Inf"} 1', text)
+        self.assertIn('event_manager_template_duration_seconds_count{route="event_detail"} 1', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.client.logout()
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+
+    @override_settings(PERF_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics_registry.exposition().count('_count{'), 0)
+
+
+class QueryShapeTests(TestCase):
+    def setUp(self):
+        self.user = make_organizer()
+        self.event = make_event(self.user, sessions=2)
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'  LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'y' LIMIT 1"),
+        )
+
+    def test_loop_query_raises_with_call_site(self):
+        with self.assertRaises(RepeatedQueryError) as ctx:
+            with forbid_repeated_queries(threshold=2):
+                for item in ScheduleItem.objects.all():
+                    Event.objects.get(id=item.event_id)
+                    Event.objects.get(id=item.event_id)
+        self.assertIn('core/tests.py', str(ctx.exception))
+        self.assertIn('4×', str(ctx.exception))
+
+    @override_settings(NPLUSONE_THRESHOLD=3)
+    def test_feedback_admin_changelist(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        reg = Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+        for item in self.event.schedule_items.all():
+            for _ in range(3):
+                Feedback.objects.create(registration=reg, activity=item, text='ok', rating=5)
+        self.client.force_login(admin_user)
+
+        with self.assertNoLogs('core.queryshapes', 'WARNING'), forbid_repeated_queries(threshold=3):
+            response = self.client.get(reverse('admin:core_feedback_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(NPLUSONE_THRESHOLD=1)
+    def test_middleware_logs_repeated_queries(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('core.queryshapes', 'WARNING') as logs:
+            self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.assertIn('GET /events/', logs.output[0])
+
+
+class MaterialDownloadTests(TestCase):
+    BODY = bytes(range(256)) * 4
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = make_organizer()
+        self.event = make_event(self.user)
+        self.material = Material.objects.create(
+            event=self.event, file=SimpleUploadedFile('slides.pdf', self.BODY), description='Слайды')
+        self.reg = Registration.objects.create(event=self.event, full_name='Иван', email='ivan@example.com', phone='1')
+        self.url = reverse('access_material', args=[self.reg.access_token, self.material.id])
+
+    def _body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_access_checks(self):
+        other = make_event(make_organizer('other'))
+        stranger = Registration.objects.create(event=other, full_name='Пётр', email='petr@example.com', phone='2')
+        self.assertEqual(self.client.get(reverse('access_material', args=[stranger.access_token, self.material.id])).status_code, 404)
+
+        url = reverse('download_material', args=[self.material.id])
+        self.client.force_login(User.objects.get(username='other'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.user)
+        self.assertEqual(self._body(self.client.get(url)), self.BODY)
+
+        # ссылки страницы участника — относительные, от access/<token>/
+        page = self.client.get(reverse('access_event', args=[self.reg.access_token]))
+        self.assertContains(page, f'href="materials/{self.material.id}/"')
+
+    def test_range_and_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self._body(response), self.BODY)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # mtime с долями секунды, If-Modified-Since — целые секунды
+        os.utime(self.material.file.path, ns=(1_700_000_000_500_000_000,) * 2)
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.BODY)}')
+        self.assertEqual(self._body(response), self.BODY[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self._body(response), self.BODY[-5:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.BODY)}-').status_code, 416)
+        # файл изменился (другой ETag в If-Range) — целиком
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_controller_can_download_and_links_hidden_for_others(self):
+        controller = User.objects.create_user(username='ctrl', password='pass')
+        Profile.objects.create(user=controller, role='controller')
+        ControllerProfile.objects.create(user=controller, event=self.event)
+        self.client.force_login(controller)
+        self.assertEqual(self._body(self.client.get(reverse('download_material', args=[self.material.id]))), self.BODY)
+        self.assertContains(self.client.get(reverse('event_detail', args=[self.event.id])),
+                            reverse('download_material', args=[self.material.id]))
+
+        # контролёр другого мероприятия
+        visitor = User.objects.create_user(username='visitor', password='pass')
+        Profile.objects.create(user=visitor, role='controller')
+        ControllerProfile.objects.create(user=visitor, event=make_event(make_organizer('other')))
+        self.client.force_login(visitor)
+        page = self.client.get(reverse('event_detail', args=[self.event.id]))
+        self.assertContains(page, 'Слайды')
+        self.assertNotContains(page, reverse('download_material', args=[self.material.id]))
+
+    def test_compressed_file_is_not_content_encoded(self):
+        archive = Material.objects.create(event=self.event, file=SimpleUploadedFile('slides.tar.gz', b'\x1f\x8b data'))
+        response = self.client.get(reverse('access_material', args=[self.reg.access_token, archive.id]))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self._body(response), b'\x1f\x8b data')
+
+    @override_settings(PROTECTED_MEDIA_SERVER='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.material.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(MATERIAL_UPLOAD_CHUNK_SIZE=10)
+class ChunkedUploadTests(TestCase):
+    BODY = b'0123456789abcdefghijklmnopqrstuvwxyz!'  # 4 части: 10+10+10+7
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = make_organizer()
+        self.event = make_event(self.user, sessions=1)
+        self.activity = self.event.schedule_items.get()
+        self.client.force_login(self.user)
+
+    def _start(self, **data):
+        data = {'filename': 'запись.mp4', 'size': len(self.BODY), 'description': 'Запись',
+                'activity': self.activity.id, **data}
+        response = self.client.post(reverse('material_upload_start', args=[self.event.id]), data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def _put(self, upload_id, index, body=None):
+        if body is None:
+            body = self.BODY[index * 10:(index + 1) * 10]
+        return self.client.put(reverse('material_upload_chunk', args=[upload_id, index]), body,
+                               content_type='application/octet-stream')
+
+    def test_resumable_upload_creates_material(self):
+        upload = self._start()
+        self.assertEqual(upload['next_chunk'], 0)
+        self.assertEqual(self._put(upload['id'], 0).json()['next_chunk'], 1)
+        self.assertEqual(self._put(upload['id'], 0).json()['next_chunk'], 1)  # повтор — no-op
+
+        response = self._put(upload['id'], 2)  # не по порядку
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['upload']['next_chunk'], 1)
+        self.assertEqual(self._put(upload['id'], 1, b'short').status_code, 400)
+
+        uploads._hashers.clear()  # следующая часть — в другом процессе: хэш посчитает finish
+        for index in (1, 2, 3):
+            self.assertEqual(self._put(upload['id'], index).status_code, 200)
+        self.assertNotIn(uuid.UUID(upload['id']), uploads._hashers)
+        self.assertEqual(self.client.get(reverse('material_upload', args=[upload['id']])).json()['complete'], True)
+
+        response = self.client.post(reverse('material_upload_finish', args=[upload['id']]))
+        self.assertEqual(response.status_code, 201)
+        material = Material.objects.get(id=response.json()['material_id'])
+        self.assertEqual(material.schedule_item, self.activity)
+        self.assertEqual(material.sha256, hashlib.sha256(self.BODY).hexdigest())
+        self.assertTrue(material.file.name.startswith('materials/'))
+        with material.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.BODY)
+        self.assertFalse(MaterialUpload.objects.exists())
+
+    def test_checksum_mismatch_and_other_user(self):
+        upload = self._start(sha256='0' * 64)
+        for index in range(4):
+            self._put(upload['id'], index)
+        response = self.client.post(reverse('material_upload_finish', args=[upload['id']]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['upload']['received'], 0)
+        self.assertFalse(Material.objects.exists())
+
+        self.client.force_login(make_organizer('other'))
+        self.assertEqual(self._put(upload['id'], 0).status_code, 404)
+
+    def test_sweeper_removes_abandoned_uploads(self):
+        stale, fresh = self._start(), self._start()
+        self._put(stale['id'], 0)
+        MaterialUpload.objects.filter(id=stale['id']).update(updated_at=timezone.now() - timedelta(days=2))
+        path = MaterialUpload.objects.get(id=stale['id']).file.path
+
+        call_command('sweep_material_uploads', hours=24, stdout=io.StringIO())
+        self.assertEqual([str(u.id) for u in MaterialUpload.objects.all()], [fresh['id']])
+        self.assertFalse(os.path.exists(path))
+
+
+class ProfilerCaptureTests(TestCase):
+    def setUp(self):
+        self.capture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.capture_dir, ignore_errors=True)
+        overrides = override_settings(PROFILE_CAPTURE_DIR=self.capture_dir, PROFILE_CAPTURE_LIMIT=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = make_organizer()
+        self.event = make_event(self.user, sessions=2)
+        self.url = reverse('event_detail', args=[self.event.id])
+
+    def test_staff_capture_listed_and_downloadable(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url + '?_profile=1'))  # не staff
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 404)
+
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.get(self.url + '?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        capture_id = response['X-Profile-Id']
+
+        page = self.client.get(reverse('profiles'))
+        self.assertContains(page, f'GET {self.url}?_profile=1')
+        self.assertContains(page, 'core_scheduleitem')  # форма SQL из трейса
+        self.assertContains(page, 'core/views.py')  # функция из профиля
+
+        download = self.client.get(reverse('profile_download', args=[capture_id]))
+        self.assertEqual(download.status_code, 200)
+        self.assertGreater(len(b''.join(download.streaming_content)), 0)
+        self.assertEqual(self.client.get(reverse('profile_download', args=['..'])).status_code, 404)
+
+    def test_ring_buffer_keeps_latest(self):
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        self.client.force_login(self.user)
+        ids = [self.client.get(self.url, HTTP_X_PROFILE='1')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.capture_dir)),
+                         sorted(f"{capture_id}{ext}" for capture_id in ids[1:] for ext in ('.json', '.prof')))
+
+    async def test_async_view_traces_sql_from_threads(self):
+        reg = await Registration.objects.acreate(event=self.event, full_name='Иван',
+                                                 email='ivan@example.com', phone='1')
+        await User.objects.filter(id=self.user.id).aupdate(is_staff=True)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('access_event', args=[reg.access_token]),
+                                               {'_profile': '1'})
+        self.assertIn('X-Profile-Id', response)
+        capture, = await sync_to_async(recent_captures)()
+        self.assertEqual(capture['route'], 'access_event')
+        self.assertGreater(capture['query_count'], 0)
+
+
+class LoadDataTests(TestCase):
+    def _seed(self):
+        call_command('seed_load_data', events=2, sessions=3, registrations=40, materials=2,
+                     seed=3, organizer='seed', stdout=io.StringIO())
+        return list(Registration.objects.order_by('id').values_list('full_name', 'access_token', 'checked_in'))
+
+    def test_seed_is_reproducible_and_counters_match(self):
+        first = self._seed()
+        self.assertEqual(len(first), 80)
+        for event in Event.objects.all():
+            stats = EventStats.objects.get(event=event)
+            self.assertEqual(stats.registrations, 40)
+            self.assertEqual(stats.checked_in, event.registrations.filter(checked_in=True).count())
+            self.assertEqual(event.seats_taken, 40)
+
+        Event.objects.all().delete()
+        User.objects.filter(username__startswith='seed-ctrl-').delete()
+        self.assertEqual(self._seed(), first)
+
+    def test_second_run_on_same_database(self):
+        self._seed()
+        self.assertEqual(len(self._seed()), 160)
+
+    def test_bench_views_fails_on_regression(self):
+        self._seed()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/baseline.json"
+            call_command('bench_views', repeat=1, baseline=path, update_baseline=True, stdout=io.StringIO())
+            with open(path) as fh:
+                baseline = json.load(fh)
+            self.assertEqual(set(baseline['views']), {
+                'event_detail', 'view_participants', 'access_via_token', 'event_stats',
+                'export_participants_xlsx', 'controller_panel',
+            })
+            self.assertTrue(all(v['queries'] > 0 for v in baseline['views'].values()))
+
+            baseline['views']['event_detail']['queries'] -= 1
+            with open(path, 'w') as fh:
+                json.dump(baseline, fh)
+            with self.assertRaisesMessage(CommandError, 'event_detail: SQL-запросов'):
+                call_command('bench_views', repeat=1, baseline=path, tolerance=100, stdout=io.StringIO())
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Material, MaterialUpload
+
+
+BLOCK_SIZE = 64 * 1024  # чтение тела PUT и досчёт хэша
+HASHER_CACHE = 256  # незавершённых загрузок с состоянием sha256 в памяти процесса
+
+
+class UploadError(Exception):
+    """Запрос загрузки отклонён: code — для JSON-ответа, status — HTTP-статус."""
+
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+# upload.id -> (сколько байт учтено, sha256). Хэш считается потоково, пока
+# части одной загрузки приходят в тот же процесс (обычный случай: клиент шлёт
+# их по очереди, балансировщик — sticky или воркер один). Если часть попала в
+# другой процесс или он перезапустился, потоковый хэш бросается и файл
+# хэшируется один раз целиком в finish_upload — без перечитывания на каждой части.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _take_hasher(upload):
+    """Состояние sha256 ровно на upload.received байт или None."""
+    with _hashers_lock:
+        entry = _hashers.pop(upload.id, None)
+    if entry is not None and entry[0] == upload.received:
+        return entry[1]
+    return hashlib.sha256() if upload.received == 0 else None
+
+
+def _hash_file(upload):
+    sha = hashlib.sha256()
+    with open(upload.file.path, 'rb') as fh:
+        remaining = upload.received
+        while remaining:
+            block = fh.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            sha.update(block)
+            remaining -= len(block)
+    return sha
+
+
+def _keep_hasher(upload, sha):
+    with _hashers_lock:
+        _hashers[upload.id] = (upload.received, sha)
+        while len(_hashers) > HASHER_CACHE:
+            _hashers.popitem(last=False)
+
+
+def _forget_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+
+def upload_status(upload):
+    return {
+        'id': str(upload.id),
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': upload.chunk_size,
+        'next_chunk': upload.received // upload.chunk_size,
+        'complete': upload.received == upload.size,
+    }
+
+
+def start_upload(event, user, filename, size, description='', schedule_item=None, sha256=''):
+    """
+    Начало загрузки: проверяет размер и резервирует итоговое имя файла
+    (пустой файл в хранилище, как у Material.file). Хранилище — локальное:
+    части пишутся по storage.path().
+    """
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError('invalid', "Не указано имя файла.")
+    if not 0 < size <= settings.MATERIAL_UPLOAD_MAX_SIZE:
+        raise UploadError('too_large', f"Размер файла — от 1 байта до {settings.MATERIAL_UPLOAD_MAX_SIZE} байт.")
+    if len(description) > MaterialUpload._meta.get_field('description').max_length:
+        raise UploadError('invalid', "Слишком длинное описание.")
+
+    field = Material._meta.get_field('file')
+    name = field.generate_filename(None, filename)
+    while True:
+        name = field.storage.get_available_name(name)
+        path = field.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            open(path, 'xb').close()  # x — имя не займёт параллельная загрузка
+            break
+        except FileExistsError:
+            continue
+    try:
+        return MaterialUpload.objects.create(
+            event=event, schedule_item=schedule_item, created_by=user, description=description,
+            file=name, size=size, chunk_size=settings.MATERIAL_UPLOAD_CHUNK_SIZE, sha256=sha256.lower(),
+        )
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def _spool(stream, length):
+    """Тело части — во временный файл (в памяти до FILE_UPLOAD_MAX_MEMORY_SIZE), блоками."""
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+                                          dir=settings.FILE_UPLOAD_TEMP_DIR)
+    remaining = length
+    while remaining:
+        block = stream.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            spool.close()
+            raise UploadError('incomplete', "Часть получена не полностью.")
+        spool.write(block)
+        remaining -= len(block)
+    spool.seek(0)
+    return spool
+
+
+def write_chunk(upload, index, stream, length):
+    """
+    Дописывает часть index (length байт из stream) в конец файла. Повтор
+    уже принятой части — no-op; часть не по порядку — 409 со статусом,
+    чтобы клиент продолжил с next_chunk.
+
+    Тело сначала читается из сети во временный файл — без транзакции:
+    медленный клиент не держит соединение с БД и блокировку строки. Под
+    блокировкой — только проверка received, дозапись с диска и условный
+    UPDATE ... WHERE received = start. Хвост оборванной попытки отрезается следующей.
+    """
+    start = index * upload.chunk_size
+    if index < 0 or start >= upload.size:
+        raise UploadError('out_of_range', "Номер части вне файла.")
+    expected = min(upload.chunk_size, upload.size - start)
+    if length != expected:
+        raise UploadError('bad_length', f"Часть {index} должна быть {expected} байт.")
+    if start + expected <= upload.received:
+        return upload
+    if start != upload.received:
+        raise UploadError('out_of_order', "Ожидается другая часть.", status=409)
+
+    with _spool(stream, length) as spool:
+        with transaction.atomic():
+            upload = MaterialUpload.objects.select_for_update().get(pk=upload.pk)
+            if start + expected <= upload.received:
+                return upload  # параллельный повтор успел раньше
+            if start != upload.received:
+                raise UploadError('out_of_order', "Ожидается другая часть.", status=409)
+
+            sha = _take_hasher(upload)
+            with open(upload.file.path, 'r+b') as fh:
+                fh.seek(start)
+                fh.truncate()
+                while block := spool.read(BLOCK_SIZE):
+                    fh.write(block)
+                    if sha is not None:
+                        sha.update(block)
+            upload.received = start + length
+            upload.updated_at = timezone.now()
+            MaterialUpload.objects.filter(pk=upload.pk, received=start).update(
+                received=upload.received, updated_at=upload.updated_at,
+            )
+    if sha is not None:
+        _keep_hasher(upload, sha)
+    return upload
+
+
+def finish_upload(upload):
+    """
+    Все байты приняты — создаёт Material на уже записанном файле. Если
+    клиент прислал sha256 и он не совпал — загрузка сбрасывается на начало.
+    """
+    with transaction.atomic():
+        upload = MaterialUpload.objects.select_for_update().get(pk=upload.pk)
+        if upload.received != upload.size:
+            raise UploadError('incomplete', "Файл загружен не полностью.", status=409)
+        digest = (_take_hasher(upload) or _hash_file(upload)).hexdigest()
+        if not upload.sha256 or upload.sha256 == digest:
+            material = Material.objects.create(
+                event=upload.event, schedule_item=upload.schedule_item,
+                file=upload.file.name, description=upload.description, sha256=digest,
+            )
+            _forget_hasher(upload.id)
+            upload.delete()
+            return material
+        upload.received = 0
+        upload.save(update_fields=['received', 'updated_at'])
+    with open(upload.file.path, 'r+b') as fh:
+        fh.truncate()
+    raise UploadError('checksum_mismatch', "Контрольная сумма не совпала — загрузите файл заново.", status=409)
+
+
+def discard_upload(upload):
+    """Отмена: удаляет файл и запись (если загрузку не завершили параллельно)."""
+    with transaction.atomic():
+        upload = MaterialUpload.objects.select_for_update().filter(pk=upload.pk).first()
+        if upload is None:
+            return False
+        upload.file.storage.delete(upload.file.name)
+        _forget_hasher(upload.id)
+        upload.delete()
+    return True
+
+
+def sweep_uploads(older_than):
+    """Удаляет загрузки без новых частей дольше older_than (timedelta). Возвращает их число."""
+    cutoff = timezone.now() - older_than
+    swept = 0
+    for upload in MaterialUpload.objects.filter(updated_at__lt=cutoff).only('pk'):
+        with transaction.atomic():
+            # часть могла прийти после выборки
+            stale = MaterialUpload.objects.select_for_update().filter(pk=upload.pk, updated_at__lt=cutoff).first()
+            if stale is None:
+                continue
+            stale.file.storage.delete(stale.file.name)
+            stale.delete()
+        _forget_hasher(upload.pk)
+        swept += 1
+    return swept
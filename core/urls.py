@@ -16,15 +16,31 @@ urlpatterns = [
     path('events/create/', views.create_event, name='create_event'),
     path('events/<int:event_id>/schedule/add/', views.add_schedule_item, name='add_schedule_item'),
     path('events/<int:event_id>/materials/add/', views.add_material, name='add_material'),
+    path('events/<int:event_id>/materials/uploads/', views.material_upload_start, name='material_upload_start'),
+    path('materials/uploads/<uuid:upload_id>/', views.material_upload, name='material_upload'),
+    path('materials/uploads/<uuid:upload_id>/chunks/<int:index>/', views.material_upload_chunk,
+         name='material_upload_chunk'),
+    path('materials/uploads/<uuid:upload_id>/finish/', views.material_upload_finish, name='material_upload_finish'),
     path('events/<int:event_id>/register/', views.register_for_event, name='register_for_event'),
     path('events/<int:event_id>/feedback/', views.leave_feedback, name='leave_feedback'),
     path('events/<int:event_id>/participants/', views.view_participants, name='view_participants'),
     path('events/<int:event_id>/participants/<int:registration_id>/checkin/', views.toggle_checkin,
          name='toggle_checkin'),
+    path('events/<int:event_id>/participants/checkin/batch/', views.batch_checkin, name='batch_checkin'),
+    path('events/<int:event_id>/checkin/live/', views.checkin_live, name='checkin_live'),
     path('events/<int:event_id>/participants/<int:registration_id>/note/', views.update_note, name='update_note'),
     path('events/<int:event_id>/participants/export/', views.export_participants_xlsx, name='export_participants_xlsx'),
+    path('events/<int:event_id>/participants/import/', views.import_participants, name='import_participants'),
+    path('events/<int:event_id>/exports/<str:kind>/', views.start_export, name='start_export'),
+    path('exports/<int:job_id>/', views.export_status, name='export_status'),
+    path('exports/<int:job_id>/download/', views.export_download, name='export_download'),
+    path('events/<int:event_id>/broadcasts/', views.event_broadcasts, name='event_broadcasts'),
+    path('broadcasts/<int:broadcast_id>/cancel/', views.cancel_broadcast, name='cancel_broadcast'),
     path('register/<int:event_id>/', views.public_register, name='public_register'),
     path('access/<uuid:access_token>/', views.access_via_token, name='access_event'),
+    path('access/<uuid:access_token>/materials/<int:material_id>/', views.access_material,
+         name='access_material'),
+    path('access/<uuid:access_token>/cancel/', views.cancel_registration_via_token, name='cancel_registration'),
     path('events/<int:event_id>/activity/<int:activity_id>/material/add/', views.add_material_to_activity,
          name='add_material_to_activity'),
     path('feedback/<uuid:access_token>/', views.leave_feedback_token, name='leave_feedback_token'),
@@ -34,11 +50,15 @@ urlpatterns = [
     # path('my-events/', views.my_events, name='my_events'),
     path('events/<int:event_id>/stats/', views.event_stats, name='event_stats'),
     path('events/<int:event_id>/stats/pdf/', views.event_stats_pdf, name='event_stats_pdf'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<str:capture_id>.prof', views.profile_download, name='profile_download'),
     path('events/<int:event_id>/edit/', views.edit_event, name='edit_event'),
     path('events/<int:event_id>/delete/', views.delete_event, name='delete_event'),
     path('schedule/<int:item_id>/edit/', views.edit_schedule_item, name='edit_schedule_item'),
     path('schedule/<int:item_id>/delete/', views.delete_schedule_item, name='delete_schedule_item'),
     path('materials/<int:material_id>/delete/', views.delete_material, name='delete_material'),
+    path('materials/<int:material_id>/', views.download_material, name='download_material'),
     path(
         'feedback/<uuid:access_token>/activity/<int:activity_id>/api/',
         views.leave_activity_feedback_api,
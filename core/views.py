@@ -1,24 +1,48 @@
-from django.db.models import Avg, Q
+import json
+import uuid
+from django.db.models import Count, Q
 from django.utils import timezone
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.utils.timezone import localtime
 from .forms import StyledRegisterForm, ControllerRegistrationForm
 from django.contrib.auth import login
-from .models import Profile, ControllerProfile, Feedback, Material
+from .models import Profile, ControllerProfile, Feedback, Material, MaterialUpload, ExportJob, Broadcast
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_http_methods
 from .models import Event, ScheduleItem, Registration
-from .forms import EventForm, ScheduleItemForm, MaterialForm, FeedbackForm, PublicRegistrationForm
-import openpyxl
-from django.http import HttpResponse, JsonResponse, Http404
-from django.core.mail import send_mail
+from .forms import (
+    EventForm, ScheduleItemForm, MaterialForm, FeedbackForm, PublicRegistrationForm, BroadcastForm,
+    ImportRegistrationsForm,
+)
+from django.http import HttpResponse, JsonResponse, Http404, FileResponse, StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from django.contrib.auth.views import LoginView
 from babel.dates import format_datetime
 from core.dates import ru_dt
-from django.template.loader import render_to_string
-from weasyprint import HTML
+from core.summary import event_feedback_summary, alatest_activity_feedbacks
+from core.stats import get_event_stats
+from core.page_cache import aaccess_page_fragments
+from core.search import filter_participants
+from core.pagination import keyset_page, decode_cursor
+from core.exports import participants_xlsx_file, stats_pdf_bytes, XLSX_CONTENT_TYPE
+from core.pdf import PdfRenderTimeout
+from core.export_jobs import request_export, job_status, EXPORT_PARAMS
+from core.checkin import apply_roster, apply_checkin_batch, set_checkin, MAX_BATCH_SIZE
+from core.outbox import enqueue_email
+from core.broadcasts import schedule_broadcast
+from core.seats import promote_waitlist, cancel_registration
+from core.dedupe import find_registration, afind_registration
+from core.imports import import_registrations
+from core.live import event_stream
+from core.downloads import serve_protected
+from core.uploads import UploadError, start_upload, write_chunk, finish_upload, discard_upload, upload_status
+from core.metrics import registry as metrics_registry
+from core.profiling import recent_captures, capture_path
+from asgiref.sync import sync_to_async
 
 def index(request):
     return render(request, 'index.html')
@@ -74,18 +98,11 @@ def event_detail(request, event_id):
     if request.user.is_authenticated:
         is_registered = Registration.objects.filter(email=request.user.email, event=event).exists()
 
-    feedback_event = event.feedback_set.all()
-    avg_event_rating = feedback_event.aggregate(Avg('rating'))['rating__avg']
-
-    activities = event.schedule_items.all()
-    feedback_by_activity = {
-        activity.id: {
-            'activity': activity,
-            'feedbacks': activity.feedback_set.all(),
-            'avg_rating': activity.feedback_set.aggregate(Avg('rating'))['rating__avg'],
-        }
-        for activity in activities
-    }
+    summary = event_feedback_summary(event)
+    materials = event.materials.all()
+    controllers = event.controllerprofile_set.select_related('user')
+    # ссылки на файлы материалов — только тем, кому их отдаст download_material
+    can_download_materials = _can_check_in(request.user, event.id)
 
     public_link = request.build_absolute_uri(
         reverse('public_register', args=[event.id])
@@ -105,12 +122,16 @@ def event_detail(request, event_id):
     return render(request, 'event_detail.html', {
         'event': event,
         'is_registered': is_registered,
-        'feedback_event': feedback_event,
-        'avg_event_rating': avg_event_rating,
-        'feedback_by_activity': feedback_by_activity,
+        'schedule': summary['schedule'],
+        'materials': materials,
+        'controllers': controllers,
+        'feedback_event': summary['feedback_event'],
+        'avg_event_rating': summary['avg_event_rating'],
+        'feedback_by_activity': summary['feedback_by_activity'],
         'public_link': public_link,
         'facts': facts,
         'controller_public_link': controller_public_link,
+        'can_download_materials': can_download_materials,
     })
 
 
@@ -225,56 +246,131 @@ def view_participants(request, event_id):
     if not request.user.profile.role == 'organizer' or event.created_by != request.user:
         return redirect('event_detail', event_id=event_id)
 
-    registrations = event.registrations.all()
-
-    # Поиск по имени
-    search = request.GET.get('search', '')
-    if search:
-        registrations = registrations.filter(full_name__icontains=search)
+    registrations, search, checkin_filter, note_query = filter_participants(
+        event.registrations.all(), request.GET
+    )
 
-    # Фильтр по статусу
-    checkin_filter = request.GET.get('checked_in')
-    if checkin_filter == 'yes':
-        registrations = registrations.filter(checked_in=True)
-    elif checkin_filter == 'no':
-        registrations = registrations.filter(checked_in=False)
+    # одним агрегатом: найдено / из них пришли / в листе ожидания
+    counts = registrations.aggregate(
+        total=Count('id'),
+        checked_in=Count('id', filter=Q(checked_in=True)),
+        waitlisted=Count('id', filter=Q(waitlisted=True)),
+    )
 
-    # Поиск по примечанию
-    note_query = request.GET.get('note_contains', '')
-    if note_query:
-        registrations = registrations.filter(note__icontains=note_query)
+    # только отображаемые колонки; created_at и id — ключ пагинации
+    page = keyset_page(
+        registrations.values('id', 'created_at', 'full_name', 'email', 'phone', 'checked_in', 'waitlisted', 'note'),
+        after=decode_cursor(request.GET.get('after')),
+        before=decode_cursor(request.GET.get('before')),
+    )
 
     return render(request, 'view_participants.html', {
         'event': event,
-        'registrations': registrations,
+        'registrations': page['rows'],
+        'counts': counts,
+        **_page_urls(request, page),
         'search': search,
         'checkin_filter': checkin_filter,
         'note_query': note_query,
     })
 
 
+def _page_urls(request, page):
+    """Ссылки «назад» / «дальше» для keyset_page с сохранением остальных параметров."""
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+
+    def page_url(key, cursor):
+        if not cursor:
+            return None
+        params = query.copy()
+        params[key] = cursor
+        return f"?{params.urlencode()}"
+
+    return {
+        'next_url': page_url('after', page['next_cursor']),
+        'prev_url': page_url('before', page['prev_cursor']),
+    }
+
+
+def _can_check_in(user, event_id):
+    # доступ разрешён организатору-создателю или активному контролёру;
+    # один запрос вместо чтения Event + ControllerProfile
+    return Event.objects.filter(id=event_id).filter(
+        Q(created_by=user) |
+        Q(controllerprofile__user=user, controllerprofile__is_active=True)  # не деактивирован
+    ).exists()
+
+
+def _checkin_station(request):
+    return request.POST.get('station') or request.headers.get('X-Checkin-Station', '')
+
+
 @require_POST
 @login_required
 def toggle_checkin(request, event_id, registration_id):
-    event = get_object_or_404(Event, id=event_id)
+    if not _can_check_in(request.user, event_id):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    # --- ставим отметку: checked_in=1/0. «Переключить» без значения не принимаем:
+    # два одновременных переключения одного билета гасят друг друга ---
+    wanted = request.POST.get('checked_in')
+    if wanted is None:
+        return JsonResponse({'error': 'invalid', 'message': 'Не указан параметр checked_in.'}, status=400)
+    checked_in = wanted.lower() in ('1', 'true', 'on', 'yes')
+
+    changed = set_checkin(event_id, registration_id, checked_in,
+                          user=request.user, station=_checkin_station(request))
+    if changed is None:
+        raise Http404("Участник не найден")
+
+    return JsonResponse({'checked': checked_in, 'changed': changed})
+
+
+@login_required
+async def checkin_live(request, event_id):
+    """
+    Живые счётчики отметок и последние пришедшие (Server-Sent Events)
+    для экранов организатора и контролёра. Требует ASGI-сервер.
+    """
+    user = await request.auser()
+    if not await sync_to_async(_can_check_in)(user, event_id):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    response = StreamingHttpResponse(event_stream(event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не буферизует поток
+    return response
 
-    # --- доступ разрешён, если ---
-    is_organizer = request.user == event.created_by
-    is_controller = ControllerProfile.objects.filter(
-        user=request.user,
-        event=event,
-        is_active=True     # не деактивирован
-    ).exists()
 
-    if not (is_organizer or is_controller):
+@require_POST
+@login_required
+def batch_checkin(request, event_id):
+    """
+    Пакетные отметки со сканеров (в т.ч. повтор офлайн-очереди).
+    Тело — JSON: {"items": [{"access_token" | "registration_id",
+    "checked_in", "client_timestamp"}, ...]} или сам список.
+    Права проверяются один раз на пакет.
+    """
+    if not _can_check_in(request.user, event_id):
         return JsonResponse({'error': 'forbidden'}, status=403)
+    event = get_object_or_404(Event, id=event_id)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'invalid_json'}, status=400)
 
-    # --- меняем отметку ---
-    reg = get_object_or_404(Registration, id=registration_id, event=event)
-    reg.checked_in = not reg.checked_in
-    reg.save(update_fields=['checked_in'])
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'invalid', 'message': 'Ожидается список items.'}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': 'too_large', 'max_items': MAX_BATCH_SIZE}, status=400)
 
-    return JsonResponse({'checked': reg.checked_in})
+    results, changed = apply_checkin_batch(event, items, user=request.user,
+                                           station=request.headers.get('X-Checkin-Station', ''))
+    return JsonResponse({'changed': changed, 'results': results})
 
 
 @require_POST
@@ -301,6 +397,32 @@ def update_note(request, event_id, registration_id):
     return JsonResponse({'note': registration.note})
 
 
+@login_required
+def import_participants(request, event_id):
+    event = get_object_or_404(Event, id=event_id)
+
+    if request.user.profile.role != 'organizer' or event.created_by != request.user:
+        return redirect('event_detail', event_id=event_id)
+
+    report = None
+    if request.method == 'POST':
+        form = ImportRegistrationsForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                report = import_registrations(event, upload, upload.name)
+            except ValidationError as exc:
+                form.add_error('file', exc)
+    else:
+        form = ImportRegistrationsForm()
+
+    return render(request, 'import_participants.html', {
+        'event': event,
+        'form': form,
+        'report': report,
+    })
+
+
 @login_required
 def export_participants_xlsx(request, event_id):
     event = get_object_or_404(Event, id=event_id)
@@ -309,91 +431,175 @@ def export_participants_xlsx(request, event_id):
         return redirect('event_detail', event_id=event_id)
 
     # ❶ без select_related
-    registrations = event.registrations.all()
+    # --- применяем фильтры, как в списке участников ---
+    registrations, _, _, _ = filter_participants(event.registrations.all(), request.GET)
 
-    # --- применяем фильтры, как раньше ---
-    search = request.GET.get('search', '')
-    if search:
-        registrations = registrations.filter(full_name__icontains=search)
-
-    checkin_filter = request.GET.get('checked_in')
-    if checkin_filter == 'yes':
-        registrations = registrations.filter(checked_in=True)
-    elif checkin_filter == 'no':
-        registrations = registrations.filter(checked_in=False)
-
-    note_query = request.GET.get('note_contains', '')
-    if note_query:
-        registrations = registrations.filter(note__icontains=note_query)
-
-    # --- создаём xlsx ---
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Участники"
-
-    ws.append(['ФИО', 'Email', 'Телефон', 'Посетил', 'Примечание'])
-
-    for reg in registrations:
-        ws.append([
-            reg.full_name,
-            reg.email,
-            reg.phone,
-            'Да' if reg.checked_in else 'Нет',
-            reg.note
-        ])
-
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    # --- создаём xlsx (write_only) и отдаём его потоком ---
     filename = f"{event.title}_участники.xlsx".replace(" ", "_")
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
+    return FileResponse(
+        participants_xlsx_file(registrations),
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+@require_POST
+@login_required
+def start_export(request, event_id, kind):
+    event = get_object_or_404(Event, id=event_id)
+
+    if request.user != event.created_by or request.user.profile.role != 'organizer':
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    if kind not in EXPORT_PARAMS:
+        raise Http404("Неизвестный вид выгрузки")
 
+    job = request_export(event, kind, request.POST, user=request.user)
+    return JsonResponse(job_status(job))
 
-def public_register(request, event_id):
+
+def _get_own_export(request, job_id):
+    job = get_object_or_404(ExportJob.objects.select_related('event'), id=job_id)
+    if request.user != job.event.created_by:
+        raise Http404("Выгрузка не найдена")
+    return job
+
+
+@login_required
+def export_status(request, job_id):
+    return JsonResponse(job_status(_get_own_export(request, job_id)))
+
+
+@login_required
+def export_download(request, job_id):
+    job = _get_own_export(request, job_id)
+    if job.status != 'done':
+        raise Http404("Выгрузка ещё не готова")
+
+    ext = 'xlsx' if job.kind == 'participants_xlsx' else 'pdf'
+    title = 'участники' if job.kind == 'participants_xlsx' else 'статистика'
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=f"{job.event.title}_{title}.{ext}".replace(" ", "_"),
+    )
+
+
+@login_required
+def event_broadcasts(request, event_id):
     event = get_object_or_404(Event, id=event_id)
+
+    if request.user.profile.role != 'organizer' or event.created_by != request.user:
+        return redirect('event_detail', event_id=event_id)
+
+    if request.method == 'POST':
+        form = BroadcastForm(request.POST, event=event)
+        if form.is_valid():
+            schedule_broadcast(event, form.cleaned_data['subject'], form.cleaned_data['message'],
+                               remind_before=form.remind_before, user=request.user)
+            return redirect('event_broadcasts', event_id=event_id)
+    else:
+        form = BroadcastForm(event=event)
+
+    broadcasts = event.broadcasts.annotate(
+        sent=Count('emails', filter=Q(emails__status='sent')),
+        failed=Count('emails', filter=Q(emails__status='failed')),
+    ).order_by('-send_at')
+
+    return render(request, 'event_broadcasts.html', {
+        'event': event,
+        'form': form,
+        'broadcasts': broadcasts,
+    })
+
+
+@login_required
+@require_POST
+def cancel_broadcast(request, broadcast_id):
+    broadcast = get_object_or_404(Broadcast.objects.select_related('event'), id=broadcast_id)
+
+    if broadcast.event.created_by != request.user:
+        raise Http404("Рассылка не найдена")
+
+    # отменить можно только ещё не начатую
+    Broadcast.objects.filter(id=broadcast.id, status='scheduled').update(status='cancelled')
+    return redirect('event_broadcasts', event_id=broadcast.event_id)
+
+
+def _registration_email(event, registration, access_link, formatted_date):
+    """✉️ Тема и текст письма о регистрации (или о попадании в лист ожидания)."""
+    if registration.waitlisted:
+        subject = f"Лист ожидания: {event.title}"
+        status_line = (
+            f"Все места на мероприятие «{event.title}» заняты — вы в листе ожидания.\n"
+            f"Мы напишем, как только для вас освободится место.\n"
+        )
+    else:
+        subject = f"Регистрация на мероприятие: {event.title}"
+        status_line = f"Вы успешно зарегистрированы на мероприятие «{event.title}».\n"
+    message = (
+        f"Здравствуйте, {registration.full_name}!\n\n"
+        f"{status_line}"
+        f"Дата: {formatted_date}\n\n"
+        f"Ссылка для доступа к материалам и расписанию:\n{access_link}\n\n"
+        f"Пожалуйста, сохраните эту ссылку — она понадобится вам в день мероприятия.\n\n"
+        f"С уважением,\nОрганизаторы мероприятия"
+    )
+    return subject, message
+
+
+@sync_to_async
+def _save_public_registration(event, registration, access_link, formatted_date):
+    """
+    Регистрация и письмо в outbox одной транзакцией (async ORM транзакций
+    не умеет — поэтому целиком в потоке). Если параллельный запрос с тем же
+    ключом или e-mail успел первым, возвращает его регистрацию.
+    """
+    try:
+        # письмо отправляет manage.py send_outbox, запрос SMTP не ждёт
+        with transaction.atomic():
+            registration.save()  # занимает место или ставит в лист ожидания
+            subject, message = _registration_email(event, registration, access_link, formatted_date)
+            enqueue_email(registration.email, subject, message, registration=registration)
+    except IntegrityError:
+        existing = find_registration(event, registration.email, registration.idempotency_key)
+        if existing is None:
+            raise
+        return existing
+    return registration
+
+
+async def public_register(request, event_id):
+    event = await aget_object_or_404(Event, id=event_id)
     submitted = False
 
     # ⏳ Проверка срока регистрации ДО формы
     if event.registration_deadline and timezone.now() > event.registration_deadline:
         return render(request, 'registration_closed.html', {'event': event, 'no_auth_nav': True})
 
-    local_dt = timezone.localtime(event.date)
-    formatted_date = format_datetime(local_dt, "d MMMM y 'в' HH:mm", locale='ru')
     formatted_date = format_datetime(event.date, "d MMMM y 'в' HH:mm", locale='ru')
 
     if request.method == 'POST':
         form = PublicRegistrationForm(request.POST)
         if form.is_valid():
-            registration = form.save(commit=False)
-            registration.event = event
-            registration.save()
-
-            # 🎟️ Ссылка с токеном
-            access_link = request.build_absolute_uri(
-                reverse('access_event', kwargs={'access_token': registration.access_token})
-            )
-
-            # ✉️ Письмо
-            subject = f"Регистрация на мероприятие: {event.title}"
-            message = (
-                f"Здравствуйте, {registration.full_name}!\n\n"
-                f"Вы успешно зарегистрированы на мероприятие «{event.title}».\n"
-                f"Дата: {formatted_date}\n\n"
-                f"Ссылка для доступа к материалам и расписанию:\n{access_link}\n\n"
-                f"Пожалуйста, сохраните эту ссылку — она понадобится вам в день мероприятия.\n\n"
-                f"С уважением,\nОрганизаторы мероприятия"
-            )
-
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [registration.email],
-                fail_silently=False,
-            )
-
+            # повтор того же POST (двойной клик, ретрай с телефона) или тот же e-mail:
+            # отдаём исходный результат без второй записи и второго письма
+            idempotency_key = (request.POST.get('idempotency_key') or '')[:64] or None
+            registration = await afind_registration(event, form.cleaned_data['email'], idempotency_key)
+
+            if registration is None:
+                registration = form.save(commit=False)
+                registration.event = event
+                registration.idempotency_key = idempotency_key
+
+                # 🎟️ Ссылка с токеном (токен выдаётся при создании объекта)
+                access_link = request.build_absolute_uri(
+                    reverse('access_event', kwargs={'access_token': registration.access_token})
+                )
+                registration = await _save_public_registration(event, registration, access_link, formatted_date)
+
+            if registration.waitlisted:
+                return redirect(f"{request.path}?submitted=1&waitlisted=1")
             return redirect(f"{request.path}?submitted=1")
     else:
         form = PublicRegistrationForm()
@@ -403,16 +609,29 @@ def public_register(request, event_id):
         'form': form,
         'event': event,
         'submitted': submitted,
+        'waitlisted': request.GET.get('waitlisted'),
+        'idempotency_key': request.POST.get('idempotency_key') or uuid.uuid4().hex,
         'no_auth_nav': True,
     })
 
 
 
-def access_via_token(request, access_token):
-    registration = get_object_or_404(Registration, access_token=access_token)
+@require_POST
+def cancel_registration_via_token(request, access_token):
+    registration = get_object_or_404(
+        Registration.objects.select_related('event'), access_token=access_token
+    )
+    event = registration.event
+    cancel_registration(registration)
+    return render(request, 'registration_cancelled.html', {'event': event, 'no_auth_nav': True})
+
+
+async def access_via_token(request, access_token):
+    registration = await aget_object_or_404(
+        Registration.objects.select_related('event'), access_token=access_token
+    )
     event = registration.event
-    schedule = event.schedule_items.all()
-    materials = event.materials.all()
+    fragments = await aaccess_page_fragments(event)
     now = timezone.localtime()
 
     # Можем вычислить завершено ли мероприятие
@@ -422,41 +641,27 @@ def access_via_token(request, access_token):
     )
 
     # ➊ Есть ли уже отзыв от этого участника
-    feedback = (
+    feedback = await (
         Feedback.objects.filter(registration=registration,
                                 event=event,
                                 activity__isnull=True)  # только по мероприятию
-        .first()
+        .afirst()
     )
 
-    activity_feedbacks = {}
-    for item in schedule:
-        fb = (
-            Feedback.objects.filter(registration=registration, activity=item)
-            .order_by('-created_at')
-            .first()
-        )
-        if fb:
-            activity_feedbacks[item.id] = fb
-
-    facts = [
-        ("Дата проведения:", ru_dt(event.date)),
-        ("Окончание:", ru_dt(event.end_date)),
-        ("Место:", event.location or "(не указано)"),
-    ]
+    activity_feedbacks = await alatest_activity_feedbacks(registration)
 
     return render(request, 'access_event.html', {
         'registration': registration,
         'event': event,
-        'schedule': schedule,
-        'materials': materials,
+        'schedule': fragments['schedule'],
+        'materials_html': fragments['materials_html'],
         'event_over': event_over,
         'now': now,
         'can_leave_feedback': can_leave_feedback,
         'feedback': feedback,
         'activity_feedbacks': activity_feedbacks,
         'no_auth_nav': True,
-        'facts': facts,
+        'facts': fragments['facts'],
     })
 
 
@@ -486,16 +691,93 @@ def add_material_to_activity(request, event_id, activity_id):
     })
 
 
+def _upload_error(exc, upload=None):
+    data = {'error': exc.code, 'message': str(exc)}
+    if upload is not None:
+        data['upload'] = upload_status(upload)  # клиент продолжит с next_chunk
+    return JsonResponse(data, status=exc.status)
+
+
+@require_POST
+@login_required
+def material_upload_start(request, event_id):
+    """Начало загрузки материала по частям (core.uploads): id загрузки и размер части."""
+    event = get_object_or_404(Event, id=event_id)
+    if request.user.profile.role != 'organizer' or event.created_by != request.user:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    try:
+        size = int(request.POST.get('size', ''))
+        activity_id = int(request.POST['activity']) if request.POST.get('activity') else None
+    except ValueError:
+        return JsonResponse({'error': 'invalid', 'message': 'Некорректный размер или активность.'}, status=400)
+    activity = get_object_or_404(ScheduleItem, id=activity_id, event=event) if activity_id else None
+
+    try:
+        upload = start_upload(event, request.user, request.POST.get('filename'), size,
+                              description=request.POST.get('description', '').strip(),
+                              schedule_item=activity, sha256=request.POST.get('sha256', ''))
+    except UploadError as exc:
+        return _upload_error(exc)
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@require_http_methods(['GET', 'DELETE'])
+@login_required
+def material_upload(request, upload_id):
+    """Состояние загрузки (для продолжения после обрыва) или её отмена."""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, created_by=request.user)
+    if request.method == 'DELETE':
+        discard_upload(upload)
+        return JsonResponse({'deleted': True})
+    return JsonResponse(upload_status(upload))
+
+
+@require_http_methods(['PUT'])
+@login_required
+def material_upload_chunk(request, upload_id, index):
+    """Часть index: тело PUT читается потоком и дописывается в файл."""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, created_by=request.user)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or '')
+    except ValueError:
+        return JsonResponse({'error': 'length_required'}, status=411)
+
+    try:
+        upload = write_chunk(upload, index, request, length)
+    except UploadError as exc:
+        return _upload_error(exc, MaterialUpload.objects.filter(pk=upload.pk).first())
+    return JsonResponse(upload_status(upload))
+
+
+@require_POST
+@login_required
+def material_upload_finish(request, upload_id):
+    """Все части приняты — создаёт Material."""
+    upload = get_object_or_404(MaterialUpload, id=upload_id, created_by=request.user)
+    try:
+        material = finish_upload(upload)
+    except UploadError as exc:
+        return _upload_error(exc, MaterialUpload.objects.filter(pk=upload.pk).first())
+    return JsonResponse({
+        'material_id': material.id,
+        'sha256': material.sha256,
+        'redirect': reverse('event_detail', args=[material.event_id]),
+    }, status=201)
+
+
 @require_POST
-def leave_feedback_token(request, access_token, activity_id=None):
+async def leave_feedback_token(request, access_token, activity_id=None):
     # 1) ищем регистрацию и событие
-    registration = get_object_or_404(Registration, access_token=access_token)
+    registration = await aget_object_or_404(
+        Registration.objects.select_related('event'), access_token=access_token
+    )
     event = registration.event
 
     # 2) проверяем, что форма отзыва доступна по времени
     now = timezone.localtime()
     if activity_id:
-        activity = get_object_or_404(ScheduleItem, id=activity_id, event=event)
+        activity = await aget_object_or_404(ScheduleItem, id=activity_id, event=event)
         if activity.end_time > now:
             return JsonResponse(
                 {'error': 'too_early', 'message': 'Отзыв доступен после окончания активности.'},
@@ -521,7 +803,7 @@ def leave_feedback_token(request, access_token, activity_id=None):
         feedback.activity = activity
     else:
         feedback.event = event
-    feedback.save()
+    await feedback.asave()
 
     # 5) возвращаем результаты клиенту
     return JsonResponse({
@@ -535,10 +817,10 @@ def leave_feedback_token(request, access_token, activity_id=None):
 
 
 @require_POST
-def leave_activity_feedback_api(request, access_token, activity_id):
+async def leave_activity_feedback_api(request, access_token, activity_id):
     # ➊ Ищем регистрацию и мероприятие
-    registration = get_object_or_404(Registration, access_token=access_token)
-    activity = get_object_or_404(ScheduleItem, id=activity_id, event=registration.event)
+    registration = await aget_object_or_404(Registration, access_token=access_token)
+    activity = await aget_object_or_404(ScheduleItem, id=activity_id, event_id=registration.event_id)
     # ➋ Проверяем, что активность уже закончилась
     if timezone.localtime() < activity.end_time:
         return JsonResponse({'error': 'too_early'}, status=400)
@@ -548,7 +830,7 @@ def leave_activity_feedback_api(request, access_token, activity_id):
     if not rating or not text:
         return JsonResponse({'error': 'missing_fields'}, status=400)
     # ➍ Создаём и сохраняем отзыв
-    fb = Feedback.objects.create(
+    fb = await Feedback.objects.acreate(
         registration=registration,
         activity=activity,
         text=text,
@@ -586,26 +868,57 @@ def controller_panel(request):
     # Новый блок — фильтрация
     search = request.GET.get('search', '')
     if search:
-        registrations = registrations.filter(
-            Q(full_name__icontains=search) |
-            Q(phone__icontains=search)
-        )
+        registrations = registrations.search(search)
 
     if request.method == 'POST':
-        for reg in registrations:
-            checked_in = str(reg.id) in request.POST
-            if reg.checked_in != checked_in:
-                reg.checked_in = checked_in
-                reg.save()
-        return redirect('controller_panel')
+        # shown_<id> — отметка, которую контролёр видел, <id> — отмечен при отправке
+        shown = {int(key[6:]): value == '1' for key, value in request.POST.items()
+                 if key.startswith('shown_') and key[6:].isdigit()}
+        checked_ids = {int(key) for key in request.POST if key.isdigit()}
+        apply_roster(event, shown, checked_ids, user=request.user)
+        return redirect(request.get_full_path())
+
+    # страница карточек, а не всё мероприятие
+    page = keyset_page(
+        registrations.values('id', 'created_at', 'full_name', 'email', 'phone', 'checked_in', 'note'),
+        after=decode_cursor(request.GET.get('after')),
+        before=decode_cursor(request.GET.get('before')),
+    )
 
     return render(request, 'controller_panel.html', {
         'event': event,
-        'registrations': registrations,
+        'registrations': page['rows'],
         'search': search,  # ← передаём в шаблон
+        **_page_urls(request, page),
     })
 
 
+def metrics(request):
+    """Гистограммы запросов по маршрутам в текстовом формате Prometheus."""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    allowed = request.user.is_staff or (
+        settings.METRICS_TOKEN and constant_time_compare(token, settings.METRICS_TOKEN)
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(metrics_registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def profiles(request):
+    """Последние профили запросов (?_profile=1): топ функций и форм SQL."""
+    if not request.user.is_staff:
+        raise Http404
+    return render(request, 'profiles.html', {'captures': recent_captures()})
+
+
+def profile_download(request, capture_id):
+    """Файл pstats для snakeviz / python -m pstats."""
+    path = capture_path(capture_id) if request.user.is_staff else None
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f"{capture_id}.prof")
+
+
 # @login_required
 # def my_events(request):
 #     if request.user.profile.role != 'organizer':
@@ -622,31 +935,7 @@ def event_stats(request, event_id):
     if request.user.profile.role != 'organizer' or event.created_by != request.user:
         return redirect('event_detail', event_id=event_id)
 
-    registrations = event.registrations.all()
-    total = registrations.count()
-    attended = registrations.filter(checked_in=True).count()
-    missed = total - attended
-
-    avg_rating = event.feedback_set.aggregate(Avg('rating'))['rating__avg']
-
-    activity_data = []
-    for activity in event.schedule_items.all():
-        total_feedback = activity.feedback_set.count()
-        avg_activity_rating = activity.feedback_set.aggregate(Avg('rating'))['rating__avg']
-        activity_data.append({
-            'title': activity.title,
-            'avg_rating': avg_activity_rating or 0,
-            'feedback_count': total_feedback
-        })
-
-    return render(request, 'event_stats.html', {
-        'event': event,
-        'total': total,
-        'attended': attended,
-        'missed': missed,
-        'avg_rating': avg_rating,
-        'activity_data': activity_data,
-    })
+    return render(request, 'event_stats.html', get_event_stats(event))
 
 
 @login_required
@@ -656,33 +945,13 @@ def event_stats_pdf(request, event_id):
     if request.user.profile.role != 'organizer' or event.created_by != request.user:
         return redirect('event_detail', event_id=event_id)
 
-    registrations = event.registrations.all()
-    total = registrations.count()
-    attended = registrations.filter(checked_in=True).count()
-    missed = total - attended
-    avg_rating = event.feedback_set.aggregate(Avg('rating'))['rating__avg']
-
-    activity_data = []
-    for activity in event.schedule_items.all():
-        total_feedback = activity.feedback_set.count()
-        avg_activity_rating = activity.feedback_set.aggregate(Avg('rating'))['rating__avg']
-        activity_data.append({
-            'title': activity.title,
-            'avg_rating': avg_activity_rating or 0,
-            'feedback_count': total_feedback
-        })
-
-    context = {
-        'event': event,
-        'total': total,
-        'attended': attended,
-        'missed': missed,
-        'avg_rating': avg_rating,
-        'activity_data': activity_data,
-    }
-
-    html_string = render_to_string('event_stats_pdf.html', context)
-    pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
+    try:
+        pdf_file = stats_pdf_bytes(event)
+    except PdfRenderTimeout:
+        response = HttpResponse("PDF не успел сформироваться. Попробуйте позже или закажите фоновую выгрузку.",
+                                status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = '60'
+        return response
 
     return HttpResponse(pdf_file, content_type='application/pdf')
 
@@ -702,6 +971,8 @@ def edit_event(request, event_id):
         form = EventForm(request.POST, request.FILES, instance=event)
         if form.is_valid():
             form.save()
+            # лимит мог вырасти — освободившиеся места достаются листу ожидания
+            promote_waitlist(event)
             return redirect('event_detail', event_id=event.id)
     else:
         form = EventForm(instance=event)
@@ -817,6 +1088,24 @@ def delete_material(request, material_id):
     return redirect('event_detail', event_id=event.id)
 
 
+@login_required
+def download_material(request, material_id):
+    """Файл материала для организатора-создателя и активных контролёров мероприятия."""
+    material = get_object_or_404(Material, id=material_id)
+    if not _can_check_in(request.user, material.event_id):
+        raise Http404
+    return serve_protected(request, material.file)
+
+
+def access_material(request, access_token, material_id):
+    """Файл материала для участника по его ссылке access/<token>/."""
+    material = get_object_or_404(
+        Material, id=material_id,
+        event__registrations__access_token=access_token,
+    )
+    return serve_protected(request, material.file)
+
+
 def register_controller_by_token(request, token):
     event = get_object_or_404(Event, controller_token=token)
 
@@ -3,6 +3,9 @@ ASGI config for event_manager project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run with an ASGI server, e.g. ``uvicorn event_manager.asgi:application``;
+the live check-in stream (core.live) needs it.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -43,11 +43,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'widget_tweaks',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',  # первым: в замер входят остальные middleware
+    'core.middleware.QueryShapeMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilerMiddleware',  # последним: профиль снимается в process_view
 ]
 
 ROOT_URLCONF = 'event_manager.urls'
@@ -76,6 +80,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'event_manager.wsgi.application'
+# живые дашборды отметок (SSE, core.live) работают только под ASGI:
+# uvicorn event_manager.asgi:application
+ASGI_APPLICATION = 'event_manager.asgi.application'
 
 
 # Database
@@ -93,6 +100,46 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию — локальная память процесса; для общего кэша между воркерами
+# задайте DJANGO_CACHE_BACKEND (например, FileBasedCache или RedisCache)
+# и DJANGO_CACHE_LOCATION.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("DJANGO_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("DJANGO_CACHE_LOCATION", 'event-manager'),
+    }
+}
+
+
+# PDF (core/pdf.py): число процессов рендеринга WeasyPrint (0 — рендерить
+# в процессе запроса), таймаут одного рендера в секундах и число рендеров,
+# после которого процесс пересоздаётся (ограничивает рост памяти).
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_TIMEOUT = int(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+PDF_RENDER_MAX_TASKS = int(os.getenv("PDF_RENDER_MAX_TASKS", "200"))
+
+# замеры запросов: Server-Timing и гистограммы по маршрутам (core.metrics);
+# по умолчанию — только при DJANGO_DEBUG=True (DEBUG здесь — строка окружения,
+# «False» тоже непустая), в продакшене включается явно
+PERF_METRICS = os.getenv("PERF_METRICS", DEBUG or "False") == "True"
+# страница metrics/ — для staff или с заголовком Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# N+1: одна форма SQL-запроса больше NPLUSONE_THRESHOLD раз за HTTP-запрос —
+# warning в лог core.queryshapes (NPLUSONE_RAISE=True — исключение, для тестов); 0 — выкл.
+# Нормализует каждый SQL-запрос регулярными выражениями — по умолчанию только при DEBUG.
+NPLUSONE_THRESHOLD = int(os.getenv("NPLUSONE_THRESHOLD", "10" if DEBUG == "True" else "0"))
+NPLUSONE_RAISE = os.getenv("NPLUSONE_RAISE", "False") == "True"
+
+# профиль по требованию (?_profile=1 от staff, core.profiling): последние
+# PROFILE_CAPTURE_LIMIT профилей в PROFILE_CAPTURE_DIR, страница profiles/; 0 — выкл.
+PROFILE_CAPTURE_DIR = os.getenv("PROFILE_CAPTURE_DIR", str(BASE_DIR / "profiles"))
+PROFILE_CAPTURE_LIMIT = int(os.getenv("PROFILE_CAPTURE_LIMIT", "50"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,6 +190,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# материалы (MEDIA_ROOT/materials/) отдаются только через core.downloads после проверки доступа:
+# '' — сам Django (Range, ETag; для разработки), 'x-accel-redirect' — nginx
+# (location PROTECTED_MEDIA_INTERNAL_URL { internal; alias MEDIA_ROOT/; }),
+# 'x-sendfile' — Apache mod_xsendfile / lighttpd. Напрямую /media/materials/ и /media/exports/
+# (выгрузки с ПДн участников, см. export_download) фронт-сервер отдавать не должен.
+PROTECTED_MEDIA_SERVER = os.getenv("PROTECTED_MEDIA_SERVER", "")
+PROTECTED_MEDIA_INTERNAL_URL = os.getenv("PROTECTED_MEDIA_INTERNAL_URL", "/protected-media/")
+
+# загрузка материалов по частям (core.uploads): размер части и предел файла, байт;
+# брошенные загрузки удаляет manage.py sweep_material_uploads
+MATERIAL_UPLOAD_CHUNK_SIZE = int(os.getenv("MATERIAL_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+MATERIAL_UPLOAD_MAX_SIZE = int(os.getenv("MATERIAL_UPLOAD_MAX_SIZE", str(5 * 1024 ** 3)))
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv("EMAIL_HOST")
@@ -152,4 +212,12 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")  # не обычный пароль!
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Outbox (manage.py send_outbox): параллельных SMTP-соединений и лимит писем
+# в секунду на весь воркер (0 — без ограничения).
+EMAIL_CONNECTIONS = int(os.getenv("EMAIL_CONNECTIONS", "1"))
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", "0"))
+
+# Адрес сайта для ссылок в письмах, которые формируются вне запроса (рассылки)
+SITE_URL = os.getenv("SITE_URL", "http://localhost:8000")
+
 LOGOUT_REDIRECT_URL = '/'
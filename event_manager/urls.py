@@ -1,9 +1,19 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from django.views.static import serve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # MEDIA для разработки, кроме материалов и выгрузок: они отдаются только представлениями
+    # с проверкой доступа (core.downloads, export_download)
+    urlpatterns += [
+        re_path(r'^%s(?!materials/|exports/)(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+                serve, {'document_root': settings.MEDIA_ROOT}),
+    ]